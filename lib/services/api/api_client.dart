@@ -189,6 +189,14 @@ class ApiClient {
   }
 
 
+  // Sends several requests in one round trip through the server's /batch endpoint.
+  // Each entry has a 'method', a 'path' relative to the API base and an optional 'body'.
+  Future<List<Map<String, dynamic>>> batch(List<Map<String, dynamic>> requests) async {
+    final response = await post('/batch', data: {'requests': requests});
+    return List<Map<String, dynamic>>.from(response.data['responses']);
+  }
+
+
   Exception _handleError(DioException error) {
     String errorMessage = 'An error occurred while connecting to the server';
 
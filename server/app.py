@@ -1,11 +1,36 @@
 import os
 from flask import Flask, jsonify, request, make_response
 from flask_migrate import Migrate
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, create_refresh_token, get_jwt_identity
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, create_refresh_token, get_jwt_identity, get_jwt, decode_token
 from flask_bcrypt import Bcrypt
-from models import db, User, FamilyMember
+from models import db, User, FamilyMember, ImportJob, MemberRemoval
 from routes.document_routes import document_bp
+from routes.timeline_routes import timeline_bp
+from routes.batch_routes import batch_bp
+from routes.vitals_routes import vitals_bp
+from routes.export_routes import export_bp
+from routes.sync_routes import sync_bp
+from routes.stream_routes import stream_bp
+from routes.profiling_routes import profiling_bp
+from routes.file_routes import file_bp
 from config import config
+from utils.compression import Compression
+from utils.partitions import include_name, partitions_cli
+from utils.retention import vitals_cli
+from utils.idempotency import idempotent
+from utils.rate_limit import RateLimiter, rate_limit
+from utils.cache import cache, user_key, family_key
+from utils.startup import startup_cli
+from utils.replicas import ReadReplicas
+from utils.revocation import TokenRevocations, tokens_cli
+from utils.sharding import shard_router, shards_cli
+from utils.profiling import Profiling, profile_cli
+from utils.structured_logging import StructuredLogging, logs_cli
+from utils.document_uploads import uploads_cli
+from utils.storage import storage
+from utils.family_graph import family_graph
+from utils.member_removal import removals_cli, start_member_removal
+from utils.vitals_import import fail_stale_jobs
 import datetime
 import re
 
@@ -23,13 +48,40 @@ def create_app(config_name=None):
     app.config['AWS_REGION'] = os.environ.get('AWS_REGION') or 'us-east-1'
     app.config['S3_BUCKET_NAME'] = os.environ.get('S3_BUCKET_NAME') or 'your-health-app-bucket'
     
+    StructuredLogging(app)
     db.init_app(app)
-    migrate = Migrate(app, db)
+    migrate = Migrate(app, db, include_name=include_name)
     bcrypt = Bcrypt(app)
     jwt = JWTManager(app)
+    revocations = TokenRevocations(app, jwt)
+    Compression(app)
+    RateLimiter(app)
+    cache.init_app(app)
+    ReadReplicas(app)
+    shard_router.init_app(app)
+    Profiling(app)
+    storage.init_app(app)
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(vitals_cli)
+    app.cli.add_command(startup_cli)
+    app.cli.add_command(tokens_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(profile_cli)
+    app.cli.add_command(logs_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(removals_cli)
     
     # Register blueprints
     app.register_blueprint(document_bp, url_prefix='/api/v1/documents')
+    app.register_blueprint(timeline_bp, url_prefix='/api/v1/timeline')
+    app.register_blueprint(batch_bp, url_prefix='/api/v1/batch')
+    app.register_blueprint(vitals_bp, url_prefix='/api/v1/vitals')
+    app.register_blueprint(export_bp, url_prefix='/api/v1/export')
+    app.register_blueprint(sync_bp, url_prefix='/api/v1/sync')
+    app.register_blueprint(stream_bp, url_prefix='/api/v1/family')
+    app.register_blueprint(file_bp, url_prefix='/api/v1/files')
+    if app.config['PROFILING_ENABLED']:
+        app.register_blueprint(profiling_bp, url_prefix='/api/v1/admin')
     
     @app.route('/api')
     def index():
@@ -116,6 +168,7 @@ def create_app(config_name=None):
             return jsonify({"error": f"Failed to create user: {str(e)}"}), 500
     
     @app.route('/api/v1/auth/login', methods=['POST'])
+    @rate_limit('login', user_key=lambda: (request.get_json(silent=True) or {}).get('phone_number'))
     def login():
         data = request.get_json()
         
@@ -178,22 +231,44 @@ def create_app(config_name=None):
             "token_type": "Bearer"
         }), 200
     
+    @app.route('/api/v1/auth/logout', methods=['POST'])
+    @jwt_required(verify_type=False)
+    def logout():
+        """Revoke the presented token and the user's current refresh token"""
+        current_user_id = get_jwt_identity()
+        token = get_jwt()
+        revocations.revoke(token)
+        
+        user = User.query.get(current_user_id)
+        if user and user.refresh_token:
+            try:
+                refresh_token = decode_token(user.refresh_token, allow_expired=True)
+                if refresh_token['jti'] != token['jti']:
+                    revocations.revoke(refresh_token)
+            except Exception as e:
+                app.logger.error(f"Could not decode stored refresh token: {e}")
+            user.refresh_token = None
+        
+        db.session.commit()
+        
+        return jsonify({"message": "Logout successful"}), 200
+    
     @app.route('/api/v1/auth/me', methods=['GET'])
     @jwt_required()
     def get_user_profile():
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
         
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-        
-        # Format date of birth to ISO string if it exists
-        date_of_birth = None
-        if user.date_of_birth:
-            date_of_birth = user.date_of_birth.isoformat()
+        def load():
+            user = User.query.get(current_user_id)
+            if not user:
+                return None
             
-        return jsonify({
-            "user": {
+            # Format date of birth to ISO string if it exists
+            date_of_birth = None
+            if user.date_of_birth:
+                date_of_birth = user.date_of_birth.isoformat()
+            
+            return {
                 "id": user.id,
                 "full_name": user.full_name,
                 "phone_number": user.phone_number,
@@ -201,6 +276,13 @@ def create_app(config_name=None):
                 "username": user.username,
                 "date_of_birth": date_of_birth
             }
+        
+        user = cache.get_or_set(user_key(current_user_id), load)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+            
+        return jsonify({
+            "user": user
         }), 200
     
     
@@ -219,51 +301,58 @@ def create_app(config_name=None):
         """Get all family members for the current user"""
         current_user_id = get_jwt_identity()
         
-        # Get the current user first
-        current_user = User.query.get(current_user_id)
-        if not current_user:
-            return jsonify({"error": "User not found"}), 404
+        def load():
+            # Get the current user first
+            current_user = User.query.get(current_user_id)
+            if not current_user:
+                return None
             
-        # Format date of birth to ISO string if it exists
-        current_user_dob = None
-        if (current_user.date_of_birth):
-            current_user_dob = current_user.date_of_birth.isoformat()
-        
-        # Create a list with the current user as the first member
-        family_members = [{
-            "id": current_user.id,
-            "family_member_id": 0,  # Special value to identify as self
-            "full_name": current_user.full_name,
-            "phone_number": current_user.phone_number,
-            "email": current_user.email,
-            "relationship": "self",
-            "date_of_birth": current_user_dob,
-            "gender": current_user.gender,
-            "is_self": True
-        }]
-        
-        # Find all family relationships where the current user is the main user
-        family_relationships = FamilyMember.query.filter_by(user_id=current_user_id).all()
-        
-        for relationship in family_relationships:
-            member = User.query.get(relationship.member_id)
-            if member:
-                # Format date of birth to ISO string if it exists
-                date_of_birth = None
-                if member.date_of_birth:
-                    date_of_birth = member.date_of_birth.isoformat()
+            # Format date of birth to ISO string if it exists
+            current_user_dob = None
+            if (current_user.date_of_birth):
+                current_user_dob = current_user.date_of_birth.isoformat()
+        
+            # Create a list with the current user as the first member
+            family_members = [{
+                "id": current_user.id,
+                "family_member_id": 0,  # Special value to identify as self
+                "full_name": current_user.full_name,
+                "phone_number": current_user.phone_number,
+                "email": current_user.email,
+                "relationship": "self",
+                "date_of_birth": current_user_dob,
+                "gender": current_user.gender,
+                "is_self": True
+            }]
+        
+            # Find all family relationships where the current user is the main user
+            family_relationships = FamilyMember.query.filter_by(user_id=current_user_id).all()
+        
+            for relationship in family_relationships:
+                member = User.query.get(relationship.member_id)
+                if member:
+                    # Format date of birth to ISO string if it exists
+                    date_of_birth = None
+                    if member.date_of_birth:
+                        date_of_birth = member.date_of_birth.isoformat()
                 
-                family_members.append({
-                    "id": member.id,
-                    "family_member_id": relationship.id,
-                    "full_name": member.full_name,
-                    "phone_number": member.phone_number,
-                    "email": member.email,
-                    "relationship": relationship.relationship,
-                    "date_of_birth": date_of_birth,
-                    "gender": member.gender,
-                    "is_self": False
-                })
+                    family_members.append({
+                        "id": member.id,
+                        "family_member_id": relationship.id,
+                        "full_name": member.full_name,
+                        "phone_number": member.phone_number,
+                        "email": member.email,
+                        "relationship": relationship.relationship,
+                        "date_of_birth": date_of_birth,
+                        "gender": member.gender,
+                        "is_self": False
+                    })
+            return family_members
+        
+        # Cached per user; dropped when the user, a member profile or a relationship changes
+        family_members = cache.get_or_set(family_key(current_user_id), load)
+        if family_members is None:
+            return jsonify({"error": "User not found"}), 404
         
         return jsonify({
             "family_members": family_members
@@ -271,6 +360,7 @@ def create_app(config_name=None):
     
     @app.route('/api/v1/family', methods=['POST'])
     @jwt_required()
+    @idempotent
     def add_family_member():
         """Add a new family member for the current user"""
         current_user_id = get_jwt_identity()
@@ -482,7 +572,13 @@ def create_app(config_name=None):
     @app.route('/api/v1/family/<int:family_member_id>', methods=['DELETE'])
     @jwt_required()
     def remove_family_member(family_member_id):
-        """Remove a family member relationship"""
+        """
+        Start removing a family member relationship and the member's data
+
+        Documents are deleted, or moved to the family member given as
+        ?reassign_documents_to=ID; vitals are always deleted. The work runs in
+        the background in small batches; poll the returned removal for progress.
+        """
         current_user_id = get_jwt_identity()
         
         # Find the family relationship
@@ -493,20 +589,89 @@ def create_app(config_name=None):
         
         if not relationship:
             return jsonify({"error": "Family member not found"}), 404
+
+        reassign_to = request.args.get('reassign_documents_to', type=int)
+        if reassign_to is not None and (reassign_to == family_member_id
+                                        or not family_graph.owns(current_user_id, reassign_to)):
+            return jsonify({"error": "Invalid or unauthorized family member"}), 403
         
         try:
-            db.session.delete(relationship)
+            removal = MemberRemoval.query.filter(
+                MemberRemoval.user_id == current_user_id,
+                MemberRemoval.family_member_id == family_member_id,
+                MemberRemoval.status.in_(('pending', 'running'))
+            ).first()
+            if removal:
+                return jsonify({"message": "Family member removal already in progress", "removal_id": removal.id}), 202
+
+            # A job its worker abandoned would otherwise block removal forever
+            fail_stale_jobs(user_id=current_user_id, family_member_id=family_member_id)
+            importing = ImportJob.query.filter(
+                ImportJob.user_id == current_user_id,
+                ImportJob.family_member_id == family_member_id,
+                ImportJob.status.in_(('pending', 'running'))
+            ).first()
+            if importing:
+                return jsonify({"error": "A vitals import is still running for this family member"}), 409
+
+            removal = MemberRemoval(
+                user_id=current_user_id,
+                family_member_id=family_member_id,
+                reassign_documents_to=reassign_to,
+                status='pending'
+            )
+            db.session.add(removal)
             db.session.commit()
-            return jsonify({"message": "Family member removed successfully"}), 200
+
+            start_member_removal(removal)
+
+            return jsonify({"message": "Family member removal started", "removal_id": removal.id}), 202
             
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": f"Failed to remove family member: {str(e)}"}), 500
+
+    @app.route('/api/v1/family/removals/<int:removal_id>', methods=['GET'])
+    @jwt_required()
+    def get_family_member_removal(removal_id):
+        """Get the progress of a family member removal"""
+        current_user_id = get_jwt_identity()
+
+        removal = MemberRemoval.query.filter_by(id=removal_id, user_id=current_user_id).first()
+        if not removal:
+            return jsonify({"error": "Removal not found"}), 404
+
+        total = (removal.documents_total or 0) + (removal.health_data_total or 0)
+        done = (removal.documents_done or 0) + (removal.health_data_done or 0)
+        progress = 100.0 if removal.status == 'completed' else (round(min(done, total) * 100 / total, 1) if total else None)
+
+        return jsonify({
+            "id": removal.id,
+            "family_member_id": removal.family_member_id,
+            "status": removal.status,
+            "progress": progress,
+            "documents_total": removal.documents_total,
+            "documents_done": removal.documents_done,
+            "documents_reassigned_to": removal.reassign_documents_to,
+            "health_data_total": removal.health_data_total,
+            "health_data_done": removal.health_data_done,
+            "files_deleted": removal.files_deleted,
+            "files_failed": removal.files_failed,
+            "error": removal.error
+        }), 200
     
     return app
 
 
-app = create_app()
+def __getattr__(name):
+    # `app` is built on first access (flask run, gunicorn app:app) rather than at
+    # import, so importing create_app does not also build a throwaway application
+    if name == 'app':
+        application = globals()['app'] = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    app = create_app()
+    app.run(host='0.0.0.0', port=8000, debug=True)
@@ -12,6 +12,118 @@ class Config:
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
+    # Batch endpoint limits
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+    # Response compression
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 5))
+    # Monthly health_data partitions to keep created ahead of the current month
+    HEALTH_DATA_PARTITION_MONTHS_AHEAD = int(os.environ.get('HEALTH_DATA_PARTITION_MONTHS_AHEAD', 3))
+    # Raw vitals older than this are moved to storage by `flask vitals archive`
+    VITALS_RETENTION_DAYS = int(os.environ.get('VITALS_RETENTION_DAYS', 180))
+    VITALS_ARCHIVE_PREFIX = os.environ.get('VITALS_ARCHIVE_PREFIX', 'archive/health_data')
+    # Full-record export
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    EXPORT_S3_CONCURRENCY = int(os.environ.get('EXPORT_S3_CONCURRENCY', 4))
+    # Historical vitals import
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+    IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR')  # None means the system temp dir
+    # An unfinished import whose progress has not moved for this long is failed as abandoned
+    IMPORT_STALE_AFTER = int(os.environ.get('IMPORT_STALE_AFTER', 900))
+    # Upper bound on any request body, vitals imports included; Werkzeug answers 413 past it
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 2 * 1024 ** 3))
+    # Where new documents and archives are stored: s3, or local for on-prem and development.
+    # Existing files keep being read from the backend their path names.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')
+    LOCAL_STORAGE_ROOT = os.environ.get('LOCAL_STORAGE_ROOT')  # None means <instance path>/storage
+    # nginx internal location aliased to LOCAL_STORAGE_ROOT; when set, downloads are handed off with X-Accel-Redirect
+    LOCAL_STORAGE_ACCEL_PREFIX = os.environ.get('LOCAL_STORAGE_ACCEL_PREFIX')
+    # Document size limit and storage quotas, checked before upload bodies are read
+    DOCUMENT_MAX_SIZE = int(os.environ.get('DOCUMENT_MAX_SIZE', 50 * 1024 ** 2))
+    STORAGE_QUOTA_USER_BYTES = int(os.environ.get('STORAGE_QUOTA_USER_BYTES', 5 * 1024 ** 3))
+    STORAGE_QUOTA_MEMBER_BYTES = int(os.environ.get('STORAGE_QUOTA_MEMBER_BYTES', 2 * 1024 ** 3))
+    STORAGE_QUOTA_MEMBER_DOCUMENTS = int(os.environ.get('STORAGE_QUOTA_MEMBER_DOCUMENTS', 2000))
+    # Direct-to-S3 multipart uploads: S3 wants parts of 5 MiB to 5 GiB, at most 10000 of them
+    MULTIPART_PART_SIZE = int(os.environ.get('MULTIPART_PART_SIZE', 8 * 1024 ** 2))
+    MULTIPART_URL_BATCH = int(os.environ.get('MULTIPART_URL_BATCH', 20))
+    MULTIPART_URL_EXPIRY = int(os.environ.get('MULTIPART_URL_EXPIRY', 3600))
+    # `flask uploads sweep` aborts uploads left unfinished this long
+    MULTIPART_UPLOAD_EXPIRY_HOURS = int(os.environ.get('MULTIPART_UPLOAD_EXPIRY_HOURS', 24))
+
+    # Family member removal deletes dependent rows this many at a time, pausing between batches
+    MEMBER_REMOVAL_BATCH_SIZE = int(os.environ.get('MEMBER_REMOVAL_BATCH_SIZE', 1000))
+    MEMBER_REMOVAL_BATCH_PAUSE = float(os.environ.get('MEMBER_REMOVAL_BATCH_PAUSE', 0.05))
+
+    # Idempotency-Key replay window for upload and create endpoints, kept in the shared cache
+    IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+    # An attempt whose worker died stops holding its key after this long
+    IDEMPOTENCY_LOCK_TTL = int(os.environ.get('IDEMPOTENCY_LOCK_TTL', 300))
+    IDEMPOTENCY_WAIT_TIMEOUT = int(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 60))
+
+    # Rate limiting: token buckets as "count/period" and concurrent request caps per endpoint.
+    # memory:// keeps state per worker process, a redis:// URL shares it between workers
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+    RATELIMITS = {
+        'login': {'per_user': '5/minute', 'per_ip': '20/minute', 'concurrency': 8},
+        'upload': {'per_user': '30/minute', 'per_ip': '60/minute', 'concurrency': 16},
+        'family_documents': {'per_user': '60/minute', 'per_ip': '120/minute', 'concurrency': 16},
+    }
+
+    # Shared cache: memory:// is per worker process, a redis:// URL is shared by all workers
+    CACHE_URL = os.environ.get('CACHE_URL', 'memory://')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    # Presigned document URLs are valid for an hour; reuse them for less than that
+    PRESIGNED_URL_CACHE_TTL = int(os.environ.get('PRESIGNED_URL_CACHE_TTL', 3000))
+    # Household graph entries; with a memory:// cache this bounds how long other workers see stale edges
+    FAMILY_GRAPH_CACHE_TTL = int(os.environ.get('FAMILY_GRAPH_CACHE_TTL', 60))
+    # Computed vitals analytics; new samples retire them sooner
+    ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 300))
+
+    # `flask startup check` fails when importing the app and create_app() take longer than this
+    STARTUP_BUDGET_MS = int(os.environ.get('STARTUP_BUDGET_MS', 1500))
+
+    # Read replicas for GET requests, as comma separated URIs; none means the primary serves everything
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    REPLICA_HEALTH_CHECK_INTERVAL = int(os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 10))
+    REPLICA_RETRY_AFTER = int(os.environ.get('REPLICA_RETRY_AFTER', 30))
+    # After a commit, the user's reads stay on the primary this long to cover replication lag
+    READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+
+    # Server-sent vitals streams; run gunicorn with `-k gevent` to hold many idle streams per worker
+    VITALS_STREAM_HEARTBEAT = int(os.environ.get('VITALS_STREAM_HEARTBEAT', 15))
+    VITALS_STREAM_POLL_INTERVAL = float(os.environ.get('VITALS_STREAM_POLL_INTERVAL', 1.0))
+    VITALS_STREAM_QUEUE_SIZE = int(os.environ.get('VITALS_STREAM_QUEUE_SIZE', 256))
+    VITALS_STREAM_REPLAY_LIMIT = int(os.environ.get('VITALS_STREAM_REPLAY_LIMIT', 1000))
+
+    # Token revocation: each worker re-reads revoked_tokens into its Bloom filter this often
+    REVOCATION_SYNC_INTERVAL = int(os.environ.get('REVOCATION_SYNC_INTERVAL', 5))
+    REVOCATION_REBUILD_INTERVAL = int(os.environ.get('REVOCATION_REBUILD_INTERVAL', 3600))
+    REVOCATION_FILTER_CAPACITY = int(os.environ.get('REVOCATION_FILTER_CAPACITY', 100000))
+
+    # health_data shards, one database URL each; households are placed on them through the shard_map table
+    HEALTH_DATA_SHARD_URLS = [url for url in os.environ.get('HEALTH_DATA_SHARD_URLS', '').split(',') if url]
+    SQLALCHEMY_BINDS = {f'health_shard_{index}': url for index, url in enumerate(HEALTH_DATA_SHARD_URLS)}
+    HEALTH_DATA_SHARDS = list(SQLALCHEMY_BINDS)
+    SHARD_MAP_CACHE_TTL = int(os.environ.get('SHARD_MAP_CACHE_TTL', 30))
+    SHARD_MOVE_BATCH_SIZE = int(os.environ.get('SHARD_MOVE_BATCH_SIZE', 5000))
+
+    # On-demand profiling; off means no middleware and no admin endpoint at all
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_SECRET_KEY = os.environ.get('PROFILING_SECRET_KEY')
+    PROFILING_MAX_SECONDS = int(os.environ.get('PROFILING_MAX_SECONDS', 60))
+    PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL', 0.01))
+
+    # Logging: JSON lines on stdout, written by a background thread
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_JSON = os.environ.get('LOG_JSON', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # Share of DEBUG records kept; call sites can pass extra={'sample_rate': ...}
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1))
+    LOG_REQUESTS = os.environ.get('LOG_REQUESTS', 'true').lower() == 'true'
 
 class DevelopmentConfig(Config):
     """Development configuration."""
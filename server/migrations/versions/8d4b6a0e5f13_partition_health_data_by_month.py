@@ -0,0 +1,100 @@
+"""Partition health_data by month on timestamp (PostgreSQL)
+
+Revision ID: 8d4b6a0e5f13
+Revises: 3c9e1f7a2b64
+Create Date: 2026-10-19 11:40:27.503318
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b6a0e5f13'
+down_revision = '3c9e1f7a2b64'
+branch_labels = None
+depends_on = None
+
+# Months of partitions created beyond the current one; `flask partitions ensure` keeps this topped up
+MONTHS_AHEAD = 3
+
+COLUMNS = 'id, user_id, family_member_id, data_type, value, unit, timestamp, source, created_at'
+
+
+def _add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    # SQLite has no declarative partitioning; health_data stays a single table there
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('ALTER TABLE health_data RENAME TO health_data_unpartitioned')
+    op.execute('ALTER TABLE health_data_unpartitioned RENAME CONSTRAINT health_data_pkey TO health_data_unpartitioned_pkey')
+    op.execute('ALTER INDEX ix_health_data_user_member_timestamp RENAME TO ix_health_data_unpartitioned_user_member_timestamp')
+
+    # The partition key has to be part of the primary key
+    op.execute("""
+        CREATE TABLE health_data (
+            id INTEGER NOT NULL DEFAULT nextval('health_data_id_seq'::regclass),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            family_member_id INTEGER REFERENCES family_members (id),
+            data_type VARCHAR(50) NOT NULL,
+            value DOUBLE PRECISION NOT NULL,
+            unit VARCHAR(20),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            source VARCHAR(100),
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT health_data_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute('ALTER SEQUENCE health_data_id_seq OWNED BY health_data.id')
+    op.execute('CREATE INDEX ix_health_data_user_member_timestamp ON health_data (user_id, family_member_id, timestamp)')
+    op.execute('CREATE TABLE health_data_default PARTITION OF health_data DEFAULT')
+
+    oldest = op.get_bind().execute(sa.text('SELECT min(timestamp) FROM health_data_unpartitioned')).scalar()
+    now = datetime.utcnow()
+    start = datetime((oldest or now).year, (oldest or now).month, 1)
+    last = _add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    while start <= last:
+        end = _add_months(start, 1)
+        op.execute(
+            f'CREATE TABLE health_data_y{start.year:04d}m{start.month:02d} PARTITION OF health_data '
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+        start = end
+
+    op.execute(f'INSERT INTO health_data ({COLUMNS}) SELECT {COLUMNS} FROM health_data_unpartitioned')
+    op.execute('DROP TABLE health_data_unpartitioned')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('ALTER TABLE health_data RENAME TO health_data_partitioned')
+    op.execute('ALTER TABLE health_data_partitioned RENAME CONSTRAINT health_data_pkey TO health_data_partitioned_pkey')
+    op.execute('ALTER INDEX ix_health_data_user_member_timestamp RENAME TO ix_health_data_partitioned_user_member_timestamp')
+
+    op.execute("""
+        CREATE TABLE health_data (
+            id INTEGER NOT NULL DEFAULT nextval('health_data_id_seq'::regclass),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            family_member_id INTEGER REFERENCES family_members (id),
+            data_type VARCHAR(50) NOT NULL,
+            value DOUBLE PRECISION NOT NULL,
+            unit VARCHAR(20),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            source VARCHAR(100),
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            CONSTRAINT health_data_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute('ALTER SEQUENCE health_data_id_seq OWNED BY health_data.id')
+    op.execute('CREATE INDEX ix_health_data_user_member_timestamp ON health_data (user_id, family_member_id, timestamp)')
+    op.execute(f'INSERT INTO health_data ({COLUMNS}) SELECT {COLUMNS} FROM health_data_partitioned')
+    # Dropping the parent drops every attached partition with it
+    op.execute('DROP TABLE health_data_partitioned')
@@ -5,8 +5,10 @@ import bcrypt
 import jwt
 import os
 from flask import current_app
+from utils.replicas import RoutingSession
 
-db = SQLAlchemy()
+# GET requests may read from a replica, see utils/replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     """User model for storing user account data"""
@@ -21,6 +23,8 @@ class User(db.Model):
     date_of_birth = db.Column(db.Date, nullable=True)
     gender = db.Column(db.String(20), nullable=True)  # Added gender column
     refresh_token = db.Column(db.String(500), nullable=True)
+    # Last sequence number handed out in this user's sync change log
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=func.now())
     updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
@@ -103,7 +107,7 @@ class HealthData(db.Model):
     """Model for storing health data from Google Health Connect API"""
     __tablename__ = 'health_data'
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     family_member_id = db.Column(db.Integer, db.ForeignKey('family_members.id'), nullable=True)
     data_type = db.Column(db.String(50), nullable=False)  
@@ -117,6 +121,13 @@ class HealthData(db.Model):
     user = db.relationship('User', backref=db.backref('health_data', lazy='dynamic'))
     family_member = db.relationship('FamilyMember', backref=db.backref('health_data', lazy='dynamic'))
 
+    # On PostgreSQL this table is range partitioned by month on timestamp (see
+    # utils/partitions.py), so time-bounded queries should always filter on timestamp
+    __table_args__ = (
+        # Per-member, newest-first range scans (timeline, vitals series)
+        db.Index('ix_health_data_user_member_timestamp', 'user_id', 'family_member_id', 'timestamp'),
+    )
+
     def __repr__(self):
         return f'<HealthData {self.data_type}: {self.value}{self.unit}>'
 
@@ -163,6 +174,196 @@ class MedicalDocument(db.Model):
     # Relationships
     user = db.relationship('User', back_populates='documents')
     family_member = db.relationship('FamilyMember', back_populates='documents')
+
+    __table_args__ = (
+        db.Index('ix_medical_documents_user_member_date', 'user_id', 'family_member_id', 'document_date'),
+    )
     
     def __repr__(self):
-        return f'<MedicalDocument {self.document_name} ({self.document_type})>'
\ No newline at end of file
+        return f'<MedicalDocument {self.document_name} ({self.document_type})>'
+
+class HealthDataArchive(db.Model):
+    """Model for one member-month of raw HealthData moved to cold storage"""
+    __tablename__ = 'health_data_archives'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    family_member_id = db.Column(db.Integer, db.ForeignKey('family_members.id'), nullable=True)
+    period_start = db.Column(db.Date, nullable=False)  # First day of the archived month
+    file_path = db.Column(db.String(500), nullable=False)  # S3 path
+    row_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'family_member_id', 'period_start', name='unique_health_data_archive'),
+    )
+
+    def __repr__(self):
+        return f'<HealthDataArchive {self.user_id}/{self.family_member_id} {self.period_start}>'
+
+
+class HealthDataRollup(db.Model):
+    """Model for daily HealthData aggregates kept after raw samples are archived"""
+    __tablename__ = 'health_data_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    family_member_id = db.Column(db.Integer, db.ForeignKey('family_members.id'), nullable=True)
+    data_type = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    minimum = db.Column(db.Float, nullable=False)
+    maximum = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_health_data_rollups_member_type_day', 'user_id', 'family_member_id', 'data_type', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<HealthDataRollup {self.data_type} {self.day}>'
+
+
+class ImportJob(db.Model):
+    """Model for tracking background imports of historical health data"""
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    family_member_id = db.Column(db.Integer, db.ForeignKey('family_members.id'), nullable=True)
+    source_format = db.Column(db.String(20), nullable=False)  # apple_health, csv
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    bytes_total = db.Column(db.BigInteger, nullable=True)
+    bytes_read = db.Column(db.BigInteger, default=0)
+    records_imported = db.Column(db.Integer, default=0)
+    records_skipped = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=func.now())
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+
+class ChangeLogEntry(db.Model):
+    """Model for the per-user change log behind delta sync"""
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    seq = db.Column(db.BigInteger, nullable=False)  # Increases by one per change within a user's log
+    entity = db.Column(db.String(30), nullable=False)  # user, family_member, document, health_data, import_job
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # upsert, delete
+    created_at = db.Column(db.DateTime, default=func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'seq', name='unique_change_log_user_seq'),
+    )
+
+    def __repr__(self):
+        return f'<ChangeLogEntry {self.user_id}:{self.seq} {self.operation} {self.entity} {self.entity_id}>'
+
+
+class RevokedToken(db.Model):
+    """Model for JWTs revoked before they expire (logout, stolen tokens)"""
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    token_type = db.Column(db.String(10), nullable=False)  # access, refresh
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)  # Rows can be pruned after this
+    created_at = db.Column(db.DateTime, default=func.now())
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+
+class ShardAssignment(db.Model):
+    """Model for the shard holding a household's health data"""
+    __tablename__ = 'shard_map'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)  # Household owner
+    shard = db.Column(db.String(50), nullable=False)  # Bind key, or 'primary'
+    moving_to = db.Column(db.String(50), nullable=True)  # Set while `flask shards move` works on the household
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f'<ShardAssignment {self.user_id}: {self.shard}>'
+
+
+class StorageUsage(db.Model):
+    """Model for running document totals per family member, kept up to date on every flush"""
+    __tablename__ = 'storage_usage'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    family_member_id = db.Column(db.Integer, db.ForeignKey('family_members.id', ondelete='CASCADE'), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f'<StorageUsage {self.user_id}/{self.family_member_id}: {self.total_bytes} bytes>'
+
+
+class DocumentUpload(db.Model):
+    """Model for tracking direct-to-S3 multipart document uploads"""
+    __tablename__ = 'document_uploads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    family_member_id = db.Column(db.Integer, db.ForeignKey('family_members.id', ondelete='CASCADE'), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)  # S3 path the parts are assembled into
+    upload_id = db.Column(db.String(1024), nullable=False)  # S3 UploadId
+    content_type = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)  # Declared when the upload starts
+    part_size = db.Column(db.Integer, nullable=False)  # Every part but the last has exactly this size
+    status = db.Column(db.String(20), nullable=False, default='uploading')  # uploading, completed, aborted
+    document_id = db.Column(db.Integer, db.ForeignKey('medical_documents.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=func.now())
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        db.Index('ix_document_uploads_status_created', 'status', 'created_at'),
+    )
+
+    @property
+    def part_count(self):
+        return -(-self.file_size // self.part_size)
+
+    def part_length(self, part_number):
+        """Size in bytes of a part, counting from 1"""
+        if part_number < self.part_count:
+            return self.part_size
+        return self.file_size - self.part_size * (self.part_count - 1)
+
+    def __repr__(self):
+        return f'<DocumentUpload {self.id} {self.status}>'
+
+
+class MemberRemoval(db.Model):
+    """Model for tracking the background removal of a family member and their data"""
+    __tablename__ = 'member_removals'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    family_member_id = db.Column(db.Integer, nullable=False)  # No foreign key: the row outlives the member
+    reassign_documents_to = db.Column(db.Integer, nullable=True)  # FamilyMember ID, or None to delete them
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    documents_total = db.Column(db.Integer, default=0)
+    documents_done = db.Column(db.Integer, default=0)
+    health_data_total = db.Column(db.BigInteger, default=0)
+    health_data_done = db.Column(db.BigInteger, default=0)
+    files_deleted = db.Column(db.Integer, default=0)
+    files_failed = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=func.now())
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        db.Index('ix_member_removals_user_member', 'user_id', 'family_member_id'),
+    )
+
+    def __repr__(self):
+        return f'<MemberRemoval {self.id} {self.status}>'
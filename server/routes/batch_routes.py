@@ -0,0 +1,118 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from utils.structured_logging import REQUEST_ID_HEADER, current_request_id
+from werkzeug.test import EnvironBuilder
+from concurrent.futures import ThreadPoolExecutor
+
+batch_bp = Blueprint('batch_routes', __name__)
+
+API_PREFIX = '/api/v1'
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+
+# Headers copied from the batch request onto every sub-request
+FORWARDED_HEADERS = ('Authorization', 'Accept-Language', 'User-Agent')
+
+
+def _build_environ(sub_request, headers):
+    """Build a WSGI environ for one sub-request of the batch"""
+    path = sub_request['path']
+    if not path.startswith('/api'):
+        # Paths may be given relative to the API base, like the mobile client uses them
+        path = API_PREFIX + path
+
+    builder = EnvironBuilder(
+        path=path,
+        method=sub_request['method'],
+        json=sub_request.get('body'),
+        headers=headers
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _dispatch(app, environ):
+    """Run one sub-request through the normal Flask dispatch and collect its result"""
+    try:
+        with app.request_context(environ):
+            response = app.full_dispatch_request()
+            # Read the body while the context is live, streamed responses depend on it
+            body = response.get_json(silent=True)
+            if body is None and response.status_code != 204:
+                body = response.get_data(as_text=True)
+            return {'status': response.status_code, 'body': body}
+    except Exception as e:
+        app.logger.error(f"Error in batch sub-request {environ.get('PATH_INFO')}: {e}")
+        return {'status': 500, 'body': {'error': 'Server error'}}
+
+
+def _dispatch_isolated(app, environ):
+    """Dispatch a sub-request on a worker thread with its own app context and DB session"""
+    with app.app_context():
+        return _dispatch(app, environ)
+
+
+@batch_bp.route('', methods=['POST'])
+@jwt_required()
+def run_batch():
+    """Run several API requests in a single round trip"""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('requests'), list):
+        return jsonify({'error': 'Expected a list of requests'}), 400
+
+    sub_requests = data['requests']
+    max_requests = current_app.config['BATCH_MAX_REQUESTS']
+    if not sub_requests:
+        return jsonify({'error': 'No requests provided'}), 400
+    if len(sub_requests) > max_requests:
+        return jsonify({'error': f'A batch may contain at most {max_requests} requests'}), 400
+
+    for index, sub_request in enumerate(sub_requests):
+        if not isinstance(sub_request, dict) or not sub_request.get('path'):
+            return jsonify({'error': f'Request {index} is missing a path'}), 400
+        sub_request['method'] = str(sub_request.get('method', 'GET')).upper()
+        if sub_request['method'] not in ALLOWED_METHODS:
+            return jsonify({'error': f"Request {index} has unsupported method {sub_request['method']}"}), 400
+        if sub_request['path'].split('?', 1)[0].rstrip('/').endswith('/batch'):
+            return jsonify({'error': 'Batches cannot be nested'}), 400
+
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    # Sub-requests log under the batch's correlation ID
+    if current_request_id():
+        headers[REQUEST_ID_HEADER] = current_request_id()
+    environs = [_build_environ(sub_request, headers) for sub_request in sub_requests]
+
+    app = current_app._get_current_object()
+    max_workers = current_app.config['BATCH_MAX_WORKERS']
+    results = [None] * len(sub_requests)
+
+    # Consecutive GETs are independent reads and run concurrently, each on its own
+    # session. Writes act as barriers and run in order on this request's session,
+    # so a later read in the batch always observes an earlier write.
+    index = 0
+    while index < len(sub_requests):
+        if sub_requests[index]['method'] != 'GET':
+            results[index] = _dispatch(app, environs[index])
+            index += 1
+            continue
+
+        end = index
+        while end < len(sub_requests) and sub_requests[end]['method'] == 'GET':
+            end += 1
+
+        if end - index == 1 or max_workers <= 1:
+            for position in range(index, end):
+                results[position] = _dispatch(app, environs[position])
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, end - index)) as executor:
+                futures = [executor.submit(_dispatch_isolated, app, environs[position])
+                           for position in range(index, end)]
+                for position, future in zip(range(index, end), futures):
+                    results[position] = future.result()
+        index = end
+
+    return jsonify({
+        'responses': results,
+        'count': len(results)
+    }), 200
@@ -1,14 +1,26 @@
 from flask import Blueprint, request, jsonify, current_app
-from models import db, MedicalDocument, User, FamilyMember
+from models import db, MedicalDocument, User, DocumentUpload
 from utils.s3_utils import S3Utils
+from utils.idempotency import idempotent
+from utils.rate_limit import rate_limit
+from utils.family_graph import family_graph
+from utils.cache import cache, presigned_key
+from utils.storage import storage, requires_s3
+from utils.storage_quota import admit_upload, quota_error, usage_for
+from utils.document_uploads import part_size_for, part_urls, missing_parts, describe, stored_size, is_gone
 from datetime import datetime
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.utils import secure_filename
 import os
+import uuid
 
 document_bp = Blueprint('document_routes', __name__)
 
 @document_bp.route('/upload', methods=['POST'])
 @jwt_required()
+@rate_limit('upload')
+@admit_upload
+@idempotent
 def upload_document():
     """Upload a medical document"""
     try:
@@ -35,12 +47,7 @@ def upload_document():
             return jsonify({'error': 'Missing required document information'}), 400
         
         # Validate that the family member belongs to the current user
-        family_member = FamilyMember.query.filter_by(
-            id=family_member_id, 
-            user_id=current_user_id
-        ).first()
-        
-        if not family_member:
+        if not family_graph.owns(current_user_id, family_member_id):
             return jsonify({'error': 'Invalid or unauthorized family member'}), 403
         
         # Convert date string to Date object
@@ -54,8 +61,15 @@ def upload_document():
         file_size = file.tell()
         file.seek(0) # Reset file pointer for upload
 
-        # Upload file to S3
-        success, file_path = S3Utils.upload_file(
+        max_size = current_app.config['DOCUMENT_MAX_SIZE']
+        if file_size > max_size:
+            return jsonify({'error': f'Documents may be at most {max_size} bytes'}), 413
+        error = quota_error(current_user_id, family_member_id, file_size)
+        if error:
+            return jsonify({'error': error}), 413
+
+        # Upload file to the configured storage backend
+        success, file_path = storage.upload_file(
             file, 
             current_user_id, 
             family_member_id, 
@@ -94,6 +108,7 @@ def upload_document():
 
 @document_bp.route('/family/<int:family_member_id>/documents', methods=['GET'])
 @jwt_required()
+@rate_limit('family_documents')
 def get_family_member_documents(family_member_id):
     """Get all documents for a specific family member"""
     try:
@@ -101,12 +116,7 @@ def get_family_member_documents(family_member_id):
         current_user_id = get_jwt_identity()
         
         # Validate that the family member belongs to the current user
-        family_member = FamilyMember.query.filter_by(
-            id=family_member_id, 
-            user_id=current_user_id
-        ).first()
-        
-        if not family_member:
+        if not family_graph.owns(current_user_id, family_member_id):
             return jsonify({'error': 'Invalid or unauthorized family member'}), 403
         
         # Query all documents for this family member
@@ -119,7 +129,11 @@ def get_family_member_documents(family_member_id):
         documents_list = []
         for doc in documents:
             # Generate a temporary URL for the document
-            document_url = S3Utils.generate_presigned_url(doc.file_path, expiration=3600)
+            document_url = cache.get_or_set(
+                presigned_key(doc.file_path),
+                lambda: storage.generate_presigned_url(doc.file_path, expiration=3600),
+                ttl=current_app.config['PRESIGNED_URL_CACHE_TTL']
+            )
             
             documents_list.append({
                 'id': doc.id,
@@ -161,7 +175,7 @@ def get_document(document_id):
             return jsonify({'error': 'Document not found or unauthorized'}), 404
         
         # Generate a temporary URL for the document
-        document_url = S3Utils.generate_presigned_url(document.file_path)
+        document_url = storage.generate_presigned_url(document.file_path)
         
         # Return document details
         return jsonify({
@@ -210,6 +224,7 @@ def delete_document(document_id):
 
 @document_bp.route('/request_upload_url', methods=['POST'])
 @jwt_required()
+@requires_s3
 def request_upload_url():
     """Request a presigned URL for direct S3 upload"""
     try:
@@ -225,19 +240,24 @@ def request_upload_url():
         document_type = data.get('document_type')
         family_member_id = data.get('family_member_id')
         content_type = data.get('content_type', 'application/octet-stream')
+        file_size = data.get('file_size')
         
         # Validate required fields
-        if not all([file_name, document_type, family_member_id]):
+        if not all([file_name, document_type, family_member_id, file_size]):
             return jsonify({'error': 'Missing required document information'}), 400
+        if not isinstance(file_size, int) or file_size < 1:
+            return jsonify({'error': 'file_size must be a positive number of bytes'}), 400
             
         # Validate that the family member belongs to the current user
-        family_member = FamilyMember.query.filter_by(
-            id=family_member_id, 
-            user_id=current_user_id
-        ).first()
-        
-        if not family_member:
+        if not family_graph.owns(current_user_id, family_member_id):
             return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+        max_size = current_app.config['DOCUMENT_MAX_SIZE']
+        if file_size > max_size:
+            return jsonify({'error': f'Documents may be at most {max_size} bytes'}), 413
+        error = quota_error(current_user_id, family_member_id, file_size)
+        if error:
+            return jsonify({'error': error}), 413
             
         # Create a unique filename using UUID
         import uuid
@@ -255,20 +275,23 @@ def request_upload_url():
         s3_client = S3Utils.get_s3_client()
         bucket_name = current_app.config['S3_BUCKET_NAME']
         
-        # Generate a presigned URL for a PUT operation
+        # Generate a presigned URL for a PUT operation; the signed Content-Length
+        # makes S3 refuse a body of any other size than the one admitted above
         presigned_url = s3_client.generate_presigned_url(
             'put_object',
             Params={
                 'Bucket': bucket_name,
                 'Key': s3_key,
-                'ContentType': content_type
+                'ContentType': content_type,
+                'ContentLength': file_size
             },
             ExpiresIn=3600  # URL valid for 1 hour
         )
         
         return jsonify({
             'presigned_url': presigned_url,
-            's3_key': f"s3://{bucket_name}/{s3_key}"  # Full S3 path for reference
+            's3_key': f"s3://{bucket_name}/{s3_key}",  # Full S3 path for reference
+            'file_size': file_size
         }), 200
         
     except Exception as e:
@@ -278,6 +301,8 @@ def request_upload_url():
 
 @document_bp.route('/complete_upload', methods=['POST'])
 @jwt_required()
+@requires_s3
+@idempotent
 def complete_upload():
     """Complete the document upload process after direct S3 upload"""
     try:
@@ -301,12 +326,7 @@ def complete_upload():
             return jsonify({'error': 'Missing required document information'}), 400
             
         # Validate that the family member belongs to the current user
-        family_member = FamilyMember.query.filter_by(
-            id=family_member_id, 
-            user_id=current_user_id
-        ).first()
-        
-        if not family_member:
+        if not family_graph.owns(current_user_id, family_member_id):
             return jsonify({'error': 'Invalid or unauthorized family member'}), 403
             
         # Convert date string to Date object
@@ -331,6 +351,11 @@ def complete_upload():
                 file_size = 0
         else:
             return jsonify({'error': 'Invalid S3 key format'}), 400
+
+        # Checked again with the stored size, as usage may have grown since the URL was issued
+        error = quota_error(current_user_id, family_member_id, file_size)
+        if error:
+            return jsonify({'error': error}), 413
             
         # Create new document record
         new_document = MedicalDocument(
@@ -357,4 +382,275 @@ def complete_upload():
     except Exception as e:
         current_app.logger.error(f"Error registering document: {e}")
         db.session.rollback()  # Roll back in case of error
-        return jsonify({'error': f'Error registering document: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Error registering document: {str(e)}'}), 500
+
+@document_bp.route('/multipart', methods=['POST'])
+@jwt_required()
+@requires_s3
+@rate_limit('upload')
+def start_multipart_upload():
+    """Start a direct-to-S3 multipart upload and return presigned URLs for the first parts"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        data = request.json
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        file_name = data.get('file_name')
+        document_type = data.get('document_type')
+        family_member_id = data.get('family_member_id')
+        content_type = data.get('content_type', 'application/octet-stream')
+        file_size = data.get('file_size')
+
+        if not all([file_name, document_type, family_member_id, file_size]):
+            return jsonify({'error': 'Missing required document information'}), 400
+        if not isinstance(file_size, int) or file_size < 1:
+            return jsonify({'error': 'file_size must be a positive number of bytes'}), 400
+
+        if not family_graph.owns(current_user_id, family_member_id):
+            return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+        max_size = current_app.config['DOCUMENT_MAX_SIZE']
+        if file_size > max_size:
+            return jsonify({'error': f'Documents may be at most {max_size} bytes'}), 413
+        error = quota_error(current_user_id, family_member_id, file_size)
+        if error:
+            return jsonify({'error': error}), 413
+
+        original_filename = secure_filename(file_name)
+        file_extension = os.path.splitext(original_filename)[1]
+        doc_type_safe = document_type.lower().replace(' ', '_')
+        s3_key = f"documents/user_{current_user_id}/member_{family_member_id}/{doc_type_safe}/{uuid.uuid4()}{file_extension}"
+
+        file_path, s3_upload_id = S3Utils.create_multipart_upload(s3_key, content_type)
+        upload = DocumentUpload(
+            user_id=current_user_id,
+            family_member_id=family_member_id,
+            file_path=file_path,
+            upload_id=s3_upload_id,
+            content_type=content_type,
+            file_size=file_size,
+            part_size=part_size_for(file_size)
+        )
+        db.session.add(upload)
+        db.session.commit()
+
+        batch = range(1, min(upload.part_count, current_app.config['MULTIPART_URL_BATCH']) + 1)
+        response = describe(upload)
+        response['parts'] = part_urls(upload, batch)
+        return jsonify(response), 201
+
+    except Exception as e:
+        current_app.logger.error(f"Error starting multipart upload: {e}")
+        db.session.rollback()
+        return jsonify({'error': f'Error starting multipart upload: {str(e)}'}), 500
+
+
+@document_bp.route('/multipart/<int:upload_id>', methods=['GET'])
+@jwt_required()
+def get_multipart_upload(upload_id):
+    """Get an upload's state and the parts S3 has received, to resume after a dropped connection"""
+    try:
+        current_user_id = get_jwt_identity()
+        upload = DocumentUpload.query.filter_by(id=upload_id, user_id=current_user_id).first()
+        if not upload:
+            return jsonify({'error': 'Upload not found or unauthorized'}), 404
+        if upload.status != 'uploading':
+            return jsonify(describe(upload)), 200
+
+        try:
+            uploaded = S3Utils.list_uploaded_parts(upload.file_path, upload.upload_id)
+        except Exception as e:
+            if is_gone(e):
+                return jsonify({'error': 'Upload expired or was aborted'}), 410
+            raise
+        return jsonify(describe(upload, uploaded)), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving multipart upload: {e}")
+        return jsonify({'error': f'Error retrieving multipart upload: {str(e)}'}), 500
+
+
+@document_bp.route('/multipart/<int:upload_id>/parts', methods=['POST'])
+@jwt_required()
+def get_multipart_part_urls(upload_id):
+    """
+    Get presigned URLs for a batch of parts
+
+    Without part_numbers, URLs are issued for the next parts S3 has not received.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        upload = DocumentUpload.query.filter_by(id=upload_id, user_id=current_user_id).first()
+        if not upload:
+            return jsonify({'error': 'Upload not found or unauthorized'}), 404
+        if upload.status != 'uploading':
+            return jsonify({'error': f'Upload is {upload.status}'}), 409
+
+        batch_size = current_app.config['MULTIPART_URL_BATCH']
+        part_numbers = (request.get_json(silent=True) or {}).get('part_numbers')
+        if part_numbers is None:
+            try:
+                uploaded = S3Utils.list_uploaded_parts(upload.file_path, upload.upload_id)
+            except Exception as e:
+                if is_gone(e):
+                    return jsonify({'error': 'Upload expired or was aborted'}), 410
+                raise
+            part_numbers = missing_parts(upload, uploaded)[:batch_size]
+        elif not isinstance(part_numbers, list) or not all(
+                isinstance(number, int) and 1 <= number <= upload.part_count for number in part_numbers):
+            return jsonify({'error': f'part_numbers must be a list of parts between 1 and {upload.part_count}'}), 400
+        elif len(part_numbers) > batch_size:
+            return jsonify({'error': f'At most {batch_size} part URLs per request'}), 400
+
+        return jsonify({
+            'upload_id': upload.id,
+            'parts': part_urls(upload, sorted(set(part_numbers)))
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error presigning upload parts: {e}")
+        return jsonify({'error': f'Error presigning upload parts: {str(e)}'}), 500
+
+
+@document_bp.route('/multipart/<int:upload_id>/complete', methods=['POST'])
+@jwt_required()
+@idempotent
+def complete_multipart_upload(upload_id):
+    """Assemble the uploaded parts and register the document"""
+    try:
+        current_user_id = get_jwt_identity()
+        upload = DocumentUpload.query.filter_by(id=upload_id, user_id=current_user_id).first()
+        if not upload:
+            return jsonify({'error': 'Upload not found or unauthorized'}), 404
+        if upload.status == 'completed':
+            return jsonify({'message': 'Document registered successfully', 'document_id': upload.document_id}), 200
+        if upload.status != 'uploading':
+            return jsonify({'error': f'Upload is {upload.status}'}), 409
+
+        data = request.json
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        document_name = data.get('document_name')
+        document_type = data.get('document_type')
+        document_date = data.get('document_date')
+        description = data.get('description', '')
+
+        if not all([document_name, document_type, document_date]):
+            return jsonify({'error': 'Missing required document information'}), 400
+
+        try:
+            doc_date = datetime.strptime(document_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+        # Parts are read back from S3 rather than taken from the client, which may
+        # have lost its ETags when it resumed
+        try:
+            uploaded = S3Utils.list_uploaded_parts(upload.file_path, upload.upload_id)
+        except Exception as e:
+            if not is_gone(e):
+                raise
+            # An earlier attempt may have assembled the object and failed before registering it
+            if stored_size(upload) != upload.file_size:
+                return jsonify({'error': 'Upload expired or was aborted'}), 410
+            uploaded = None
+
+        if uploaded is not None:
+            missing = missing_parts(upload, uploaded)
+            if missing:
+                return jsonify({'error': 'Parts are missing', 'missing_parts': missing}), 409
+
+            error = quota_error(current_user_id, upload.family_member_id, upload.file_size)
+            if error:
+                S3Utils.abort_multipart_upload(upload.file_path, upload.upload_id)
+                upload.status = 'aborted'
+                db.session.commit()
+                return jsonify({'error': error}), 413
+
+            S3Utils.complete_multipart_upload(
+                upload.file_path,
+                upload.upload_id,
+                {number: part['etag'] for number, part in uploaded.items() if number <= upload.part_count}
+            )
+
+        new_document = MedicalDocument(
+            user_id=current_user_id,
+            family_member_id=upload.family_member_id,
+            document_name=document_name,
+            document_type=document_type,
+            document_date=doc_date,
+            description=description,
+            file_path=upload.file_path,
+            file_size=upload.file_size
+        )
+        db.session.add(new_document)
+        db.session.flush()
+        upload.status = 'completed'
+        upload.document_id = new_document.id
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Document registered successfully',
+            'document_id': new_document.id
+        }), 201
+
+    except Exception as e:
+        current_app.logger.error(f"Error completing multipart upload: {e}")
+        db.session.rollback()
+        return jsonify({'error': f'Error completing multipart upload: {str(e)}'}), 500
+
+
+@document_bp.route('/multipart/<int:upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_multipart_upload(upload_id):
+    """Abort an upload so S3 discards the parts received so far"""
+    try:
+        current_user_id = get_jwt_identity()
+        upload = DocumentUpload.query.filter_by(id=upload_id, user_id=current_user_id).first()
+        if not upload:
+            return jsonify({'error': 'Upload not found or unauthorized'}), 404
+        if upload.status == 'completed':
+            return jsonify({'error': 'Upload is completed; delete the document instead'}), 409
+
+        if upload.status == 'uploading':
+            if not S3Utils.abort_multipart_upload(upload.file_path, upload.upload_id):
+                return jsonify({'error': 'Failed to abort upload'}), 502
+            upload.status = 'aborted'
+            db.session.commit()
+
+        return jsonify({'message': 'Upload aborted'}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error aborting multipart upload: {e}")
+        db.session.rollback()
+        return jsonify({'error': f'Error aborting multipart upload: {str(e)}'}), 500
+
+@document_bp.route('/usage', methods=['GET'])
+@jwt_required()
+def get_storage_usage():
+    """Get document storage used by the account and each family member, with the quotas"""
+    try:
+        current_user_id = get_jwt_identity()
+        config = current_app.config
+        usage = usage_for(current_user_id)
+
+        return jsonify({
+            'document_count': sum(count for count, _ in usage.values()),
+            'total_bytes': sum(total for _, total in usage.values()),
+            'quota_bytes': config['STORAGE_QUOTA_USER_BYTES'],
+            'max_document_bytes': config['DOCUMENT_MAX_SIZE'],
+            'family_members': [{
+                'family_member_id': member_id,
+                'document_count': count,
+                'total_bytes': total,
+                'quota_bytes': config['STORAGE_QUOTA_MEMBER_BYTES'],
+                'quota_documents': config['STORAGE_QUOTA_MEMBER_DOCUMENTS']
+            } for member_id, (count, total) in sorted(usage.items())]
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving storage usage: {e}")
+        return jsonify({'error': f'Error retrieving storage usage: {str(e)}'}), 500
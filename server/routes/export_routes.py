@@ -0,0 +1,194 @@
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from models import db, User, FamilyMember, MedicalDocument, HealthData, HealthDataArchive
+from utils.storage import storage
+from utils.retention import decode_archive, ARCHIVE_COLUMNS
+from utils.sharding import shard_router
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.utils import secure_filename
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import select
+import csv
+import io
+import json
+import os
+import zipfile
+
+export_bp = Blueprint('export_routes', __name__)
+
+VITALS_COLUMNS = ['id', 'family_member_id', 'data_type', 'value', 'unit', 'timestamp', 'source']
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back out as chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _fetch_document(app, file_path):
+    """Download one document on a worker thread"""
+    with app.app_context():
+        return storage.download_bytes(file_path)
+
+
+def _vitals_rows(user_id):
+    """Yield every vitals row of the household, archived months first, without loading them all"""
+    archives = HealthDataArchive.query.filter_by(user_id=user_id).order_by(HealthDataArchive.period_start).all()
+    for archive in archives:
+        data = storage.download_bytes(archive.file_path)
+        if data is None:
+            current_app.logger.error(f"Export skipped unreadable archive {archive.file_path}")
+            continue
+        columns = decode_archive(data)
+        for row_id, timestamp, value, data_type, unit, source in zip(*(columns[c] for c in ARCHIVE_COLUMNS)):
+            yield (int(row_id), archive.family_member_id, str(data_type), float(value), str(unit) or None,
+                   datetime(1970, 1, 1) + timedelta(milliseconds=int(timestamp)), str(source) or None)
+
+    # Server-side cursor: rows arrive in batches instead of one big fetch
+    with shard_router.use(user_id):
+        result = db.session.execute(
+            select(HealthData.id, HealthData.family_member_id, HealthData.data_type, HealthData.value,
+                   HealthData.unit, HealthData.timestamp, HealthData.source)
+            .where(HealthData.user_id == user_id)
+            .order_by(HealthData.timestamp, HealthData.id)
+            .execution_options(yield_per=current_app.config['EXPORT_BATCH_SIZE'])
+        )
+    for row in result:
+        yield tuple(row)
+
+
+def _generate_export(app, user_id, vitals_format):
+    sink = _ChunkBuffer()
+    archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED)
+
+    # Profile and family relationships
+    user = User.query.get(user_id)
+    profile = {
+        'id': user.id,
+        'full_name': user.full_name,
+        'phone_number': user.phone_number,
+        'email': user.email,
+        'username': user.username,
+        'gender': user.gender,
+        'date_of_birth': user.date_of_birth.isoformat() if user.date_of_birth else None
+    }
+    archive.writestr('profile.json', json.dumps(profile, indent=2))
+
+    family = []
+    for relationship in FamilyMember.query.filter_by(user_id=user_id).all():
+        member = relationship.member
+        family.append({
+            'family_member_id': relationship.id,
+            'id': member.id,
+            'full_name': member.full_name,
+            'phone_number': member.phone_number,
+            'email': member.email,
+            'relationship': relationship.relationship,
+            'date_of_birth': member.date_of_birth.isoformat() if member.date_of_birth else None,
+            'gender': member.gender
+        })
+    archive.writestr('family.json', json.dumps(family, indent=2))
+    yield sink.drain()
+
+    # Document metadata, then the files themselves fetched a few at a time ahead of the writer
+    documents = MedicalDocument.query.filter_by(user_id=user_id).order_by(MedicalDocument.id).all()
+    index = []
+    for doc in documents:
+        extension = os.path.splitext(doc.file_path)[1]
+        name = secure_filename(doc.document_name) or 'document'
+        index.append({
+            'id': doc.id,
+            'family_member_id': doc.family_member_id,
+            'document_name': doc.document_name,
+            'document_type': doc.document_type,
+            'document_date': doc.document_date.strftime('%Y-%m-%d'),
+            'description': doc.description,
+            'file_size': doc.file_size,
+            'file': f'documents/member_{doc.family_member_id}/{doc.id}_{name}{extension}'
+        })
+    archive.writestr('documents/index.json', json.dumps(index, indent=2))
+    yield sink.drain()
+
+    concurrency = current_app.config['EXPORT_S3_CONCURRENCY']
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for doc, entry in zip(documents, index):
+            pending.append((entry, executor.submit(_fetch_document, app, doc.file_path)))
+            if len(pending) >= concurrency:
+                ready_entry, future = pending.popleft()
+                _write_document(archive, ready_entry, future.result())
+                yield sink.drain()
+        while pending:
+            ready_entry, future = pending.popleft()
+            _write_document(archive, ready_entry, future.result())
+            yield sink.drain()
+
+    # Vitals, streamed row by row into the zip entry
+    flush_every = current_app.config['EXPORT_BATCH_SIZE']
+    with archive.open(f'vitals.{vitals_format}', mode='w', force_zip64=True) as entry:
+        text = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+        writer = csv.writer(text) if vitals_format == 'csv' else None
+        if writer:
+            writer.writerow(VITALS_COLUMNS)
+        for count, row in enumerate(_vitals_rows(user_id), start=1):
+            row = list(row)
+            row[5] = row[5].isoformat()
+            if writer:
+                writer.writerow(row)
+            else:
+                text.write(json.dumps(dict(zip(VITALS_COLUMNS, row))) + '\n')
+            if count % flush_every == 0:
+                text.flush()
+                yield sink.drain()
+        text.flush()
+        text.detach()
+    yield sink.drain()
+
+    archive.close()
+    yield sink.drain()
+
+
+def _write_document(archive, entry, data):
+    if data is None:
+        current_app.logger.error(f"Export could not fetch document {entry['id']}")
+        archive.writestr(entry['file'] + '.missing.txt', 'This file could not be retrieved from storage.')
+        return
+    # Scans and PDFs are already compressed, deflating them again only costs CPU
+    archive.writestr(entry['file'], data, compress_type=zipfile.ZIP_STORED)
+
+
+@export_bp.route('', methods=['GET'])
+@jwt_required()
+def export_health_record():
+    """Stream the user's complete health record as a ZIP archive"""
+    current_user_id = get_jwt_identity()
+
+    user = User.query.get(current_user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    vitals_format = request.args.get('vitals_format', 'csv').lower()
+    if vitals_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'vitals_format must be csv or ndjson'}), 400
+
+    app = current_app._get_current_object()
+    filename = f"health_record_{current_user_id}_{datetime.utcnow():%Y%m%d}.zip"
+    return Response(
+        stream_with_context(_generate_export(app, current_user_id, vitals_format)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,32 @@
+import os
+from flask import Blueprint, request, jsonify, current_app, send_file, make_response
+from utils.storage import storage
+
+file_bp = Blueprint('file_routes', __name__)
+
+
+@file_bp.route('/<path:key>', methods=['GET'])
+def download_file(key):
+    """Serve a locally stored file through a signed, expiring URL"""
+    local = storage.local
+    if not local.verify(key, request.args.get('expires'), request.args.get('signature')):
+        return jsonify({'error': 'Invalid or expired download URL'}), 403
+
+    path = local.disk_path(key)
+    if not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+
+    download_name = os.path.basename(key)
+    accel_prefix = current_app.config['LOCAL_STORAGE_ACCEL_PREFIX']
+    if accel_prefix:
+        # nginx serves the file itself (sendfile, Range, If-Modified-Since) from an internal location
+        response = make_response('', 200)
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{local.relative_path(key)}"
+        response.headers['Content-Type'] = local.content_type(key)
+        response.headers['Content-Disposition'] = f'inline; filename="{download_name}"'
+        return response
+
+    # conditional=True answers Range and If-None-Match requests; the body is handed to the
+    # server's wsgi.file_wrapper (sendfile under gunicorn), or USE_X_SENDFILE for Apache
+    return send_file(path, mimetype=local.content_type(key), download_name=download_name,
+                     conditional=True, max_age=0)
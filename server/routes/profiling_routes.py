@@ -0,0 +1,32 @@
+from flask import Blueprint, request, jsonify, current_app, Response
+from utils.profiling import format_collapsed
+from datetime import datetime
+
+profiling_bp = Blueprint('profiling_routes', __name__)
+
+
+@profiling_bp.route('/profile', methods=['GET'])
+def sample_profile():
+    """Sample every thread of this worker for a few seconds, as a collapsed-stack flamegraph file"""
+    profiling = current_app.extensions['profiling']
+    if not profiling.verify(request.headers.get('X-Profile-Token'), request.path):
+        return jsonify({'error': 'Invalid or expired profiling token'}), 403
+
+    max_seconds = current_app.config['PROFILING_MAX_SECONDS']
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', current_app.config['PROFILING_SAMPLE_INTERVAL'] * 1000)) / 1000
+        if not 0 < seconds <= max_seconds or not 0.001 <= interval <= 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'seconds must be between 0 and {max_seconds}, interval_ms between 1 and 1000'}), 400
+
+    counts = profiling.sample(seconds, interval)
+    if counts is None:
+        return jsonify({'error': 'A profile is already being taken'}), 409
+
+    filename = f"profile_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.folded"
+    return Response(format_collapsed(counts), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store'
+    })
@@ -0,0 +1,70 @@
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from models import db, User
+from utils.family_graph import family_graph
+from utils.vitals_stream import hub, missed_events, format_event, format_resync
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+import queue
+
+stream_bp = Blueprint('stream_routes', __name__)
+
+
+def _generate_events(user_id, family_member_id, last_seq):
+    # Subscribe before replaying so nothing stored in between is lost; duplicates are skipped by seq
+    subscriber = hub.subscribe(user_id, family_member_id)
+    try:
+        yield 'retry: 3000\n\n'
+        if last_seq is not None:
+            events, more = missed_events(user_id, family_member_id, last_seq,
+                                         current_app.config['VITALS_STREAM_REPLAY_LIMIT'])
+            for seq, payload in events:
+                yield format_event(seq, payload)
+                last_seq = seq
+            if more:
+                # Going live now would skip what is left; the client reconnects from last_seq instead
+                yield format_resync(last_seq)
+                return
+        else:
+            last_seq = db.session.execute(select(User.change_seq).where(User.id == user_id)).scalar()
+        # Idle streams must not hold a pooled database connection
+        db.session.remove()
+
+        heartbeat = current_app.config['VITALS_STREAM_HEARTBEAT']
+        while not subscriber.dropped:
+            try:
+                seq, payload = subscriber.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            if seq <= last_seq:
+                continue
+            yield format_event(seq, payload)
+            last_seq = seq
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+@stream_bp.route('/<int:family_member_id>/vitals/stream', methods=['GET'])
+@jwt_required()
+def stream_vitals(family_member_id):
+    """Stream newly stored vitals for a family member (0 for self) as server-sent events"""
+    current_user_id = get_jwt_identity()
+
+    if family_member_id != 0 and not family_graph.owns(current_user_id, family_member_id):
+        return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_seq = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    return Response(
+        stream_with_context(_generate_events(current_user_id, family_member_id, last_seq)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Keep nginx from buffering the stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
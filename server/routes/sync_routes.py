@@ -0,0 +1,179 @@
+from flask import Blueprint, request, jsonify, current_app
+from models import db, User, FamilyMember, MedicalDocument, HealthData, ImportJob, ChangeLogEntry
+from utils.change_log import DELETE
+from utils.storage import storage
+from utils.cache import cache, presigned_key
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+import base64
+import json
+
+sync_bp = Blueprint('sync_routes', __name__)
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+
+def _encode_token(user_id, seq):
+    """Encode a position in a user's change log as an opaque sync token"""
+    raw = json.dumps([user_id, seq]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_token(token, user_id):
+    """Decode a token from _encode_token, raising ValueError if malformed or not this user's"""
+    try:
+        token_user_id, seq = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid sync token')
+    if token_user_id != user_id:
+        raise ValueError('Invalid sync token')
+    return int(seq)
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+def _user_data(users):
+    return {user.id: {
+        'id': user.id,
+        'full_name': user.full_name,
+        'phone_number': user.phone_number,
+        'email': user.email,
+        'username': user.username,
+        'gender': user.gender,
+        'date_of_birth': _date(user.date_of_birth)
+    } for user in users}
+
+
+def _family_member_data(relationships):
+    return {relationship.id: {
+        'id': relationship.member.id,
+        'family_member_id': relationship.id,
+        'full_name': relationship.member.full_name,
+        'phone_number': relationship.member.phone_number,
+        'email': relationship.member.email,
+        'relationship': relationship.relationship,
+        'date_of_birth': _date(relationship.member.date_of_birth),
+        'gender': relationship.member.gender,
+        'is_self': False
+    } for relationship in relationships}
+
+
+def _document_data(documents):
+    ttl = current_app.config['PRESIGNED_URL_CACHE_TTL']
+    return {doc.id: {
+        'id': doc.id,
+        'family_member_id': doc.family_member_id,
+        'document_name': doc.document_name,
+        'document_type': doc.document_type,
+        'document_date': doc.document_date.strftime('%Y-%m-%d'),
+        'description': doc.description,
+        'created_at': doc.created_at.strftime('%Y-%m-%d %H:%M:%S') if doc.created_at else None,
+        'file_size': doc.file_size,
+        'download_url': cache.get_or_set(
+            presigned_key(doc.file_path),
+            lambda: storage.generate_presigned_url(doc.file_path, expiration=3600),
+            ttl=ttl
+        )
+    } for doc in documents}
+
+
+def _health_data_data(rows):
+    return {data.id: {
+        'id': data.id,
+        'family_member_id': data.family_member_id,
+        'data_type': data.data_type,
+        'value': data.value,
+        'unit': data.unit,
+        'timestamp': data.timestamp.isoformat(),
+        'source': data.source
+    } for data in rows}
+
+
+def _import_job_data(jobs):
+    return {job.id: {
+        'id': job.id,
+        'family_member_id': job.family_member_id,
+        'status': job.status,
+        'records_imported': job.records_imported
+    } for job in jobs}
+
+
+# entity -> (model, serializer); rows are always scoped to the requesting user
+ENTITIES = {
+    'user': (User, _user_data),
+    'family_member': (FamilyMember, _family_member_data),
+    'document': (MedicalDocument, _document_data),
+    'health_data': (HealthData, _health_data_data),
+    'import_job': (ImportJob, _import_job_data),
+}
+
+
+@sync_bp.route('', methods=['GET'])
+@jwt_required()
+def sync():
+    """Get everything that changed for the current user since a sync token"""
+    current_user_id = get_jwt_identity()
+
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+
+    since = request.args.get('since')
+    if not since:
+        # No token yet: the client downloads everything once, then syncs from here
+        head = db.session.execute(select(User.change_seq).where(User.id == current_user_id)).scalar()
+        if head is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify({'changes': [], 'next': _encode_token(current_user_id, head), 'has_more': False,
+                        'reset': True}), 200
+
+    try:
+        since_seq = _decode_token(since, current_user_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    entries = db.session.execute(
+        select(ChangeLogEntry.seq, ChangeLogEntry.entity, ChangeLogEntry.entity_id, ChangeLogEntry.operation)
+        .where(ChangeLogEntry.user_id == current_user_id, ChangeLogEntry.seq > since_seq)
+        .order_by(ChangeLogEntry.seq)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Only the latest change per entity matters to the client
+    latest = {}
+    for seq, entity, entity_id, operation in entries:
+        latest.pop((entity, entity_id), None)
+        latest[(entity, entity_id)] = operation
+
+    # One query per entity type for everything still to upsert
+    upserts = {}
+    for entity, (model, serialize) in ENTITIES.items():
+        ids = [entity_id for (kind, entity_id), operation in latest.items() if kind == entity and operation != DELETE]
+        if not ids:
+            continue
+        owner = model.id if model is User else model.user_id
+        upserts[entity] = serialize(model.query.filter(model.id.in_(ids), owner == current_user_id).all())
+
+    changes = []
+    for (entity, entity_id), operation in latest.items():
+        data = upserts.get(entity, {}).get(entity_id)
+        if operation == DELETE or data is None:
+            # Deleted, or gone since the entry was written
+            changes.append({'entity': entity, 'id': entity_id, 'op': DELETE})
+        else:
+            changes.append({'entity': entity, 'id': entity_id, 'op': 'upsert', 'data': data})
+
+    next_seq = entries[-1][0] if entries else since_seq
+    return jsonify({
+        'changes': changes,
+        'next': _encode_token(current_user_id, next_seq),
+        'has_more': has_more
+    }), 200
@@ -0,0 +1,170 @@
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from models import MedicalDocument, HealthData
+from utils.family_graph import family_graph
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import or_, and_
+from datetime import datetime, time
+import base64
+import heapq
+import itertools
+import json
+
+timeline_bp = Blueprint('timeline_routes', __name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Events that share a timestamp are ordered documents first, then by id (newest first)
+VITAL_RANK = 0
+DOCUMENT_RANK = 1
+
+
+def _encode_cursor(key):
+    """Encode a (timestamp, rank, id) sort key as an opaque cursor string"""
+    timestamp, rank, row_id = key
+    raw = json.dumps([timestamp.isoformat(), rank, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """Decode a cursor produced by _encode_cursor, raising ValueError if malformed"""
+    try:
+        timestamp, rank, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(timestamp), int(rank), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _document_event(doc):
+    key = (datetime.combine(doc.document_date, time.min), DOCUMENT_RANK, doc.id)
+    return key, {
+        'type': 'document',
+        'family_member_id': doc.family_member_id,
+        'date': doc.document_date.strftime('%Y-%m-%d'),
+        'document': {
+            'id': doc.id,
+            'document_name': doc.document_name,
+            'document_type': doc.document_type,
+            'document_date': doc.document_date.strftime('%Y-%m-%d'),
+            'description': doc.description,
+            'created_at': doc.created_at.strftime('%Y-%m-%d %H:%M:%S') if doc.created_at else None,
+            'file_size': doc.file_size
+        }
+    }
+
+
+def _vital_event(data):
+    key = (data.timestamp, VITAL_RANK, data.id)
+    return key, {
+        'type': 'vital',
+        'family_member_id': data.family_member_id,
+        'date': data.timestamp.isoformat(),
+        'vital': {
+            'id': data.id,
+            'data_type': data.data_type,
+            'value': data.value,
+            'unit': data.unit,
+            'timestamp': data.timestamp.isoformat(),
+            'source': data.source
+        }
+    }
+
+
+def _member_cursor(query, date_column, id_column, to_event, page_size):
+    """
+    Lazily yield events newest-first from one member's query.
+
+    Rows are read a page at a time using keyset pagination on (date_column, id),
+    which is served by the per-member composite index, so a source is only
+    queried as far as the merge actually consumes it.
+    """
+    last = None
+    while True:
+        page = query
+        if last is not None:
+            page = page.filter(or_(
+                date_column < last[0],
+                and_(date_column == last[0], id_column < last[1])
+            ))
+        rows = page.order_by(date_column.desc(), id_column.desc()).limit(page_size).all()
+
+        for row in rows:
+            yield to_event(row)
+
+        if len(rows) < page_size:
+            return
+        last = (getattr(rows[-1], date_column.key), rows[-1].id)
+
+
+def _household_sources(user_id, cursor, page_size):
+    """Build one document cursor and one vitals cursor per household member"""
+    # None stands for the user's own profile, which has no FamilyMember row
+    member_ids = [None] + sorted(family_graph.household(user_id))
+
+    sources = []
+    for member_id in member_ids:
+        vitals = HealthData.query.filter_by(user_id=user_id, family_member_id=member_id)
+        if cursor is not None:
+            vitals = vitals.filter(HealthData.timestamp <= cursor[0])
+        sources.append(_member_cursor(vitals, HealthData.timestamp, HealthData.id, _vital_event, page_size))
+
+        if member_id is None:
+            continue
+
+        documents = MedicalDocument.query.filter_by(user_id=user_id, family_member_id=member_id)
+        if cursor is not None:
+            documents = documents.filter(MedicalDocument.document_date <= cursor[0].date())
+        sources.append(_member_cursor(documents, MedicalDocument.document_date, MedicalDocument.id,
+                                      _document_event, page_size))
+
+    if cursor is not None:
+        # The SQL bounds are inclusive, so drop anything at or after the cursor itself
+        sources = [itertools.dropwhile(lambda event: event[0] >= cursor, source) for source in sources]
+
+    return sources
+
+
+@timeline_bp.route('', methods=['GET'])
+@jwt_required()
+def get_timeline():
+    """Get a merged, newest-first feed of documents and vitals for the whole household"""
+    current_user_id = get_jwt_identity()
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            cursor = _decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    # One extra event tells us whether another page exists
+    sources = _household_sources(current_user_id, cursor, limit + 1)
+    merged = heapq.merge(*sources, key=lambda event: event[0], reverse=True)
+
+    def generate():
+        try:
+            yield '{"events": ['
+            last_key = None
+            has_more = False
+            for index, (key, event) in enumerate(itertools.islice(merged, limit + 1)):
+                if index == limit:
+                    has_more = True
+                    break
+                yield (',' if index else '') + json.dumps(event)
+                last_key = key
+
+            next_cursor = _encode_cursor(last_key) if has_more else None
+            yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+        except Exception as e:
+            current_app.logger.error(f"Error streaming timeline: {e}")
+            raise
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
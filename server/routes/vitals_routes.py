@@ -0,0 +1,255 @@
+from flask import Blueprint, request, jsonify, current_app, Response
+from models import db, HealthDataRollup, ImportJob
+from utils.vitals_series import VitalsSeries, BINARY_MIMETYPE, MSGPACK_MIMETYPE, msgpack
+from utils import vitals_analytics
+from utils.vitals_import import detect_format, start_import_job
+from utils.family_graph import family_graph
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime
+import os
+import tempfile
+
+vitals_bp = Blueprint('vitals_routes', __name__)
+
+DEFAULT_WINDOW_SECONDS = 300
+MAX_WINDOW_SECONDS = 30 * 86400
+
+
+def _authorize_member(current_user_id, family_member_id):
+    """Check that family_member_id (0 meaning self) belongs to the current user"""
+    if family_member_id == 0:
+        return True
+    return family_graph.owns(current_user_id, family_member_id)
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _requested_format():
+    """Pick the response format from ?format= or the Accept header"""
+    requested = request.args.get('format')
+    if requested:
+        return requested.lower()
+    best = request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE, MSGPACK_MIMETYPE])
+    if best == BINARY_MIMETYPE:
+        return 'binary'
+    if best == MSGPACK_MIMETYPE:
+        return 'msgpack'
+    return 'json'
+
+
+@vitals_bp.route('/family/<int:family_member_id>/series', methods=['GET'])
+@jwt_required()
+def get_vitals_series(family_member_id):
+    """Get one vitals series for a family member (0 for self) as JSON or compact binary"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        if not _authorize_member(current_user_id, family_member_id):
+            return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+        data_type = request.args.get('type')
+        if not data_type:
+            return jsonify({'error': 'Missing required parameter: type'}), 400
+
+        try:
+            start = _parse_datetime(request.args.get('start'))
+            end = _parse_datetime(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use ISO format'}), 400
+
+        output_format = _requested_format()
+        if output_format not in ('json', 'binary', 'msgpack'):
+            return jsonify({'error': 'Unsupported format. Use json, binary or msgpack'}), 400
+        if output_format == 'msgpack' and msgpack is None:
+            return jsonify({'error': 'MessagePack output is not available on this server'}), 406
+
+        value_width = 8 if request.args.get('precision') == '64' else 4
+
+        timestamps, values = VitalsSeries.load(current_user_id, family_member_id, data_type, start, end)
+        unit = VitalsSeries.unit_for(current_user_id, family_member_id, data_type)
+
+        if output_format == 'binary':
+            response = Response(VitalsSeries.pack_binary(timestamps, values, value_width),
+                                mimetype=BINARY_MIMETYPE)
+            response.headers['X-Vitals-Type'] = data_type
+            if unit:
+                response.headers['X-Vitals-Unit'] = unit
+            return response
+
+        if output_format == 'msgpack':
+            body = VitalsSeries.pack_msgpack(timestamps, values, value_width,
+                                             data_type=data_type, unit=unit)
+            return Response(body, mimetype=MSGPACK_MIMETYPE)
+
+        return jsonify({
+            'data_type': data_type,
+            'unit': unit,
+            'count': len(values),
+            'timestamps': timestamps.tolist(),
+            'values': values.tolist()
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving vitals series: {e}")
+        return jsonify({'error': f'Error retrieving vitals series: {str(e)}'}), 500
+
+
+@vitals_bp.route('/family/<int:family_member_id>/analytics', methods=['GET'])
+@jwt_required()
+def get_vitals_analytics(family_member_id):
+    """Get rolling averages and type-specific flags for a family member's vitals"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        if not _authorize_member(current_user_id, family_member_id):
+            return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+        data_type = request.args.get('type')
+        if not data_type:
+            return jsonify({'error': 'Missing required parameter: type'}), 400
+
+        try:
+            window = int(request.args.get('window', DEFAULT_WINDOW_SECONDS))
+        except ValueError:
+            return jsonify({'error': 'window must be an integer number of seconds'}), 400
+        if window < 1 or window > MAX_WINDOW_SECONDS:
+            return jsonify({'error': f'window must be between 1 and {MAX_WINDOW_SECONDS} seconds'}), 400
+
+        try:
+            start = _parse_datetime(request.args.get('start'))
+            end = _parse_datetime(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use ISO format'}), 400
+
+        result = vitals_analytics.cached_compute(current_user_id, family_member_id, data_type,
+                                                 window * 1000, start, end)
+        return jsonify(result), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error computing vitals analytics: {e}")
+        return jsonify({'error': f'Error computing vitals analytics: {str(e)}'}), 500
+
+
+@vitals_bp.route('/family/<int:family_member_id>/rollups', methods=['GET'])
+@jwt_required()
+def get_vitals_rollups(family_member_id):
+    """Get daily aggregates kept for archived vitals"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        if not _authorize_member(current_user_id, family_member_id):
+            return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+        data_type = request.args.get('type')
+        if not data_type:
+            return jsonify({'error': 'Missing required parameter: type'}), 400
+
+        try:
+            start = _parse_datetime(request.args.get('start'))
+            end = _parse_datetime(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use ISO format'}), 400
+
+        query = HealthDataRollup.query.filter_by(
+            user_id=current_user_id,
+            family_member_id=family_member_id or None,
+            data_type=data_type
+        )
+        if start is not None:
+            query = query.filter(HealthDataRollup.day >= start.date())
+        if end is not None:
+            query = query.filter(HealthDataRollup.day < end.date())
+
+        rollups = [{
+            'date': rollup.day.strftime('%Y-%m-%d'),
+            'count': rollup.count,
+            'mean': rollup.total / rollup.count,
+            'min': rollup.minimum,
+            'max': rollup.maximum
+        } for rollup in query.order_by(HealthDataRollup.day).all()]
+
+        return jsonify({
+            'data_type': data_type,
+            'rollups': rollups,
+            'count': len(rollups)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving vitals rollups: {e}")
+        return jsonify({'error': f'Error retrieving vitals rollups: {str(e)}'}), 500
+
+
+@vitals_bp.route('/family/<int:family_member_id>/import', methods=['POST'])
+@jwt_required()
+def import_vitals(family_member_id):
+    """Start a background import of an Apple Health export or vitals CSV"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        if not _authorize_member(current_user_id, family_member_id):
+            return jsonify({'error': 'Invalid or unauthorized family member'}), 403
+
+        if 'file' not in request.files:
+            return jsonify({'error': 'No export file provided'}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'Empty export file'}), 400
+
+        source_format = request.form.get('format') or detect_format(file.filename)
+        if source_format not in ('apple_health', 'csv'):
+            return jsonify({'error': 'Unsupported export format. Use an Apple Health export or CSV'}), 400
+
+        # The job outlives this request, so keep the upload on disk until it finishes
+        handle, path = tempfile.mkstemp(prefix='vitals_import_', dir=current_app.config['IMPORT_UPLOAD_DIR'])
+        with os.fdopen(handle, 'wb') as destination:
+            file.save(destination)
+
+        job = ImportJob(
+            user_id=current_user_id,
+            family_member_id=family_member_id or None,
+            source_format=source_format,
+            status='pending'
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        start_import_job(job, path)
+
+        return jsonify({
+            'message': 'Import started',
+            'job_id': job.id
+        }), 202
+
+    except Exception as e:
+        current_app.logger.error(f"Error starting vitals import: {e}")
+        db.session.rollback()
+        return jsonify({'error': f'Error starting vitals import: {str(e)}'}), 500
+
+
+@vitals_bp.route('/imports/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_import_job(job_id):
+    """Get the progress of a vitals import"""
+    current_user_id = get_jwt_identity()
+
+    job = ImportJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+
+    progress = None
+    if job.bytes_total:
+        progress = round(min(job.bytes_read or 0, job.bytes_total) * 100 / job.bytes_total, 1)
+
+    return jsonify({
+        'id': job.id,
+        'status': job.status,
+        'source_format': job.source_format,
+        'progress': progress,
+        'records_imported': job.records_imported,
+        'records_skipped': job.records_skipped,
+        'error': job.error
+    }), 200
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import pytest
+
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_ROOT)
+
+# Read when config.py is imported, so they must be set before the app is
+os.environ['TEST_DATABASE_URL'] = 'sqlite://'
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['LOCAL_STORAGE_ROOT'] = tempfile.mkdtemp(prefix='health-app-storage-')
+os.environ['RATELIMIT_ENABLED'] = 'false'
+os.environ['LOG_REQUESTS'] = 'false'
+os.environ['MEMBER_REMOVAL_BATCH_PAUSE'] = '0'
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help='Also run timing tests that depend on machine load.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: timing test, only run with --run-slow')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip = pytest.mark.skip(reason='needs --run-slow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def signup(client):
+    """Create a user; returns (user ID, auth headers)"""
+    def signup(phone_number='5550100', full_name='Test User'):
+        response = client.post('/api/v1/auth/signup', json={
+            'full_name': full_name, 'phone_number': phone_number, 'password': 'password'
+        })
+        assert response.status_code == 201, response.json
+        return response.json['user']['id'], {'Authorization': f"Bearer {response.json['access_token']}"}
+    return signup
+
+
+@pytest.fixture
+def add_member(client):
+    """Add a family member to a household; returns its FamilyMember ID"""
+    def add_member(headers, full_name='Family Member', relationship='child'):
+        response = client.post('/api/v1/family', json={'full_name': full_name, 'relationship': relationship},
+                               headers=headers)
+        assert response.status_code == 201, response.json
+        return response.json['family_member']['family_member_id']
+    return add_member
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """In-memory stand-in for the S3 bucket; maps s3:// paths to their bytes"""
+    from utils.s3_utils import S3Utils
+    objects = {}
+
+    def upload_bytes(data, key, content_type='application/octet-stream'):
+        objects[f's3://test-bucket/{key}'] = data
+        return True, f's3://test-bucket/{key}'
+
+    def delete_objects(file_paths):
+        for file_path in file_paths:
+            objects.pop(file_path, None)
+        return []
+
+    monkeypatch.setattr(S3Utils, 'upload_bytes', staticmethod(upload_bytes))
+    monkeypatch.setattr(S3Utils, 'download_bytes', staticmethod(objects.get))
+    monkeypatch.setattr(S3Utils, 'delete_objects', staticmethod(delete_objects))
+    return objects
@@ -0,0 +1,55 @@
+import io
+from models import db, FamilyMember
+from utils.cache import cache
+from utils.family_graph import family_graph, household_key
+
+
+def _upload(client, headers, family_member_id):
+    return client.post('/api/v1/documents/upload', data={
+        'document': (io.BytesIO(b'%PDF-1.4'), 'report.pdf'),
+        'document_name': 'Report',
+        'document_type': 'Lab Report',
+        'document_date': '2025-01-01',
+        'family_member_id': str(family_member_id)
+    }, headers=headers, content_type='multipart/form-data')
+
+
+def test_owns_follows_added_and_removed_members(app, signup, add_member):
+    user_id, headers = signup()
+    assert family_graph.household(user_id) == {}
+
+    member_id = add_member(headers)
+    assert family_graph.owns(user_id, member_id)
+
+    db.session.delete(db.session.get(FamilyMember, member_id))
+    db.session.commit()
+    assert cache.get(household_key(user_id)) is None
+    assert not family_graph.owns(user_id, member_id)
+
+
+def test_refusal_is_confirmed_against_the_database(app, signup, add_member):
+    user_id, headers = signup()
+    member_id = add_member(headers)
+    # As left behind by a worker that never saw the member being added
+    cache.set(household_key(user_id), [], 60)
+
+    assert family_graph.owns(user_id, member_id)
+    assert member_id in family_graph.household(user_id)
+
+
+def test_other_households_are_refused(client, signup, add_member):
+    _, headers = signup()
+    _, other_headers = signup('5550199')
+    other_member_id = add_member(other_headers)
+
+    assert _upload(client, headers, other_member_id).status_code == 403
+    assert _upload(client, other_headers, other_member_id).status_code == 201
+
+
+def test_malformed_member_ids_are_refused(client, signup, add_member):
+    user_id, headers = signup()
+    add_member(headers)
+
+    for value in ('abc', '1.5', '', None, True, 1.5):
+        assert not family_graph.owns(user_id, value)
+    assert _upload(client, headers, 'abc').status_code == 403
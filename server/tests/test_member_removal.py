@@ -0,0 +1,77 @@
+import io
+import time
+from datetime import datetime, timedelta
+from models import db, FamilyMember, MedicalDocument, HealthData, MemberRemoval
+from utils.family_graph import family_graph
+from utils.storage import storage
+
+
+def _upload(client, headers, family_member_id, name='report.pdf'):
+    response = client.post('/api/v1/documents/upload', data={
+        'document': (io.BytesIO(b'%PDF-1.4 report'), name),
+        'document_name': 'Report',
+        'document_type': 'Lab Report',
+        'document_date': '2025-01-01',
+        'family_member_id': str(family_member_id)
+    }, headers=headers, content_type='multipart/form-data')
+    assert response.status_code == 201, response.json
+
+
+def _wait(client, headers, removal_id):
+    for _ in range(100):
+        status = client.get(f'/api/v1/family/removals/{removal_id}', headers=headers).json
+        if status['status'] in ('completed', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'Removal {removal_id} did not finish')
+
+
+def test_member_and_their_data_are_removed(app, client, signup, add_member):
+    app.config['MEMBER_REMOVAL_BATCH_SIZE'] = 2
+    user_id, headers = signup()
+    removed, kept = add_member(headers, 'Removed'), add_member(headers, 'Kept')
+    for i in range(3):
+        _upload(client, headers, removed, f'{i}.pdf')
+    _upload(client, headers, kept)
+    start = datetime(2025, 1, 1)
+    db.session.add_all(HealthData(user_id=user_id, family_member_id=removed, data_type='HEART_RATE', value=i,
+                                  timestamp=start + timedelta(minutes=i)) for i in range(5))
+    db.session.add(HealthData(user_id=user_id, family_member_id=kept, data_type='HEART_RATE', value=70,
+                              timestamp=start))
+    db.session.commit()
+    removed_files = [document.file_path for document in MedicalDocument.query.filter_by(family_member_id=removed)]
+
+    _, other_headers = signup('5550199')
+    assert client.delete(f'/api/v1/family/{removed}', headers=other_headers).status_code == 404
+
+    response = client.delete(f'/api/v1/family/{removed}', headers=headers)
+    assert response.status_code == 202
+    status = _wait(client, headers, response.json['removal_id'])
+    assert status['status'] == 'completed', status
+    assert status['documents_done'] == 3
+    assert status['health_data_done'] == 5
+
+    db.session.expire_all()
+    assert db.session.get(FamilyMember, removed) is None
+    assert not family_graph.owns(user_id, removed)
+    assert MedicalDocument.query.filter_by(family_member_id=removed).count() == 0
+    assert HealthData.query.filter_by(family_member_id=removed).count() == 0
+    assert all(storage.download_bytes(file_path) is None for file_path in removed_files)
+    assert MedicalDocument.query.filter_by(family_member_id=kept).count() == 1
+    assert HealthData.query.filter_by(family_member_id=kept).count() == 1
+
+
+def test_documents_can_be_reassigned(app, client, signup, add_member):
+    _, headers = signup()
+    removed, kept = add_member(headers, 'Removed'), add_member(headers, 'Kept')
+    _upload(client, headers, removed)
+
+    response = client.delete(f'/api/v1/family/{removed}?reassign_documents_to={kept}', headers=headers)
+    assert response.status_code == 202
+    assert _wait(client, headers, response.json['removal_id'])['status'] == 'completed'
+
+    db.session.expire_all()
+    assert db.session.get(MemberRemoval, response.json['removal_id']).files_deleted == 0
+    document = MedicalDocument.query.one()
+    assert document.family_member_id == kept
+    assert storage.download_bytes(document.file_path) is not None
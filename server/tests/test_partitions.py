@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, HealthData
+from utils.partitions import HealthDataPartitions
+from utils.vitals_series import VitalsSeries
+
+
+def test_sqlite_keeps_one_table(app):
+    assert not HealthDataPartitions.is_native()
+    assert HealthDataPartitions.ensure() == []
+    assert HealthDataPartitions.list_periods() == []
+    with pytest.raises(RuntimeError):
+        HealthDataPartitions.detach(2025, 1)
+
+
+def test_series_reads_every_month(app, signup):
+    user_id, _ = signup()
+    start = datetime(2025, 1, 1)
+    db.session.add_all(HealthData(user_id=user_id, data_type='HEART_RATE', value=i,
+                                  timestamp=start + timedelta(days=i)) for i in range(40))
+    db.session.commit()
+
+    _, values = VitalsSeries.load(user_id, 0, 'HEART_RATE', start, datetime(2025, 3, 1))
+    assert list(values) == list(range(40))
+    _, values = VitalsSeries.load(user_id, 0, 'HEART_RATE', datetime(2025, 2, 1), datetime(2025, 2, 5))
+    assert list(values) == [31, 32, 33, 34]
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from models import db, HealthData, HealthDataArchive
+from utils import retention
+from utils.retention import VitalsArchiver
+from utils.storage import storage
+from utils.vitals_series import VitalsSeries
+
+NOW = datetime(2026, 1, 15)
+START = datetime(2025, 1, 1)
+
+
+def _add_vitals(user_id, values, start=START):
+    db.session.add_all(HealthData(user_id=user_id, data_type='HEART_RATE', value=value,
+                                  timestamp=start + timedelta(hours=i)) for i, value in enumerate(values))
+    db.session.commit()
+
+
+def _january(user_id):
+    _, values = VitalsSeries.load(user_id, 0, 'HEART_RATE', START, datetime(2025, 2, 1))
+    return list(values)
+
+
+def test_archived_month_reads_back(app, signup):
+    user_id, _ = signup()
+    _add_vitals(user_id, [60, 61, 62])
+
+    assert VitalsArchiver.archive(NOW) == [(user_id, None, START.date(), 3)]
+    assert HealthData.query.count() == 0
+    assert _january(user_id) == [60, 61, 62]
+
+
+def test_merged_archive_is_not_served_stale(app, signup):
+    user_id, _ = signup()
+    _add_vitals(user_id, [60, 61, 62])
+    VitalsArchiver.archive(NOW)
+    # Decodes the file and keeps it in the archive cache
+    assert _january(user_id) == [60, 61, 62]
+
+    _add_vitals(user_id, [99], start=START + timedelta(minutes=30))
+    assert VitalsArchiver.archive(NOW) == [(user_id, None, START.date(), 4)]
+    assert _january(user_id) == [60, 99, 61, 62]
+
+
+def test_merge_moves_the_archive_to_the_current_backend(app, signup, s3):
+    user_id, _ = signup()
+    app.config['STORAGE_BACKEND'] = 's3'
+    _add_vitals(user_id, [60, 61])
+    VitalsArchiver.archive(NOW)
+    old_path = HealthDataArchive.query.one().file_path
+    assert old_path in s3
+
+    app.config['STORAGE_BACKEND'] = 'local'
+    _add_vitals(user_id, [99], start=START + timedelta(minutes=30))
+    VitalsArchiver.archive(NOW)
+
+    archive = HealthDataArchive.query.one()
+    assert archive.file_path.startswith('local://')
+    assert archive.row_count == 3
+    assert storage.download_bytes(archive.file_path) is not None
+    assert old_path not in s3
+    assert _january(user_id) == [60, 99, 61]
+
+
+def test_merge_writes_a_new_file(app, signup):
+    user_id, _ = signup()
+    _add_vitals(user_id, [60, 61])
+    VitalsArchiver.archive(NOW)
+    old_path = HealthDataArchive.query.one().file_path
+
+    _add_vitals(user_id, [99], start=START + timedelta(minutes=30))
+    VitalsArchiver.archive(NOW)
+
+    new_path = HealthDataArchive.query.one().file_path
+    assert new_path != old_path
+    assert storage.download_bytes(old_path) is None
+    assert storage.download_bytes(new_path) is not None
+
+
+def test_rows_committed_during_archiving_are_kept(app, signup, monkeypatch):
+    user_id, _ = signup()
+    _add_vitals(user_id, [60, 61])
+    encode = retention.encode_archive
+
+    def encode_with_late_row(rows):
+        # A sync landing between the select and the delete
+        db.session.execute(insert(HealthData).values(user_id=user_id, data_type='HEART_RATE', value=99,
+                                                     timestamp=START + timedelta(minutes=30)))
+        return encode(rows)
+
+    monkeypatch.setattr(retention, 'encode_archive', encode_with_late_row)
+    assert VitalsArchiver.archive(NOW) == [(user_id, None, START.date(), 2)]
+    assert [row.value for row in HealthData.query.all()] == [99]
+    monkeypatch.undo()
+
+    assert VitalsArchiver.archive(NOW) == [(user_id, None, START.date(), 3)]
+    assert _january(user_id) == [60, 99, 61]
@@ -0,0 +1,19 @@
+from sqlalchemy import create_engine
+from models import db
+from utils import replicas
+
+
+def test_revoked_token_is_refused_while_replicas_lag(app, client, signup, monkeypatch, tmp_path):
+    _, headers = signup()
+    assert client.post('/api/v1/auth/logout', headers=headers).status_code == 200
+
+    # A replica that has not received the revocation yet serves every read
+    lagging = create_engine(f'sqlite:///{tmp_path / "replica.db"}')
+    db.metadata.create_all(lagging)
+    monkeypatch.setattr(replicas, '_choose_replica', lambda: lagging)
+    # Requests share the test's app context, so start from a session that has not written
+    db.session.remove()
+
+    response = client.get('/api/v1/family', headers=headers)
+    assert response.status_code == 401
+    assert response.json['msg'] == 'Token has been revoked'
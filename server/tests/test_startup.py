@@ -0,0 +1,16 @@
+import pytest
+from utils.startup import measure_startup
+
+
+def test_heavy_modules_load_lazily(app):
+    timings, _ = measure_startup(app.root_path)
+    assert timings['eager'] == [], f"Imported at start-up but meant to load lazily: {timings['eager']}"
+
+
+@pytest.mark.slow
+def test_import_and_create_app_stay_within_budget(app):
+    # Wall-clock time, so it is opt-in: shared CI machines are too noisy for it
+    timings, imports = measure_startup(app.root_path)
+    total = timings['import_ms'] + timings['create_app_ms']
+    slowest = ', '.join(f'{name} {cumulative / 1000:.0f} ms' for cumulative, name in imports[:5])
+    assert total <= app.config['STARTUP_BUDGET_MS'], f'Start-up took {total:.0f} ms; slowest: {slowest}'
@@ -0,0 +1,87 @@
+import io
+import time
+from datetime import datetime, timedelta
+import pytest
+from models import db, HealthData, ImportJob, ChangeLogEntry
+from utils.vitals_import import VitalsImporter, APPLE_HEALTH, CSV, normalize, fail_stale_jobs
+
+EXPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<HealthData>
+ <Record type="HKQuantityTypeIdentifierHeartRate" unit="count/min" value="72" startDate="2024-01-01 08:00:00 +0000"/>
+ <Record type="HKQuantityTypeIdentifierOxygenSaturation" unit="%" value="0.97" startDate="2024-01-01 08:00:00 +0000"/>
+ <Record type="HKQuantityTypeIdentifierBodyMass" unit="lb" value="154" startDate="2024-01-01 08:00:00 +0000"/>
+ <Record type="HKQuantityTypeIdentifierBodyMass" unit="stone" value="11" startDate="2024-01-01 08:00:00 +0000"/>
+</HealthData>
+"""
+
+CSV_EXPORT = b"""type,value,unit,timestamp
+Weight,154,lb,2024-01-01T08:00:00Z
+BodyTemperature,98.6,degF,2024-01-01T08:00:00Z
+OxygenSaturation,0.95,,2024-01-01T08:00:00Z
+Steps,100,,2024-01-01T09:00:00Z
+Weight,11,stone,2024-01-01T08:00:00Z
+"""
+
+
+def _stored(user_id):
+    return {(row.data_type, round(row.value, 2), row.unit)
+            for row in HealthData.query.filter_by(user_id=user_id)}
+
+
+@pytest.mark.parametrize('data_type, value, unit, expected', [
+    ('WEIGHT', 154, 'lb', (69.85, 'kg')),
+    ('BODY_TEMPERATURE', 98.6, 'degF', (37.0, 'degC')),
+    ('BLOOD_OXYGEN', 0.97, '%', (97.0, '%')),
+    ('BLOOD_OXYGEN', 96, None, (96.0, '%')),
+    ('HEART_RATE', 72, 'count/min', (72.0, 'bpm')),
+])
+def test_samples_are_stored_in_one_unit_per_type(data_type, value, unit, expected):
+    converted, stored_unit = normalize(data_type, value, unit)
+    assert (round(converted, 2), stored_unit) == expected
+
+
+def test_unknown_units_are_skipped():
+    assert normalize('WEIGHT', 11, 'stone') is None
+
+
+def test_apple_health_import(app, signup):
+    user_id, _ = signup()
+    imported, skipped = VitalsImporter(user_id).run(io.BytesIO(EXPORT), APPLE_HEALTH)
+
+    assert (imported, skipped) == (3, 1)
+    assert _stored(user_id) == {('HEART_RATE', 72.0, 'bpm'), ('BLOOD_OXYGEN', 97.0, '%'), ('WEIGHT', 69.85, 'kg')}
+    # Bulk inserts log their rows so /sync and live streams see them
+    assert ChangeLogEntry.query.filter_by(user_id=user_id, entity='health_data').count() == 3
+
+
+def test_csv_import(app, signup):
+    user_id, _ = signup()
+    imported, skipped = VitalsImporter(user_id).run(io.BytesIO(CSV_EXPORT), CSV)
+
+    assert (imported, skipped) == (4, 1)
+    assert _stored(user_id) == {('WEIGHT', 69.85, 'kg'), ('BODY_TEMPERATURE', 37.0, 'degC'),
+                                ('BLOOD_OXYGEN', 95.0, '%'), ('STEPS', 100.0, 'count')}
+
+
+def test_abandoned_jobs_stop_blocking_member_removal(app, client, signup, add_member):
+    user_id, headers = signup()
+    member_id = add_member(headers)
+    job = ImportJob(user_id=user_id, family_member_id=member_id, source_format=CSV, status='running')
+    db.session.add(job)
+    db.session.commit()
+
+    assert client.delete(f'/api/v1/family/{member_id}', headers=headers).status_code == 409
+    assert fail_stale_jobs() == 0
+
+    job.updated_at = datetime.utcnow() - timedelta(seconds=app.config['IMPORT_STALE_AFTER'] + 60)
+    db.session.commit()
+    response = client.delete(f'/api/v1/family/{member_id}', headers=headers)
+    assert response.status_code == 202
+    db.session.refresh(job)
+    assert job.status == 'failed'
+    # Let the removal worker finish before the fixture drops the tables under it
+    for _ in range(100):
+        status = client.get(f"/api/v1/family/removals/{response.json['removal_id']}", headers=headers).json
+        if status['status'] in ('completed', 'failed'):
+            break
+        time.sleep(0.05)
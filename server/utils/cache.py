@@ -0,0 +1,265 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect, select
+from models import db, User, FamilyMember, MedicalDocument
+
+try:
+    import redis
+except ImportError:  # redis is optional, the in-memory backend needs nothing
+    redis = None
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def family_key(user_id):
+    return f'family:{user_id}'
+
+
+def presigned_key(file_path):
+    return f'presigned:{file_path}'
+
+
+def analytics_version_key(user_id, family_member_id):
+    return f'analytics_version:{user_id}:{family_member_id or 0}'
+
+
+class MemoryBackend:
+    """LRU cache with per-entry expiry, local to one worker process"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return False
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def acquire_fill(self, key, timeout):
+        # Threads of this process are already coalesced by Cache.get_or_set
+        return True
+
+    def release_fill(self, key):
+        pass
+
+
+class RedisBackend:
+    """Cache shared by every worker and node through any Redis-protocol server"""
+
+    def __init__(self, client, prefix='cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        if redis is None:
+            raise RuntimeError('CACHE_URL needs the redis package installed')
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete_many(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)), nx=True))
+
+    def acquire_fill(self, key, timeout):
+        """Take the cross-process right to load a missing key"""
+        return bool(self.client.set(self.prefix + 'fill:' + key, 1, nx=True, px=int(timeout * 1000)))
+
+    def release_fill(self, key):
+        self.client.delete(self.prefix + 'fill:' + key)
+
+
+class Cache:
+    """
+    Shared cache for hot lookups, with a memory or Redis backend chosen by CACHE_URL
+
+    Values must be JSON-serializable. get_or_set() lets only one caller load a
+    missing key: other threads of the process wait for it, and with Redis
+    other workers poll for the value until the filler's lock expires. Entries
+    derived from User, FamilyMember and MedicalDocument rows are deleted when a
+    change to those rows commits.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 300
+        self.lock_timeout = 5
+        self._fill_locks = {}
+        self._fill_locks_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        app.config.setdefault('CACHE_URL', 'memory://')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('CACHE_LOCK_TIMEOUT', 5)
+
+        url = app.config['CACHE_URL']
+        if backend is None:
+            if url.startswith(('redis://', 'rediss://', 'unix://')):
+                backend = RedisBackend.from_url(url)
+            else:
+                backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        self.backend = backend
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.lock_timeout = app.config['CACHE_LOCK_TIMEOUT']
+        app.extensions['cache'] = self
+
+    def get(self, key):
+        return self.backend.get(key) if self.backend else None
+
+    def set(self, key, value, ttl=None):
+        if self.backend:
+            self.backend.set(key, value, ttl or self.default_ttl)
+
+    def delete_many(self, keys):
+        if self.backend and keys:
+            self.backend.delete_many(list(keys))
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it is missing; returns whether this call set it"""
+        if self.backend is None:
+            return True
+        return self.backend.add(key, value, ttl or self.default_ttl)
+
+    def _fill_lock(self, key):
+        with self._fill_locks_lock:
+            lock = self._fill_locks.get(key)
+            if lock is None:
+                lock = self._fill_locks[key] = [threading.Lock(), 0]
+            lock[1] += 1
+            return lock
+
+    def _drop_fill_lock(self, key, lock):
+        with self._fill_locks_lock:
+            lock[1] -= 1
+            if lock[1] == 0:
+                del self._fill_locks[key]
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() once to fill it on a miss"""
+        if self.backend is None:
+            return loader()
+        value = self.backend.get(key)
+        if value is not None:
+            return value
+
+        lock = self._fill_lock(key)
+        try:
+            with lock[0]:
+                value = self.backend.get(key)
+                if value is not None:
+                    return value
+                return self._fill(key, loader, ttl)
+        finally:
+            self._drop_fill_lock(key, lock)
+
+    def _fill(self, key, loader, ttl):
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.backend.acquire_fill(key, self.lock_timeout):
+            # Another worker is loading it; wait for its value, then give up and load too
+            time.sleep(0.05)
+            value = self.backend.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                return loader()
+        try:
+            value = loader()
+            if value is not None:
+                self.backend.set(key, value, ttl or self.default_ttl)
+            return value
+        finally:
+            self.backend.release_fill(key)
+
+
+cache = Cache()
+
+
+# Token rotation on every login must not flush cached profiles
+_UNCACHED_USER_FIELDS = {'refresh_token', 'password_hash', 'updated_at'}
+
+
+def _modified_fields(obj):
+    state = inspect(obj)
+    return {column.key for column in state.mapper.column_attrs if state.attrs[column.key].history.has_changes()}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_stale_keys(session, flush_context):
+    stale = session.info.setdefault('stale_cache_keys', set())
+    changed = set(session.new) | set(session.dirty) | set(session.deleted)
+    for obj in changed:
+        if isinstance(obj, User):
+            if obj in session.dirty and _UNCACHED_USER_FIELDS.issuperset(_modified_fields(obj)):
+                continue
+            stale.add(user_key(obj.id))
+            stale.add(family_key(obj.id))
+            if obj in session.new:
+                continue
+            # The profile also appears in every family list it belongs to
+            owners = session.connection().execute(
+                select(FamilyMember.user_id).where(FamilyMember.member_id == obj.id)
+            ).scalars()
+            stale.update(family_key(owner) for owner in owners)
+        elif isinstance(obj, FamilyMember):
+            stale.add(family_key(obj.user_id))
+        elif isinstance(obj, MedicalDocument) and obj not in session.new:
+            stale.add(presigned_key(obj.file_path))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_stale_keys(session):
+    stale = session.info.pop('stale_cache_keys', None)
+    if stale:
+        cache.delete_many(stale)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_stale_keys(session):
+    session.info.pop('stale_cache_keys', None)
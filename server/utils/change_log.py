@@ -0,0 +1,77 @@
+from collections import defaultdict
+from sqlalchemy import event, inspect, insert, select, update
+from models import db, User, FamilyMember, MedicalDocument, HealthData, ImportJob, ChangeLogEntry
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# Columns whose changes are invisible to clients, e.g. token rotation on every login
+_UNSYNCED_USER_FIELDS = {'refresh_token', 'password_hash', 'updated_at', 'change_seq'}
+
+
+def _user_fields_changed(user):
+    state = inspect(user)
+    changed = {column.key for column in state.mapper.column_attrs if state.attrs[column.key].history.has_changes()}
+    return not _UNSYNCED_USER_FIELDS.issuperset(changed)
+
+
+def record_changes(connection, changes):
+    """
+    Append (user ID, entity, entity ID, operation) tuples to the change log
+
+    Each user's log gets consecutive sequence numbers taken from users.change_seq.
+    Bumping that column locks the user's row until commit, so sequence numbers
+    become visible in order and a client never skips a change that commits late.
+    """
+    by_user = defaultdict(list)
+    for user_id, entity, entity_id, operation in changes:
+        by_user[user_id].append((entity, entity_id, operation))
+
+    rows = []
+    for user_id, entries in by_user.items():
+        last = connection.execute(
+            update(User.__table__)
+            .where(User.__table__.c.id == user_id)
+            .values(change_seq=User.__table__.c.change_seq + len(entries))
+            .returning(User.__table__.c.change_seq)
+        ).scalar()
+        if last is None:  # The user itself was deleted in this flush
+            continue
+        first = last - len(entries) + 1
+        rows.extend({
+            'user_id': user_id, 'seq': first + offset, 'entity': entity,
+            'entity_id': entity_id, 'operation': operation
+        } for offset, (entity, entity_id, operation) in enumerate(entries))
+
+    if rows:
+        connection.execute(insert(ChangeLogEntry.__table__), rows)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _log_flushed_changes(session, flush_context):
+    changes = []
+    deleted = set(session.deleted)
+    modified = {obj for obj in session.dirty if session.is_modified(obj, include_collections=False)}
+    for obj in set(session.new) | modified | deleted:
+        operation = DELETE if obj in deleted else UPSERT
+        if isinstance(obj, MedicalDocument):
+            changes.append((obj.user_id, 'document', obj.id, operation))
+        elif isinstance(obj, HealthData):
+            changes.append((obj.user_id, 'health_data', obj.id, operation))
+        elif isinstance(obj, FamilyMember):
+            changes.append((obj.user_id, 'family_member', obj.id, operation))
+        elif isinstance(obj, ImportJob) and obj.status in ('completed', 'failed') \
+                and inspect(obj).attrs.status.history.has_changes():
+            # Bulk imports bypass the ORM, so clients learn about them once the job finishes
+            changes.append((obj.user_id, 'import_job', obj.id, UPSERT))
+        elif isinstance(obj, User) and obj not in deleted and obj not in session.new and _user_fields_changed(obj):
+            changes.append((obj.id, 'user', obj.id, UPSERT))
+            # The profile also shows up in every household it belongs to
+            households = session.connection().execute(
+                select(FamilyMember.user_id, FamilyMember.id).where(FamilyMember.member_id == obj.id)
+            ).all()
+            changes.extend((owner_id, 'family_member', relationship_id, UPSERT)
+                           for owner_id, relationship_id in households)
+
+    if changes:
+        record_changes(session.connection(), changes)
@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+
+class Compression:
+    """Content-negotiated gzip/brotli compression for API responses"""
+
+    def __init__(self, app=None):
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_LEVEL', 5)
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 128)
+        app.config.setdefault('COMPRESS_MIMETYPES', [
+            'application/json',
+            'text/html',
+            'text/plain',
+            'text/csv',
+            'application/x-ndjson',
+        ])
+        self.app = app
+        app.after_request(self.after_request)
+
+    def _choose_encoding(self):
+        """Pick the best encoding the client accepts, preferring brotli"""
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def _compressor(self, encoding):
+        """Return (compress, flush) callables for a streaming compressor"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.app.config['COMPRESS_BR_LEVEL'])
+            return compressor.process, compressor.finish
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(self.app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+
+    def _compress(self, encoding, body):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.app.config['COMPRESS_BR_LEVEL'])
+        return gzip.compress(body, compresslevel=self.app.config['COMPRESS_LEVEL'])
+
+    def _compress_cached(self, encoding, body):
+        """Compress a body, reusing a previously compressed copy of identical content"""
+        cache_size = self.app.config['COMPRESS_CACHE_SIZE']
+        if cache_size <= 0:
+            return self._compress(encoding, body)
+
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        compressed = self._compress(encoding, body)
+        with self._cache_lock:
+            self._cache[key] = compressed
+            while len(self._cache) > cache_size:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def _stream(self, chunks, encoding):
+        compress, flush = self._compressor(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compress(chunk)
+                if data:
+                    yield data
+            yield flush()
+        finally:
+            # Let the wrapped iterable release its context (e.g. stream_with_context)
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def after_request(self, response):
+        config = self.app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in config['COMPRESS_MIMETYPES']):
+            return response
+
+        encoding = self._choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            # Size is unknown up front, so compress chunk by chunk as they are produced
+            response.response = self._stream(response.response, encoding)
+            response.headers['Content-Encoding'] = encoding
+            response.headers.pop('Content-Length', None)
+            return response
+
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        compressed = self._compress_cached(encoding, body)
+        if len(compressed) >= len(body):
+            # Incompressible payload, send it as is
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from models import db, DocumentUpload
+from utils.s3_utils import S3Utils, botocore_exceptions
+
+# S3's limits on multipart uploads; only the last part may be smaller than MIN_PART_SIZE
+MIN_PART_SIZE = 5 * 1024 ** 2
+MAX_PARTS = 10000
+
+
+def part_size_for(file_size):
+    """Configured part size, grown so the file fits in MAX_PARTS parts"""
+    size = max(current_app.config['MULTIPART_PART_SIZE'], MIN_PART_SIZE)
+    return max(size, -(-file_size // MAX_PARTS))
+
+
+def is_gone(error):
+    """Whether a ClientError means S3 no longer knows the upload"""
+    return isinstance(error, botocore_exceptions.ClientError) and \
+        error.response.get('Error', {}).get('Code') == 'NoSuchUpload'
+
+
+def missing_parts(upload, uploaded):
+    """Part numbers S3 has not received yet, or received with the wrong size"""
+    return [
+        number for number in range(1, upload.part_count + 1)
+        if number not in uploaded or uploaded[number]['size'] != upload.part_length(number)
+    ]
+
+
+def part_urls(upload, part_numbers):
+    """[{'part_number', 'size', 'url'}] for a batch of parts"""
+    urls = S3Utils.presign_upload_parts(
+        upload.file_path,
+        upload.upload_id,
+        [(number, upload.part_length(number)) for number in part_numbers],
+        expiration=current_app.config['MULTIPART_URL_EXPIRY']
+    )
+    return [{'part_number': number, 'size': upload.part_length(number), 'url': urls[number]}
+            for number in part_numbers]
+
+
+def describe(upload, uploaded=None):
+    """JSON for an upload, with the parts received so far when known"""
+    info = {
+        'upload_id': upload.id,
+        'status': upload.status,
+        's3_key': upload.file_path,
+        'file_size': upload.file_size,
+        'part_size': upload.part_size,
+        'part_count': upload.part_count,
+        'document_id': upload.document_id
+    }
+    if uploaded is not None:
+        info['uploaded_parts'] = sorted(uploaded)
+        info['missing_parts'] = missing_parts(upload, uploaded)
+    return info
+
+
+def stored_size(upload):
+    """Size of the assembled object, or None if S3 does not have it"""
+    try:
+        bucket_name, object_key = S3Utils.split_path(upload.file_path)
+        response = S3Utils.get_s3_client().head_object(Bucket=bucket_name, Key=object_key)
+        return response.get('ContentLength')
+    except botocore_exceptions.ClientError:
+        return None
+
+
+uploads_cli = AppGroup('uploads', help='Direct-to-S3 document uploads.')
+
+
+@uploads_cli.command('sweep')
+@click.option('--hours', type=int, default=None,
+              help='Abort uploads started this long ago. Defaults to MULTIPART_UPLOAD_EXPIRY_HOURS.')
+def sweep_command(hours):
+    """Abort multipart uploads that were never completed, so S3 drops their parts."""
+    hours = hours if hours is not None else current_app.config['MULTIPART_UPLOAD_EXPIRY_HOURS']
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    stale = DocumentUpload.query.filter(
+        DocumentUpload.status == 'uploading',
+        DocumentUpload.created_at < cutoff
+    ).order_by(DocumentUpload.id).all()
+
+    aborted = 0
+    for upload in stale:
+        if S3Utils.abort_multipart_upload(upload.file_path, upload.upload_id):
+            upload.status = 'aborted'
+            db.session.commit()
+            aborted += 1
+    click.echo(f'Aborted {aborted} of {len(stale)} stale uploads')
@@ -0,0 +1,132 @@
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from models import db, FamilyMember
+from utils.cache import cache
+
+
+def household_key(user_id):
+    return f'household:{user_id}'
+
+
+def memberships_key(member_id):
+    return f'memberships:{member_id}'
+
+
+def _as_id(value):
+    """An ID from a URL, form or JSON value, or None if it is not one"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FamilyGraph:
+    """
+    Adjacency index over FamilyMember edges, in both directions
+
+    A household maps an owner's user ID to {FamilyMember ID: member user ID},
+    memberships map a member's user ID to {owner user ID: FamilyMember ID}.
+    Each side is loaded with one query and kept in the shared cache, so with a
+    redis:// CACHE_URL every worker reads the same entries, and a committed
+    FamilyMember change deletes them for all of them. Entries also expire after
+    FAMILY_GRAPH_CACHE_TTL, which bounds how stale a per-process memory cache
+    can get. A refusal is checked against the database before it is returned,
+    so a member added through another worker is never turned away.
+    """
+
+    @staticmethod
+    def _ttl():
+        return current_app.config.get('FAMILY_GRAPH_CACHE_TTL', 60)
+
+    @staticmethod
+    def _load_household(user_id):
+        rows = db.session.execute(
+            select(FamilyMember.id, FamilyMember.member_id).where(FamilyMember.user_id == user_id)
+        ).all()
+        return [[relationship_id, member_id] for relationship_id, member_id in rows]
+
+    @staticmethod
+    def _load_memberships(member_id):
+        rows = db.session.execute(
+            select(FamilyMember.user_id, FamilyMember.id).where(FamilyMember.member_id == member_id)
+        ).all()
+        return [[user_id, relationship_id] for user_id, relationship_id in rows]
+
+    def household(self, user_id):
+        """Return {FamilyMember ID: member user ID} for the user's household"""
+        user_id = int(user_id)
+        pairs = cache.get_or_set(household_key(user_id), lambda: self._load_household(user_id), ttl=self._ttl())
+        return dict(pairs)
+
+    def memberships(self, member_id):
+        """Return {owner user ID: FamilyMember ID} for every household the profile belongs to"""
+        member_id = int(member_id)
+        pairs = cache.get_or_set(memberships_key(member_id), lambda: self._load_memberships(member_id), ttl=self._ttl())
+        return dict(pairs)
+
+    def _confirm(self, user_id, member_id, relationship_id=None):
+        """Look an edge up in the database, dropping the cached sides if it exists after all"""
+        query = select(FamilyMember.id).where(FamilyMember.user_id == user_id)
+        if relationship_id is not None:
+            query = query.where(FamilyMember.id == relationship_id)
+        else:
+            query = query.where(FamilyMember.member_id == member_id)
+        row = db.session.execute(query.limit(1)).first()
+        if row is None:
+            return False
+        self.invalidate(user_ids=[user_id], member_ids=[member_id] if member_id is not None else [])
+        return True
+
+    def owns(self, user_id, family_member_id):
+        """Check that a FamilyMember ID is part of the user's household"""
+        user_id, relationship_id = _as_id(user_id), _as_id(family_member_id)
+        if user_id is None or relationship_id is None:
+            return False
+        if relationship_id in self.household(user_id):
+            return True
+        return self._confirm(user_id, None, relationship_id)
+
+    def households_of(self, member_id):
+        """User IDs of everyone whose household includes this profile"""
+        return set(self.memberships(member_id))
+
+    def is_caregiver(self, user_id, member_id):
+        """Check that the user manages the member's profile in their household"""
+        user_id, member_id = _as_id(user_id), _as_id(member_id)
+        if user_id is None or member_id is None:
+            return False
+        if user_id in self.memberships(member_id):
+            return True
+        return self._confirm(user_id, member_id)
+
+    def can_access(self, user_id, profile_id):
+        """A profile is visible to itself and to every household it belongs to"""
+        user_id, profile_id = _as_id(user_id), _as_id(profile_id)
+        if user_id is None or profile_id is None:
+            return False
+        return user_id == profile_id or self.is_caregiver(user_id, profile_id)
+
+    def invalidate(self, user_ids=(), member_ids=()):
+        """Drop entries so every worker reloads them on next use"""
+        cache.delete_many([household_key(user_id) for user_id in user_ids]
+                          + [memberships_key(member_id) for member_id in member_ids])
+
+
+family_graph = FamilyGraph()
+
+
+# Keys join utils.cache's stale set, which is deleted from the shared cache on commit.
+# Bulk query.delete()/update() calls bypass these events and must call invalidate() themselves.
+@event.listens_for(db.session, 'after_flush')
+def _collect_family_changes(session, flush_context):
+    stale = session.info.setdefault('stale_cache_keys', set())
+    for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+        if isinstance(obj, FamilyMember):
+            state = inspect(obj)
+            # An edge that moved: both ends, old and new
+            for user_id in [obj.user_id, *state.attrs.user_id.history.deleted]:
+                stale.add(household_key(user_id))
+            for member_id in [obj.member_id, *state.attrs.member_id.history.deleted]:
+                stale.add(memberships_key(member_id))
@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import json
+import time
+from functools import wraps
+from flask import request, jsonify, make_response, current_app
+from flask_jwt_extended import get_jwt_identity
+from utils.cache import cache
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# How often a retry checks whether the first attempt has finished
+POLL_INTERVAL = 0.1
+
+
+def idempotency_key(user_id, endpoint, key):
+    return f'idempotency:{user_id}:{endpoint}:{key}'
+
+
+class IdempotencyStore:
+    """
+    Completed and in-flight idempotent requests, kept in the shared cache
+
+    An entry is {'fingerprint', 'response'}, with response None while the first
+    attempt runs and [status, base64 body, content type] once it has finished.
+    The first attempt claims its key with an atomic add, so with a redis://
+    CACHE_URL exactly one worker runs the view and retries on any worker wait
+    for its response.
+    """
+
+    def begin(self, key, fingerprint, lock_ttl):
+        """Return (entry, is_owner); the owner runs the request, others wait for its result"""
+        while True:
+            if cache.add(key, {'fingerprint': fingerprint, 'response': None}, lock_ttl):
+                return None, True
+            entry = cache.get(key)
+            if entry is not None:
+                return entry, False
+            # Expired or abandoned between the two calls; try to claim it again
+
+    def wait(self, key, timeout):
+        """The finished entry, or None if the attempt was abandoned or is still running after timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is None or entry['response'] is not None:
+                return entry
+        return None
+
+    def finish(self, key, fingerprint, response, ttl):
+        status, body, content_type = response
+        cache.set(key, {'fingerprint': fingerprint,
+                        'response': [status, base64.b64encode(body).decode('ascii'), content_type]}, ttl)
+
+    def abandon(self, key):
+        """Forget an attempt that must not be replayed, e.g. one that failed with a 5xx"""
+        cache.delete_many([key])
+
+
+store = IdempotencyStore()
+
+
+def _fingerprint():
+    """Hash what identifies the request without reading uploaded file contents"""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    if request.is_json:
+        digest.update(json.dumps(request.get_json(silent=True), sort_keys=True).encode())
+    else:
+        digest.update(json.dumps(sorted(request.form.items(multi=True))).encode())
+        for name, file in sorted(request.files.items(multi=True)):
+            digest.update(f'{name}:{file.filename}:{file.content_length}'.encode())
+    return digest.hexdigest()
+
+
+def _replay(entry):
+    status, body, content_type = entry['response']
+    response = make_response(base64.b64decode(body), status)
+    response.headers['Content-Type'] = content_type
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a write endpoint safe to retry with an Idempotency-Key header
+
+    The first request with a given key runs normally and its response is kept
+    for IDEMPOTENCY_TTL seconds. Retries with the same key get that response
+    back without running the view again, and a retry that arrives while the
+    first attempt is still running waits for it instead of racing it. 5xx
+    responses are not kept, so a failed attempt can be retried for real.
+    Must be applied below @jwt_required() so keys are scoped per user.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header_value = request.headers.get(HEADER)
+        if not header_value:
+            return view(*args, **kwargs)
+        if len(header_value) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        config = current_app.config
+        key = idempotency_key(get_jwt_identity(), request.endpoint, header_value)
+        fingerprint = _fingerprint()
+        entry, is_owner = store.begin(key, fingerprint, config['IDEMPOTENCY_LOCK_TTL'])
+
+        if not is_owner:
+            if entry['fingerprint'] != fingerprint:
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if entry['response'] is None:
+                entry = store.wait(key, config['IDEMPOTENCY_WAIT_TIMEOUT'])
+            if entry is None or entry['response'] is None:
+                return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+            return _replay(entry)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            store.abandon(key)
+            raise
+
+        if response.status_code >= 500 or response.is_streamed:
+            store.abandon(key)
+        else:
+            store.finish(key, fingerprint, (response.status_code, response.get_data(), response.content_type),
+                         config['IDEMPOTENCY_TTL'])
+        return response
+
+    return wrapper
@@ -0,0 +1,245 @@
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, delete, exists, func
+from sqlalchemy.exc import IntegrityError
+from models import (db, FamilyMember, MedicalDocument, HealthData, HealthDataArchive, HealthDataRollup,
+                    ImportJob, DocumentUpload, StorageUsage, MemberRemoval)
+from utils.storage import storage
+from utils.s3_utils import S3Utils
+from utils.sharding import shard_router
+from utils import vitals_analytics
+
+# Times the member's data is swept again when new rows arrive while it is being removed
+MAX_PASSES = 3
+
+
+class MemberRemover:
+    """
+    Removes a family member and everything filed under them, one batch at a time
+
+    Each batch picks at most MEMBER_REMOVAL_BATCH_SIZE rows by primary key and
+    deletes them (or, for documents, reassigns them) in its own short
+    transaction, so row locks last one batch and other users' writes never
+    queue behind the removal. Documents go through the ORM so storage usage,
+    the change log and caches follow along; health data, rollups and archive
+    rows are removed with DELETE ... WHERE id IN (...). Stored files are
+    deleted in bulk once the batch that dropped their rows has committed, so a
+    failure leaves orphaned files rather than rows pointing at missing ones.
+
+    The FamilyMember row goes last. Clients learn about the removed vitals from
+    its change log entry rather than one entry per deleted sample.
+    """
+
+    def __init__(self, removal, on_progress=None):
+        self.removal = removal
+        self.user_id = removal.user_id
+        self.member_id = removal.family_member_id
+        self.on_progress = on_progress
+        self.batch_size = current_app.config['MEMBER_REMOVAL_BATCH_SIZE']
+        self.pause = current_app.config['MEMBER_REMOVAL_BATCH_PAUSE']
+
+    def run(self):
+        """Remove everything, then the member; safe to run again after a failure"""
+        # Runs outside requests, so pick the household's shard explicitly
+        with shard_router.use(self.user_id):
+            self._run()
+
+    def _run(self):
+        removal = self.removal
+        removal.status = 'running'
+        removal.error = None
+        removal.documents_total = removal.documents_done + MedicalDocument.query.filter_by(
+            user_id=self.user_id, family_member_id=self.member_id
+        ).count()
+        removal.health_data_total = removal.health_data_done + db.session.execute(
+            select(func.count()).select_from(HealthData).where(self._owned(HealthData))
+        ).scalar()
+        db.session.commit()
+
+        for _ in range(MAX_PASSES):
+            self._remove_uploads()
+            self._remove_documents()
+            self._remove_health_data()
+            self._remove_rollups()
+            self._remove_archives()
+            self._remove_import_jobs()
+            if self._remove_member():
+                break
+        else:
+            raise RuntimeError('New data kept arriving for the family member')
+
+        vitals_analytics.cache.invalidate_member(self.user_id, self.member_id)
+        removal.status = 'completed'
+        db.session.commit()
+        self._report()
+
+    def _owned(self, model):
+        return (model.user_id == self.user_id) & (model.family_member_id == self.member_id)
+
+    def _report(self):
+        if self.on_progress is not None:
+            self.on_progress(self.removal)
+
+    def _batch_done(self, file_paths=()):
+        """Commit the batch, then delete its files and give other writers a turn"""
+        db.session.commit()
+        if file_paths:
+            failed = storage.delete_many(file_paths)
+            for file_path in failed:
+                current_app.logger.error(f"Member removal {self.removal.id} left file {file_path} behind")
+            self.removal.files_deleted += len(file_paths) - len(failed)
+            self.removal.files_failed += len(failed)
+            db.session.commit()
+        self._report()
+        if self.pause:
+            time.sleep(self.pause)
+
+    def _remove_uploads(self):
+        uploads = DocumentUpload.query.filter(self._owned(DocumentUpload)).all()
+        for upload in uploads:
+            if upload.status == 'uploading':
+                S3Utils.abort_multipart_upload(upload.file_path, upload.upload_id)
+            db.session.delete(upload)
+        if uploads:
+            db.session.commit()
+
+    def _remove_documents(self):
+        target = self.removal.reassign_documents_to
+        while True:
+            documents = MedicalDocument.query.filter(self._owned(MedicalDocument)) \
+                .order_by(MedicalDocument.id).limit(self.batch_size).all()
+            if not documents:
+                return
+            file_paths = []
+            for document in documents:
+                if target:
+                    document.family_member_id = target
+                else:
+                    file_paths.append(document.file_path)
+                    db.session.delete(document)
+            self.removal.documents_done += len(documents)
+            self._batch_done(file_paths)
+
+    def _remove_health_data(self):
+        while True:
+            # Oldest first, so on PostgreSQL each batch spans few monthly partitions and the
+            # timestamp bounds below let the DELETE skip the others
+            rows = db.session.execute(
+                select(HealthData.id, HealthData.timestamp)
+                .where(self._owned(HealthData))
+                .order_by(HealthData.timestamp, HealthData.id)
+                .limit(self.batch_size)
+            ).all()
+            if not rows:
+                return
+            db.session.execute(
+                delete(HealthData)
+                .where(HealthData.id.in_([row.id for row in rows]))
+                .where(HealthData.timestamp.between(rows[0].timestamp, rows[-1].timestamp)),
+                execution_options={'synchronize_session': False}
+            )
+            self.removal.health_data_done += len(rows)
+            self._batch_done()
+
+    def _remove_rollups(self):
+        while True:
+            ids = db.session.execute(
+                select(HealthDataRollup.id).where(self._owned(HealthDataRollup)).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return
+            db.session.execute(delete(HealthDataRollup).where(HealthDataRollup.id.in_(ids)),
+                               execution_options={'synchronize_session': False})
+            self._batch_done()
+
+    def _remove_archives(self):
+        while True:
+            rows = db.session.execute(
+                select(HealthDataArchive.id, HealthDataArchive.file_path)
+                .where(self._owned(HealthDataArchive))
+                .limit(self.batch_size)
+            ).all()
+            if not rows:
+                return
+            db.session.execute(delete(HealthDataArchive).where(HealthDataArchive.id.in_([row.id for row in rows])),
+                               execution_options={'synchronize_session': False})
+            self._batch_done([row.file_path for row in rows])
+
+    def _remove_import_jobs(self):
+        db.session.execute(delete(ImportJob).where(self._owned(ImportJob)),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+
+    def _remove_member(self):
+        """Delete the member unless rows were written for it meanwhile; returns whether it is gone"""
+        member = db.session.get(FamilyMember, self.member_id)
+        if member is None:
+            return True
+        for model in (MedicalDocument, HealthData, HealthDataRollup, HealthDataArchive, DocumentUpload):
+            if db.session.execute(select(exists().where(self._owned(model)))).scalar():
+                return False
+
+        db.session.execute(delete(StorageUsage).where(self._owned(StorageUsage)))
+        db.session.delete(member)
+        try:
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # A row for the member committed after the check above
+            db.session.rollback()
+            return False
+
+
+def run_member_removal(app, removal_id):
+    """Run a MemberRemoval to completion on a background thread"""
+    with app.app_context():
+        removal = db.session.get(MemberRemoval, removal_id)
+        try:
+            MemberRemover(removal).run()
+        except Exception as e:
+            current_app.logger.error(f"Member removal {removal_id} failed: {e}")
+            db.session.rollback()
+            removal.status = 'failed'
+            removal.error = str(e)
+            db.session.commit()
+
+
+def start_member_removal(removal):
+    app = current_app._get_current_object()
+    thread = threading.Thread(target=run_member_removal, args=(app, removal.id), daemon=True)
+    thread.start()
+    return thread
+
+
+removals_cli = AppGroup('removals', help='Family member removals.')
+
+
+@removals_cli.command('resume')
+@click.argument('removal_id', type=int, required=False)
+def resume_command(removal_id):
+    """Finish removals that failed or were cut short by a restart, or only REMOVAL_ID."""
+    query = MemberRemoval.query.filter(MemberRemoval.status != 'completed')
+    if removal_id is not None:
+        query = query.filter(MemberRemoval.id == removal_id)
+
+    def report(removal):
+        click.echo(f'Removal {removal.id}: {removal.documents_done}/{removal.documents_total} documents, '
+                   f'{removal.health_data_done}/{removal.health_data_total} vitals, '
+                   f'{removal.files_deleted} files deleted')
+
+    removals = query.order_by(MemberRemoval.id).all()
+    if not removals:
+        click.echo('No removals to resume')
+    for removal in removals:
+        try:
+            MemberRemover(removal, on_progress=report).run()
+            click.echo(f'Removal {removal.id} completed')
+        except Exception as e:
+            db.session.rollback()
+            removal.status = 'failed'
+            removal.error = str(e)
+            db.session.commit()
+            click.echo(f'Removal {removal.id} failed: {e}', err=True)
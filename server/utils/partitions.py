@@ -0,0 +1,159 @@
+import re
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text, inspect
+from models import db, HealthData
+
+PARENT_TABLE = 'health_data'
+DEFAULT_PARTITION = 'health_data_default'
+PARTITION_PATTERN = re.compile(r'^health_data_y(\d{4})m(\d{2})$')
+
+def partition_name(year, month):
+    """Name of the monthly health_data partition"""
+    return f'{PARENT_TABLE}_y{year:04d}m{month:02d}'
+
+
+def month_start(value):
+    """Midnight on the first day of value's month"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _engine():
+    """Engine holding health_data for the current shard scope (the primary when not sharded)"""
+    router = current_app.extensions.get('shard_router')
+    return router.scoped_engine() if router is not None else db.engine
+
+
+def _execute(statement):
+    """Run raw SQL on health_data's database within the session transaction"""
+    return db.session.execute(statement, bind_arguments={'mapper': HealthData})
+
+
+def include_name(name, type_, parent_names):
+    """Keep partitions out of Alembic autogenerate, they are managed by HealthDataPartitions"""
+    if type_ == 'table':
+        return name != DEFAULT_PARTITION and not PARTITION_PATTERN.match(name or '')
+    return True
+
+
+class HealthDataPartitions:
+    """
+    Monthly time partitioning of health_data
+
+    On PostgreSQL health_data is a native RANGE (timestamp) partitioned table,
+    so range filters on timestamp are pruned by the planner. Partitions are
+    created ahead of time by ensure(), normally from a daily cron running
+    `flask partitions ensure`, with a DEFAULT partition catching anything else.
+
+    SQLite has no partitioning and health_data stays a single table there;
+    ensure() does nothing and detach() refuses.
+    """
+
+    @staticmethod
+    def is_native():
+        return _engine().dialect.name == 'postgresql'
+
+    @staticmethod
+    def list_periods():
+        """Return sorted (year, month) tuples of existing partitions"""
+        periods = []
+        for name in inspect(_engine()).get_table_names():
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                periods.append((int(match.group(1)), int(match.group(2))))
+        return sorted(periods)
+
+    @staticmethod
+    def ensure(months_ahead=None, today=None):
+        """Create partitions from the current month through months_ahead months from now (PostgreSQL)"""
+        if not HealthDataPartitions.is_native():
+            return []
+        if months_ahead is None:
+            months_ahead = current_app.config['HEALTH_DATA_PARTITION_MONTHS_AHEAD']
+        first = month_start(today or datetime.utcnow())
+
+        created = []
+        existing = set(HealthDataPartitions.list_periods())
+        for offset in range(months_ahead + 1):
+            start = add_months(first, offset)
+            if (start.year, start.month) in existing:
+                continue
+            name = partition_name(start.year, start.month)
+            end = add_months(start, 1)
+            _execute(text(
+                f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} '
+                f"FOR VALUES FROM ('{start.date().isoformat()}') TO ('{end.date().isoformat()}')"
+            ))
+            created.append(name)
+        db.session.commit()
+        return created
+
+    @staticmethod
+    def detach(year, month, archive_schema=None):
+        """
+        Take one month out of the hot table (PostgreSQL)
+
+        The partition is detached (and optionally moved to an archive schema),
+        leaving a plain table that can be dumped or dropped without touching
+        the rest of health_data.
+        """
+        if not HealthDataPartitions.is_native():
+            raise RuntimeError('health_data is only partitioned on PostgreSQL')
+        name = partition_name(year, month)
+        _execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}'))
+        if archive_schema:
+            _execute(text(f'CREATE SCHEMA IF NOT EXISTS {archive_schema}'))
+            _execute(text(f'ALTER TABLE {name} SET SCHEMA {archive_schema}'))
+        db.session.commit()
+        return name
+
+
+partitions_cli = AppGroup('partitions', help='Manage health_data time partitions.')
+
+
+def _each_shard():
+    """Yield the health_data databases in turn, each as the current shard scope"""
+    router = current_app.extensions.get('shard_router')
+    if router is None or not router.enabled:
+        yield ''
+        return
+    for key in router.keys():
+        with router.use_shard(key):
+            yield f'{key}: '
+
+
+@partitions_cli.command('ensure')
+@click.option('--months-ahead', type=int, default=None, help='Months to create beyond the current one.')
+def ensure_command(months_ahead):
+    """Create upcoming monthly partitions."""
+    for prefix in _each_shard():
+        created = HealthDataPartitions.ensure(months_ahead)
+        click.echo(f"{prefix}Created {len(created)} partition(s): {', '.join(created) or '-'}")
+
+
+@partitions_cli.command('detach')
+@click.argument('period')
+@click.option('--archive-schema', default=None, help='PostgreSQL schema to move the detached table into.')
+def detach_command(period, archive_schema):
+    """Detach the partition for PERIOD (YYYY-MM) (PostgreSQL)."""
+    year, month = (int(part) for part in period.split('-'))
+    for prefix in _each_shard():
+        try:
+            click.echo(f'{prefix}Detached {HealthDataPartitions.detach(year, month, archive_schema)}')
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+
+
+@partitions_cli.command('list')
+def list_command():
+    """List existing partitions."""
+    for prefix in _each_shard():
+        for year, month in HealthDataPartitions.list_periods():
+            click.echo(f'{prefix}{partition_name(year, month)}')
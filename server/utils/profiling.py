@@ -0,0 +1,185 @@
+import cProfile
+import hashlib
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+try:
+    import pyinstrument
+except ImportError:  # Only needed for X-Profile-Format: pyinstrument
+    pyinstrument = None
+
+# Functions listed in a cProfile report, by cumulative time
+REPORT_LINES = 60
+
+
+def collapse_stacks(frames, names, skip=()):
+    """Yield one 'thread;outer;...;inner' line per thread from sys._current_frames()"""
+    for ident, frame in frames.items():
+        if ident in skip:
+            continue
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        stack.append(names.get(ident) or f'thread-{ident}')
+        yield ';'.join(reversed(stack))
+
+
+class StackSampler:
+    """
+    Statistical profiler for every thread of the process
+
+    Stacks are read from sys._current_frames() every interval seconds on the
+    calling thread, so nothing is installed in the profiled threads and the
+    cost is one stack walk per thread per sample. Greenlets under gevent show
+    up as the thread running the hub.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def run(self, seconds):
+        """Sample for seconds and return a Counter of collapsed stacks"""
+        counts = Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            counts.update(collapse_stacks(sys._current_frames(), names, skip=(me,)))
+            time.sleep(self.interval)
+        return counts
+
+
+def format_collapsed(counts):
+    """Collapsed-stack text as read by flamegraph.pl, speedscope and inferno"""
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+
+class Profiling:
+    """
+    Opt-in profiling of single requests and of the whole process
+
+    Nothing is installed unless PROFILING_ENABLED is set. When it is, a request
+    carrying a valid X-Profile header runs under cProfile (or pyinstrument with
+    X-Profile-Format: pyinstrument) and the report is returned in place of the
+    response body, with the original status in X-Profiled-Status. Other
+    requests only pay for one environ lookup.
+
+    Tokens are HMACs over the request path and an expiry, minted with
+    `flask profile token PATH`, so a leaked one profiles one endpoint for a
+    short while and nothing else.
+    """
+
+    def __init__(self, app=None):
+        self._sampling = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILING_ENABLED', False)
+        app.config.setdefault('PROFILING_SECRET_KEY', None)
+        app.config.setdefault('PROFILING_MAX_SECONDS', 60)
+        app.config.setdefault('PROFILING_SAMPLE_INTERVAL', 0.01)
+        self.secret = (app.config['PROFILING_SECRET_KEY'] or app.config['SECRET_KEY']).encode('utf-8')
+        app.extensions['profiling'] = self
+        if app.config['PROFILING_ENABLED']:
+            app.wsgi_app = _ProfilingMiddleware(app.wsgi_app, self)
+
+    def sign(self, path, expires):
+        message = f'{path}\n{expires}'.encode('utf-8')
+        return f'{expires}.{hmac.new(self.secret, message, hashlib.sha256).hexdigest()}'
+
+    def verify(self, token, path):
+        """Whether token was minted for path and has not expired"""
+        expires, _, _ = (token or '').partition('.')
+        try:
+            if int(expires) < time.time():
+                return False
+        except ValueError:
+            return False
+        return hmac.compare_digest(self.sign(path, int(expires)), token)
+
+    def sample(self, seconds, interval):
+        """Run a StackSampler unless one is already running; returns a Counter or None"""
+        if not self._sampling.acquire(blocking=False):
+            return None
+        try:
+            return StackSampler(interval).run(seconds)
+        finally:
+            self._sampling.release()
+
+
+class _ProfilingMiddleware:
+    def __init__(self, wsgi_app, profiling):
+        self.wsgi_app = wsgi_app
+        self.profiling = profiling
+
+    def __call__(self, environ, start_response):
+        token = environ.get('HTTP_X_PROFILE')
+        if token is None or not self.profiling.verify(token, environ.get('PATH_INFO', '')):
+            return self.wsgi_app(environ, start_response)
+
+        status = []
+
+        def capture(response_status, headers, exc_info=None):
+            status.append(response_status)
+            return lambda data: None
+
+        def run():
+            # The whole body is produced under the profiler, so do not profile endless streams
+            body = self.wsgi_app(environ, capture)
+            try:
+                for _ in body:
+                    pass
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+
+        if environ.get('HTTP_X_PROFILE_FORMAT') == 'pyinstrument' and pyinstrument is not None:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                run()
+            finally:
+                profiler.stop()
+            report = profiler.output_text(unicode=True, color=False)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                run()
+            finally:
+                profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(REPORT_LINES)
+            report = stream.getvalue()
+
+        data = report.encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(data))),
+            ('X-Profiled-Status', status[0] if status else ''),
+            ('Cache-Control', 'no-store')
+        ])
+        return [data]
+
+
+profile_cli = AppGroup('profile', help='On-demand profiling.')
+
+
+@profile_cli.command('token')
+@click.argument('path')
+@click.option('--ttl', type=int, default=300, show_default=True, help='Seconds the token stays valid.')
+def token_command(path, ttl):
+    """Mint a profiling token for requests to PATH."""
+    click.echo(current_app.extensions['profiling'].sign(path, int(time.time()) + ttl))
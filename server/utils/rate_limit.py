@@ -0,0 +1,215 @@
+import math
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity
+
+try:
+    import redis
+except ImportError:  # redis is optional, state stays in process memory without it
+    redis = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Refill and take one token atomically; the wait is returned as a string so Lua
+# does not truncate it to an integer
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + (now - tonumber(bucket[2])) * rate)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+def parse_limit(value):
+    """Parse "count/period" (e.g. "5/minute") into (capacity, tokens per second)"""
+    count, period = value.split('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip().rstrip('s')]
+
+
+class MemoryStorage:
+    """Token buckets and concurrency counters in process memory"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        # key -> (tokens, updated at, time the bucket is full again)
+        self._buckets = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        """Take one token, returning 0 or the seconds until one is available"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                self._sweep(now)
+            return wait
+
+    def _sweep(self, now):
+        # A full bucket is the same as no bucket, so those can be dropped
+        for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+
+    def acquire(self, key, limit):
+        with self._lock:
+            active = self._active.get(key, 0)
+            if active >= limit:
+                return False
+            self._active[key] = active + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            active = self._active.get(key, 0) - 1
+            if active > 0:
+                self._active[key] = active
+            else:
+                self._active.pop(key, None)
+
+
+class RedisStorage:
+    """Token buckets and concurrency counters shared by every worker through Redis"""
+
+    # Counters of crashed workers expire instead of blocking the endpoint forever
+    ACTIVE_TTL = 300
+
+    def __init__(self, url, prefix='ratelimit:'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate, now):
+        return float(self._take(keys=[self.prefix + key], args=[capacity, rate, now]))
+
+    def acquire(self, key, limit):
+        key = self.prefix + 'active:' + key
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.ACTIVE_TTL)
+        active, _ = pipe.execute()
+        if active > limit:
+            self.client.decr(key)
+            return False
+        return True
+
+    def release(self, key):
+        self.client.decr(self.prefix + 'active:' + key)
+
+
+class RateLimiter:
+    """
+    Per-user and per-IP token buckets plus per-endpoint concurrency caps
+
+    Limits are configured per endpoint name in RATELIMITS and applied with the
+    rate_limit() decorator. State lives in process memory by default, or in
+    Redis when RATELIMIT_STORAGE_URL points at one so all workers share it.
+    """
+
+    def __init__(self, app=None):
+        self.storage = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URL', 'memory://')
+        app.config.setdefault('RATELIMITS', {})
+
+        url = app.config['RATELIMIT_STORAGE_URL']
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            if redis is None:
+                raise RuntimeError('RATELIMIT_STORAGE_URL needs the redis package installed')
+            self.storage = RedisStorage(url)
+        else:
+            self.storage = MemoryStorage()
+
+        # Parse "count/period" strings once instead of on every request
+        self.limits = {}
+        for name, limits in app.config['RATELIMITS'].items():
+            self.limits[name] = {
+                'per_user': parse_limit(limits['per_user']) if limits.get('per_user') else None,
+                'per_ip': parse_limit(limits['per_ip']) if limits.get('per_ip') else None,
+                'concurrency': limits.get('concurrency')
+            }
+        app.extensions['rate_limiter'] = self
+
+    def check(self, name, user):
+        """Return the seconds to wait before retrying, or 0 if the request may proceed"""
+        limits = self.limits.get(name)
+        if limits is None:
+            return 0.0
+        now = time.time()
+        wait = 0.0
+        if limits['per_ip']:
+            wait = self.storage.take(f'{name}:ip:{request.remote_addr}', *limits['per_ip'], now)
+        if not wait and limits['per_user'] and user is not None:
+            wait = self.storage.take(f'{name}:user:{user}', *limits['per_user'], now)
+        return wait
+
+
+def _too_many(retry_after):
+    response = jsonify({'error': 'Too many requests, please try again later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(name, user_key=None):
+    """
+    Apply the RATELIMITS entry called name to a view
+
+    user_key returns the identity to limit per user; it defaults to the JWT
+    identity, so apply below @jwt_required() unless one is given. If the
+    limiter's storage is unreachable requests are let through.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('rate_limiter')
+            if limiter is None or not current_app.config['RATELIMIT_ENABLED']:
+                return view(*args, **kwargs)
+
+            concurrency = limiter.limits.get(name, {}).get('concurrency')
+            try:
+                wait = limiter.check(name, user_key() if user_key else get_jwt_identity())
+                if wait:
+                    return _too_many(wait)
+                if concurrency and not limiter.storage.acquire(name, concurrency):
+                    return _too_many(1)
+            except Exception as e:
+                current_app.logger.error(f"Rate limiter unavailable: {e}")
+                return view(*args, **kwargs)
+
+            if not concurrency:
+                return view(*args, **kwargs)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limiter.storage.release(name)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,153 @@
+import threading
+import time
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def _wrote_key(identity):
+    return f'primary_reads:{identity}'
+
+
+def _current_identity():
+    """JWT identity of the current request, if it has been verified"""
+    from flask_jwt_extended import get_jwt_identity
+    try:
+        return get_jwt_identity()
+    except RuntimeError:  # No @jwt_required() on this route
+        return None
+
+
+class _Replica:
+    def __init__(self, uri, engine_options):
+        self.uri = uri
+        self.engine = create_engine(uri, **engine_options)
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        event.listen(self.engine, 'handle_error', self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.mark_down()
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + current_app.config['REPLICA_RETRY_AFTER']
+
+    def available(self):
+        now = time.monotonic()
+        if self.down_until > now:
+            return False
+        if now - self.checked_at < current_app.config['REPLICA_HEALTH_CHECK_INTERVAL']:
+            return True
+        # One request per interval pays for the check, the others keep using the last result
+        if not self._lock.acquire(blocking=False):
+            return True
+        try:
+            self.checked_at = now
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return True
+        except Exception as e:
+            current_app.logger.warning(f"Read replica {self.engine.url!r} failed its health check: {e}")
+            self.mark_down()
+            return False
+        finally:
+            self._lock.release()
+
+
+class ReadReplicas:
+    """
+    Round-robin routing of read-only requests to SQLALCHEMY_REPLICA_URIS
+
+    GET and HEAD requests read from a healthy replica. Everything else, any
+    session that has written, and a user's requests for READ_YOUR_WRITES_SECONDS
+    after one of their commits use the primary, so a client never reads back
+    older data than it just wrote. The window is tracked in the shared cache,
+    so it holds across workers when CACHE_URL points at Redis.
+    """
+
+    def __init__(self, app=None):
+        self.replicas = []
+        self._next = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_HEALTH_CHECK_INTERVAL', 10)
+        app.config.setdefault('REPLICA_RETRY_AFTER', 30)
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.replicas = [_Replica(uri, options) for uri in app.config['SQLALCHEMY_REPLICA_URIS']]
+        app.extensions['read_replicas'] = self
+
+    def next_engine(self):
+        """Return the next healthy replica engine, or None to use the primary"""
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+            if replica.available():
+                return replica.engine
+        return None
+
+    def reads_pinned(self, identity):
+        cache = current_app.extensions.get('cache')
+        return identity is not None and cache is not None and cache.get(_wrote_key(identity)) is not None
+
+    def pin_reads(self, identity):
+        cache = current_app.extensions.get('cache')
+        if identity is not None and cache is not None:
+            cache.set(_wrote_key(identity), 1, ttl=current_app.config['READ_YOUR_WRITES_SECONDS'])
+
+
+def _choose_replica():
+    if not has_request_context() or request.method not in READ_METHODS:
+        return None
+    replicas = current_app.extensions.get('read_replicas')
+    if not replicas or not replicas.replicas or replicas.reads_pinned(_current_identity()):
+        return None
+    return replicas.next_engine()
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session that sends health_data statements to their shard
+    and read-only requests to a read replica
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shards = current_app.extensions.get('shard_router')
+        if bind is None and shards is not None and shards.enabled:
+            shard = shards.route(mapper, clause)
+            if shard is not None:
+                return shard
+
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        # Explicit binds and other bind keys are left alone
+        if bind is not None or primary is not self._db.engines.get(None):
+            return primary
+
+        if self._flushing or getattr(clause, 'is_dml', False):
+            # Once a session writes, it reads its own writes from the primary too
+            self.info['read_replica'] = False
+            self.info['wrote'] = True
+            return primary
+
+        replica = self.info.get('read_replica')
+        if replica is None:
+            replica = self.info['read_replica'] = _choose_replica() or False
+        return replica or primary
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_reads_after_write(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        replicas = current_app.extensions.get('read_replicas')
+        if replicas and replicas.replicas:
+            replicas.pin_reads(_current_identity())
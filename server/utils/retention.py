@@ -0,0 +1,300 @@
+import io
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, delete, func
+from models import db, HealthData, HealthDataArchive, HealthDataRollup
+from utils.partitions import month_start, add_months
+from utils.storage import storage
+from utils.sharding import shard_router
+from utils.lazy_import import lazy_import
+from utils.cache import cache, analytics_version_key
+
+np = lazy_import('numpy')
+
+ARCHIVE_MIMETYPE = 'application/x-npz'
+
+# Columns stored in each archive file; strings use fixed-width unicode so
+# the file loads without pickle
+ARCHIVE_COLUMNS = ('id', 'timestamp', 'value', 'data_type', 'unit', 'source')
+
+
+# health_data rows deleted per statement once archived, within SQLite's bound parameter limit
+DELETE_BATCH_SIZE = 500
+
+
+def _archive_key(user_id, family_member_id, period_start):
+    """A fresh key on every write, so a merge never overwrites the file readers are using"""
+    prefix = current_app.config['VITALS_ARCHIVE_PREFIX']
+    member = f'member_{family_member_id}' if family_member_id else 'self'
+    return f"{prefix}/user_{user_id}/{member}/{period_start:%Y-%m}-{uuid.uuid4().hex}.npz"
+
+
+def encode_archive(rows):
+    """Pack (id, timestamp, value, data_type, unit, source) rows into a compressed .npz"""
+    count = len(rows)
+    columns = {
+        'id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+        'timestamp': np.array([row[1] for row in rows], dtype='datetime64[ms]').astype(np.int64),
+        'value': np.fromiter((row[2] for row in rows), dtype=np.float64, count=count),
+        'data_type': np.array([row[3] for row in rows], dtype=str),
+        'unit': np.array([row[4] or '' for row in rows], dtype=str),
+        'source': np.array([row[5] or '' for row in rows], dtype=str),
+    }
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **columns)
+    return buffer.getvalue()
+
+
+def decode_archive(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        return {column: archive[column] for column in ARCHIVE_COLUMNS}
+
+
+def daily_rollups(timestamps, values, data_types):
+    """Aggregate raw samples into per (data_type, day) count/sum/min/max"""
+    days = timestamps // (86400 * 1000)
+    keys, inverse = np.unique(np.rec.fromarrays([data_types, days]), return_inverse=True)
+    counts = np.bincount(inverse)
+    totals = np.bincount(inverse, weights=values)
+    minimums = np.full(len(keys), np.inf)
+    maximums = np.full(len(keys), -np.inf)
+    np.minimum.at(minimums, inverse, values)
+    np.maximum.at(maximums, inverse, values)
+    for key, count, total, minimum, maximum in zip(keys, counts, totals, minimums, maximums):
+        yield str(key[0]), np.datetime64(int(key[1]), 'D').item(), int(count), float(total), \
+            float(minimum), float(maximum)
+
+
+class _ArchiveCache:
+    """
+    Decoded archive files kept in memory, bounded by entry count
+
+    Decoded columns are numpy arrays, which the shared cache cannot hold, so
+    each worker keeps its own. Entries are keyed by (file_path, row_count), both
+    read from the HealthDataArchive row. Archives are never rewritten in place:
+    a merge writes a new file and repoints the row, so every worker misses on
+    the new key and the stale entry simply ages out.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(archive):
+        return archive.file_path, archive.row_count
+
+    def get(self, archive):
+        key = self.key(archive)
+        with self._lock:
+            columns = self._entries.get(key)
+            if columns is not None:
+                self._entries.move_to_end(key)
+            return columns
+
+    def set(self, archive, columns):
+        with self._lock:
+            self._entries[self.key(archive)] = columns
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, file_path):
+        """Drop every entry for a file that is being rewritten"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == file_path]:
+                del self._entries[key]
+
+
+archive_cache = _ArchiveCache()
+
+
+class VitalsArchiver:
+    """
+    Tiered retention for raw HealthData
+
+    Whole member-months older than VITALS_RETENTION_DAYS are written to storage as
+    compressed columnar .npz files, summarised into HealthDataRollup rows and
+    deleted from the hot table. VitalsSeries.load() reads archived months back
+    through load_archived() when a query reaches past the retention horizon.
+    """
+
+    @staticmethod
+    def cutoff(now=None):
+        """First instant that is still kept hot; only months entirely before it are archived"""
+        days = current_app.config['VITALS_RETENTION_DAYS']
+        return month_start((now or datetime.utcnow()) - timedelta(days=days))
+
+    @staticmethod
+    def archive(now=None):
+        """Archive every eligible member-month, one transaction each"""
+        cutoff = VitalsArchiver.cutoff(now)
+        period = func.min(HealthData.timestamp)
+        groups = []
+        for shard in shard_router.keys():
+            with shard_router.use_shard(shard):
+                groups += db.session.execute(
+                    select(HealthData.user_id, HealthData.family_member_id, period)
+                    .where(HealthData.timestamp < cutoff)
+                    .group_by(HealthData.user_id, HealthData.family_member_id)
+                ).all()
+
+        archived = []
+        for user_id, family_member_id, oldest in groups:
+            start = month_start(oldest)
+            while start < cutoff:
+                with shard_router.use(user_id):
+                    row_count = VitalsArchiver.archive_month(user_id, family_member_id, start)
+                if row_count:
+                    archived.append((user_id, family_member_id, start.date(), row_count))
+                start = add_months(start, 1)
+        return archived
+
+    @staticmethod
+    def archive_month(user_id, family_member_id, start):
+        """Move one member-month of raw samples to storage, keeping daily rollups"""
+        if shard_router.is_moving(user_id):
+            # The move would copy rows this deletes; the next run picks the month up
+            return 0
+        end = add_months(start, 1)
+        in_month = (
+            (HealthData.user_id == user_id)
+            & (HealthData.family_member_id.is_(None) if family_member_id is None
+               else HealthData.family_member_id == family_member_id)
+            & (HealthData.timestamp >= start)
+            & (HealthData.timestamp < end)
+        )
+        rows = db.session.execute(
+            select(HealthData.id, HealthData.timestamp, HealthData.value,
+                   HealthData.data_type, HealthData.unit, HealthData.source)
+            .where(in_month)
+            .order_by(HealthData.timestamp, HealthData.id)
+        ).all()
+        if not rows:
+            return 0
+        # Only these rows leave health_data; anything committed meanwhile waits for the next run
+        archived_ids = [row.id for row in rows]
+
+        existing = HealthDataArchive.query.filter_by(
+            user_id=user_id, family_member_id=family_member_id, period_start=start.date()
+        ).first()
+        if existing:
+            # Late samples for an archived month: merge them with the existing file into a new one
+            previous = storage.download_bytes(existing.file_path)
+            if previous is None:
+                raise RuntimeError(f'Could not read archive {existing.file_path}')
+            old = decode_archive(previous)
+            rows = [
+                (int(row_id), datetime(1970, 1, 1) + timedelta(milliseconds=int(ts)), float(value),
+                 str(data_type), str(unit) or None, str(source) or None)
+                for row_id, ts, value, data_type, unit, source in zip(*(old[c] for c in ARCHIVE_COLUMNS))
+            ] + list(rows)
+            rows.sort(key=lambda row: (row[1], row[0]))
+
+        data = encode_archive(rows)
+        success, file_path = storage.upload_bytes(
+            data, _archive_key(user_id, family_member_id, start), ARCHIVE_MIMETYPE
+        )
+        if not success:
+            raise RuntimeError(f'Failed to upload archive: {file_path}')
+
+        try:
+            columns = decode_archive(data)
+            # Rollups are rebuilt for the whole month so a merged file stays consistent
+            db.session.execute(delete(HealthDataRollup).where(
+                (HealthDataRollup.user_id == user_id)
+                & (HealthDataRollup.family_member_id.is_(None) if family_member_id is None
+                   else HealthDataRollup.family_member_id == family_member_id)
+                & (HealthDataRollup.day >= start.date())
+                & (HealthDataRollup.day < end.date())
+            ))
+            db.session.add_all(
+                HealthDataRollup(user_id=user_id, family_member_id=family_member_id, data_type=data_type,
+                                 day=day, count=count, total=total, minimum=minimum, maximum=maximum)
+                for data_type, day, count, total, minimum, maximum in daily_rollups(
+                    columns['timestamp'], columns['value'], columns['data_type'])
+            )
+
+            replaced = None
+            if existing:
+                archive_cache.discard(existing.file_path)
+                # Readers keep using the old file until this commits
+                replaced = existing.file_path
+                existing.file_path = file_path
+                existing.row_count = len(rows)
+            else:
+                db.session.add(HealthDataArchive(
+                    user_id=user_id, family_member_id=family_member_id,
+                    period_start=start.date(), file_path=file_path, row_count=len(rows)
+                ))
+            for offset in range(0, len(archived_ids), DELETE_BATCH_SIZE):
+                db.session.execute(delete(HealthData).where(
+                    in_month, HealthData.id.in_(archived_ids[offset:offset + DELETE_BATCH_SIZE])
+                ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Nothing points at the new file
+            storage.delete_many([file_path])
+            raise
+
+        # Bulk deletes bypass the session events that retire cached analytics
+        cache.delete_many([analytics_version_key(user_id, family_member_id)])
+        # Only once the row points at the new file, so a failure leaves an orphan rather than a dangling path
+        if replaced and storage.delete_many([replaced]):
+            current_app.logger.error(f"Archive merge left old file {replaced} behind")
+        return len(rows)
+
+    @staticmethod
+    def load_archived(user_id, family_member_id, data_type, start=None, end=None):
+        """
+        Read one series back from archive files overlapping [start, end)
+
+        Returns:
+            Tuple of (timestamps as int64 ms since epoch, values as float64), oldest first
+        """
+        query = HealthDataArchive.query.filter_by(user_id=user_id, family_member_id=family_member_id or None)
+        if end is not None:
+            query = query.filter(HealthDataArchive.period_start <= end.date())
+        if start is not None:
+            query = query.filter(HealthDataArchive.period_start >= month_start(start).date())
+        archives = query.order_by(HealthDataArchive.period_start).all()
+
+        timestamps, values = [], []
+        for archive in archives:
+            columns = archive_cache.get(archive)
+            if columns is None:
+                data = storage.download_bytes(archive.file_path)
+                if data is None:
+                    raise RuntimeError(f'Could not read archive {archive.file_path}')
+                columns = decode_archive(data)
+                archive_cache.set(archive, columns)
+
+            mask = columns['data_type'] == data_type
+            if start is not None:
+                mask &= columns['timestamp'] >= int(np.datetime64(start, 'ms').astype(np.int64))
+            if end is not None:
+                mask &= columns['timestamp'] < int(np.datetime64(end, 'ms').astype(np.int64))
+            timestamps.append(columns['timestamp'][mask])
+            values.append(columns['value'][mask])
+
+        if not timestamps:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(timestamps), np.concatenate(values)
+
+
+vitals_cli = AppGroup('vitals', help='Manage stored vitals.')
+
+
+@vitals_cli.command('archive')
+def archive_command():
+    """Archive raw vitals older than VITALS_RETENTION_DAYS to storage."""
+    archived = VitalsArchiver.archive()
+    for user_id, family_member_id, period_start, row_count in archived:
+        click.echo(f'user {user_id} member {family_member_id or "self"} {period_start:%Y-%m}: {row_count} rows')
+    click.echo(f'Archived {len(archived)} member-month(s)')
@@ -0,0 +1,175 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_jwt_extended import decode_token
+from sqlalchemy import select, delete, insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, RevokedToken
+
+_UPSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+# Seconds of revocations re-read on every sync, covering transactions that commit late
+SYNC_LOOKBACK = 60
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing of one blake2b digest"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TokenRevocations:
+    """
+    jti blocklist for flask_jwt_extended that answers most checks from memory
+
+    Every worker keeps a Bloom filter of revoked jtis, topped up from the
+    revoked_tokens table every REVOCATION_SYNC_INTERVAL seconds and rebuilt
+    from live rows every REVOCATION_REBUILD_INTERVAL seconds so pruned entries
+    drop out. A token that misses the filter is accepted after a few hash
+    probes; only filter hits are confirmed against the table. Revocations made
+    by other workers take effect after at most one sync interval.
+    """
+
+    def __init__(self, app=None, jwt=None):
+        self.filter = None
+        self._synced_wall = None
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, jwt)
+
+    def init_app(self, app, jwt):
+        app.config.setdefault('REVOCATION_SYNC_INTERVAL', 5)
+        app.config.setdefault('REVOCATION_REBUILD_INTERVAL', 3600)
+        app.config.setdefault('REVOCATION_FILTER_CAPACITY', 100000)
+        app.config.setdefault('REVOCATION_FILTER_ERROR_RATE', 0.001)
+        jwt.token_in_blocklist_loader(self._check_blocklist)
+        app.extensions['token_revocations'] = self
+
+    @staticmethod
+    def _read(statement):
+        # Straight on the primary engine: the check runs before the request's identity is known,
+        # so through the session it could land on a replica that has not seen the revocation yet,
+        # and would keep the session on that replica for the rest of the request
+        with db.engine.connect() as connection:
+            return connection.execute(statement).scalars().all()
+
+    def _rebuild(self):
+        config = current_app.config
+        synced_wall = datetime.utcnow()
+        jtis = self._read(select(RevokedToken.jti).where(RevokedToken.expires_at > synced_wall))
+        capacity = max(config['REVOCATION_FILTER_CAPACITY'], 2 * len(jtis))
+        bloom = BloomFilter(capacity, config['REVOCATION_FILTER_ERROR_RATE'])
+        for jti in jtis:
+            bloom.add(jti)
+        self.filter = bloom
+        self._built_at = self._synced_at = time.monotonic()
+        self._synced_wall = synced_wall
+
+    def _sync(self):
+        """Add rows revoked since the last sync, or rebuild when due or the filter is full"""
+        now = time.monotonic()
+        config = current_app.config
+        if now - self._synced_at < config['REVOCATION_SYNC_INTERVAL']:
+            return
+        # Only one request per worker pays for the sync; the rest use the filter as it is
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self.filter is None or now - self._built_at >= config['REVOCATION_REBUILD_INTERVAL'] \
+                    or self.filter.count >= self.filter.capacity:
+                self._rebuild()
+                return
+            since = self._synced_wall - timedelta(seconds=SYNC_LOOKBACK)
+            synced_wall = datetime.utcnow()
+            jtis = self._read(select(RevokedToken.jti).where(RevokedToken.created_at >= since))
+            for jti in jtis:
+                if jti not in self.filter:
+                    self.filter.add(jti)
+            self._synced_at = now
+            self._synced_wall = synced_wall
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, jti):
+        if self.filter is None:
+            with self._lock:
+                if self.filter is None:
+                    self._rebuild()
+        else:
+            self._sync()
+        if jti not in self.filter:
+            return False
+        # Possible false positive: confirm against the table
+        return bool(self._read(select(RevokedToken.id).where(RevokedToken.jti == jti).limit(1)))
+
+    def _check_blocklist(self, jwt_header, jwt_payload):
+        return self.is_revoked(jwt_payload['jti'])
+
+    def revoke(self, jwt_payload):
+        """Add a decoded token to the revocation table, if it is not there yet; the caller commits"""
+        expires_at = datetime.fromtimestamp(jwt_payload['exp'], tz=timezone.utc).replace(tzinfo=None) \
+            if 'exp' in jwt_payload else datetime.max
+        identity = jwt_payload.get(current_app.config['JWT_IDENTITY_CLAIM'])
+        values = {
+            'jti': jwt_payload['jti'],
+            'token_type': jwt_payload.get('type', 'access'),
+            'user_id': identity if isinstance(identity, int) else None,
+            'expires_at': expires_at
+        }
+        # Logging out twice or revoking a stolen token again must not trip the unique jti
+        upsert = _UPSERTS.get(db.session.get_bind(RevokedToken).dialect.name)
+        if upsert is not None:
+            db.session.execute(upsert(RevokedToken).values(**values).on_conflict_do_nothing(index_elements=['jti']))
+        elif db.session.execute(select(RevokedToken.id).where(RevokedToken.jti == values['jti'])).first() is None:
+            db.session.execute(insert(RevokedToken).values(**values))
+        # Effective in this worker right away, in the others after their next sync
+        if self.filter is not None:
+            self.filter.add(jwt_payload['jti'])
+
+
+tokens_cli = AppGroup('tokens', help='Manage revoked tokens.')
+
+
+@tokens_cli.command('revoke')
+@click.argument('token')
+def revoke_command(token):
+    """Revoke an encoded JWT, e.g. one reported stolen."""
+    current_app.extensions['token_revocations'].revoke(decode_token(token, allow_expired=True))
+    db.session.commit()
+    click.echo('Token revoked')
+
+
+@tokens_cli.command('prune')
+def prune_command():
+    """Delete revocations of tokens that have expired anyway."""
+    result = db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    click.echo(f'Pruned {result.rowcount} expired revocation(s)')
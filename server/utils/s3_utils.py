@@ -1,10 +1,12 @@
 import os
-import boto3
 import uuid
 from werkzeug.utils import secure_filename
-from botocore.exceptions import ClientError
 from flask import current_app
-from botocore.config import Config
+from utils.lazy_import import lazy_import
+
+boto3 = lazy_import('boto3')
+botocore_config = lazy_import('botocore.config')
+botocore_exceptions = lazy_import('botocore.exceptions')
 
 class S3Utils:
     """Utility for handling S3 operations"""
@@ -12,16 +14,12 @@ class S3Utils:
     @staticmethod
     def get_s3_client():
         """Get configured S3 client"""
-        print(current_app.config['AWS_ACCESS_KEY'])
-        print(current_app.config['AWS_SECRET_KEY'])
-        print(current_app.config['AWS_REGION'])
-        print(current_app.config['S3_BUCKET_NAME'])
         return boto3.client(
             's3',
             aws_access_key_id=current_app.config['AWS_ACCESS_KEY'],
             aws_secret_access_key=current_app.config['AWS_SECRET_KEY'],
             region_name=current_app.config['AWS_REGION'],
-            config=Config(signature_version='s3v4'),
+            config=botocore_config.Config(signature_version='s3v4'),
         )
     
     @staticmethod
@@ -65,7 +63,7 @@ class S3Utils:
             
             return True, file_url
         
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             current_app.logger.error(f"Error uploading to S3: {e}")
             return False, str(e)
         except Exception as e:
@@ -94,7 +92,7 @@ class S3Utils:
                 return None
                 
             s3_client = S3Utils.get_s3_client()
-            print(f"Bucket: {bucket_name}, Key: {object_key}")
+            current_app.logger.debug('Presigning S3 object', extra={'bucket': bucket_name, 'key': object_key})
             
             # Generate the presigned URL
             url = s3_client.generate_presigned_url(
@@ -108,9 +106,223 @@ class S3Utils:
             
             return url
         
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             current_app.logger.error(f"Error generating presigned URL: {e}")
             return None
         except Exception as e:
             current_app.logger.error(f"Unexpected error: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    @staticmethod
+    def upload_bytes(data, s3_path, content_type='application/octet-stream'):
+        """
+        Upload an in-memory payload to S3
+        
+        Args:
+            data: Bytes to upload
+            s3_path: Object key inside the configured bucket
+            content_type: MIME type stored with the object
+            
+        Returns:
+            Tuple of (success, file_path or error_message)
+        """
+        try:
+            s3_client = S3Utils.get_s3_client()
+            bucket_name = current_app.config['S3_BUCKET_NAME']
+            
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=s3_path,
+                Body=data,
+                ContentType=content_type
+            )
+            
+            return True, f"s3://{bucket_name}/{s3_path}"
+        
+        except botocore_exceptions.ClientError as e:
+            current_app.logger.error(f"Error uploading to S3: {e}")
+            return False, str(e)
+        except Exception as e:
+            current_app.logger.error(f"Unexpected error: {e}")
+            return False, str(e)
+    
+    @staticmethod
+    def download_bytes(file_path):
+        """
+        Download an object into memory
+        
+        Args:
+            file_path: S3 path for the file (s3://bucket-name/path/to/file)
+            
+        Returns:
+            Object contents as bytes or None if error
+        """
+        try:
+            if not file_path.startswith('s3://'):
+                return None
+            bucket_name, object_key = file_path[5:].split('/', 1)
+            
+            s3_client = S3Utils.get_s3_client()
+            response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+            return response['Body'].read()
+        
+        except botocore_exceptions.ClientError as e:
+            current_app.logger.error(f"Error downloading from S3: {e}")
+            return None
+        except Exception as e:
+            current_app.logger.error(f"Unexpected error: {e}")
+            return None
+    
+    @staticmethod
+    def split_path(file_path):
+        """Return (bucket, key) for an s3://bucket-name/path/to/file path, or None"""
+        if not file_path or not file_path.startswith('s3://'):
+            return None
+        bucket_name, _, object_key = file_path[5:].partition('/')
+        return (bucket_name, object_key) if object_key else None
+    
+    @staticmethod
+    def create_multipart_upload(s3_path, content_type='application/octet-stream'):
+        """
+        Start a multipart upload inside the configured bucket
+        
+        Args:
+            s3_path: Object key the parts will be assembled into
+            content_type: MIME type stored with the object
+            
+        Returns:
+            Tuple of (file_path, S3 UploadId)
+        """
+        s3_client = S3Utils.get_s3_client()
+        bucket_name = current_app.config['S3_BUCKET_NAME']
+        response = s3_client.create_multipart_upload(Bucket=bucket_name, Key=s3_path, ContentType=content_type)
+        return f"s3://{bucket_name}/{s3_path}", response['UploadId']
+    
+    @staticmethod
+    def presign_upload_parts(file_path, upload_id, parts, expiration=3600):
+        """
+        Generate presigned PUT URLs for parts of a multipart upload
+        
+        Args:
+            file_path: S3 path the upload was started for
+            upload_id: S3 UploadId
+            parts: Iterable of (part_number, size); the size is signed, so S3
+                refuses a part body of any other length
+            expiration: URL expiration time in seconds
+            
+        Returns:
+            Dict of part number to presigned URL
+        """
+        bucket_name, object_key = S3Utils.split_path(file_path)
+        # Signing is local, so one client serves the whole batch without a request per URL
+        s3_client = S3Utils.get_s3_client()
+        return {
+            part_number: s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': bucket_name,
+                    'Key': object_key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number,
+                    'ContentLength': size
+                },
+                ExpiresIn=expiration
+            )
+            for part_number, size in parts
+        }
+    
+    @staticmethod
+    def list_uploaded_parts(file_path, upload_id):
+        """
+        List the parts S3 has received for a multipart upload
+        
+        Returns:
+            Dict of part number to {'etag', 'size'}
+        """
+        bucket_name, object_key = S3Utils.split_path(file_path)
+        s3_client = S3Utils.get_s3_client()
+        paginator = s3_client.get_paginator('list_parts')
+        parts = {}
+        for page in paginator.paginate(Bucket=bucket_name, Key=object_key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                parts[part['PartNumber']] = {'etag': part['ETag'], 'size': part['Size']}
+        return parts
+    
+    @staticmethod
+    def complete_multipart_upload(file_path, upload_id, parts):
+        """
+        Assemble uploaded parts into the final object
+        
+        Args:
+            file_path: S3 path the upload was started for
+            upload_id: S3 UploadId
+            parts: Dict of part number to ETag
+        """
+        bucket_name, object_key = S3Utils.split_path(file_path)
+        s3_client = S3Utils.get_s3_client()
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=object_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': number, 'ETag': parts[number]} for number in sorted(parts)
+            ]}
+        )
+    
+    @staticmethod
+    def abort_multipart_upload(file_path, upload_id):
+        """
+        Abort a multipart upload so S3 drops the parts stored so far
+        
+        Returns:
+            True if aborted or already gone, False if error
+        """
+        try:
+            bucket_name, object_key = S3Utils.split_path(file_path)
+            s3_client = S3Utils.get_s3_client()
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
+            return True
+        
+        except botocore_exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+                return True
+            current_app.logger.error(f"Error aborting multipart upload: {e}")
+            return False
+        except Exception as e:
+            current_app.logger.error(f"Unexpected error: {e}")
+            return False
+    
+    @staticmethod
+    def delete_objects(file_paths):
+        """
+        Delete objects in bulk, up to 1000 per DeleteObjects request
+        
+        Args:
+            file_paths: S3 paths (s3://bucket-name/path/to/file)
+            
+        Returns:
+            List of the paths that could not be deleted
+        """
+        by_bucket = {}
+        failed = []
+        for file_path in file_paths:
+            parts = S3Utils.split_path(file_path)
+            if parts is None:
+                failed.append(file_path)
+                continue
+            by_bucket.setdefault(parts[0], []).append(parts[1])
+        
+        s3_client = S3Utils.get_s3_client()
+        for bucket_name, keys in by_bucket.items():
+            for start in range(0, len(keys), 1000):
+                chunk = keys[start:start + 1000]
+                try:
+                    response = s3_client.delete_objects(
+                        Bucket=bucket_name,
+                        Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+                    )
+                    failed.extend(f"s3://{bucket_name}/{error['Key']}" for error in response.get('Errors', []))
+                except Exception as e:
+                    current_app.logger.error(f"Error deleting from S3: {e}")
+                    failed.extend(f"s3://{bucket_name}/{key}" for key in chunk)
+        return failed
@@ -0,0 +1,428 @@
+import contextlib
+import contextvars
+import re
+import threading
+import time
+from collections import OrderedDict
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import (MetaData, Table, Column, Index, select, insert, delete, update, text, inspect,
+                        table, column)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.util import find_tables
+from models import db, HealthData, ShardAssignment
+from utils.replicas import _current_identity
+from utils.partitions import HealthDataPartitions
+
+PRIMARY = 'primary'
+# health_data itself plus its PostgreSQL partitions
+SHARDED_TABLE = re.compile(r'^health_data(_default|_y\d{4}m\d{2})?$')
+# Shard n hands out health_data ids from n * ID_RANGE up, so rows keep their id when moved
+ID_RANGE = 1 << 40
+MAP_CACHE_MAX_ENTRIES = 100000
+
+_scope = contextvars.ContextVar('health_data_shard', default=None)
+
+
+def _health_data_table(name):
+    """Lightweight health_data table under any name, for copying between shards"""
+    return table(name, *(column(c.name, c.type) for c in HealthData.__table__.columns))
+
+
+class ShardRouter:
+    """
+    Horizontal sharding of health_data by household
+
+    health_data is the one table that grows with usage, so it is the only one
+    spread over the HEALTH_DATA_SHARDS binds; everything else stays on the
+    primary. Rows are keyed by HealthData.user_id, which is always the household
+    owner, so a user and all their FamilyMember profiles live on one shard and
+    every per-member query hits a single database.
+
+    The shard_map table on the primary records where each household lives. New
+    households are spread by user id; households with rows from before sharding
+    was enabled stay on the primary until moved with `flask shards move`.
+    Lookups are cached per worker for SHARD_MAP_CACHE_TTL seconds.
+
+    Statements touching health_data go to the shard of the user in scope: the
+    one set with use(user_id), or else the JWT identity of the request.
+    use_shard(key) pins one shard for maintenance. With no shards configured
+    nothing is routed and health_data stays on the primary.
+    """
+
+    def __init__(self, app=None):
+        self.shards = []
+        self._map = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HEALTH_DATA_SHARDS', [])
+        app.config.setdefault('SHARD_MAP_CACHE_TTL', 30)
+        app.config.setdefault('SHARD_MOVE_BATCH_SIZE', 5000)
+        self.shards = list(app.config['HEALTH_DATA_SHARDS'])
+        app.extensions['shard_router'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.shards)
+
+    def keys(self):
+        """Every database that may hold health_data rows"""
+        if not self.enabled:
+            return [None]
+        return [PRIMARY] + [key for key in self.shards if key != PRIMARY]
+
+    def engine(self, key):
+        return db.engines[None if key in (None, PRIMARY) else key]
+
+    @contextlib.contextmanager
+    def use(self, user_id):
+        """Route health_data statements to user_id's household shard"""
+        token = _scope.set(('user', user_id))
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    @contextlib.contextmanager
+    def use_shard(self, key):
+        """Route health_data statements to one shard, e.g. for maintenance"""
+        token = _scope.set(('shard', key))
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    def scoped_engine(self):
+        """Engine holding health_data for the current scope"""
+        if not self.enabled:
+            return db.engine
+        scope = _scope.get()
+        if scope is None:
+            user_id = _current_identity()
+            if user_id is None:
+                raise RuntimeError('health_data used outside a shard scope, wrap the call in shard_router.use()')
+            scope = ('user', user_id)
+        kind, value = scope
+        return self.engine(value if kind == 'shard' else self.shard_for(value))
+
+    def route(self, mapper, clause):
+        """Engine for a statement on health_data, or None to leave it to the default routing"""
+        if mapper is not None and SHARDED_TABLE.match(inspect(mapper).local_table.name):
+            return self.scoped_engine()
+        if clause is not None and any(SHARDED_TABLE.match(getattr(found, 'name', ''))
+                                      for found in find_tables(clause, include_crud=True)):
+            return self.scoped_engine()
+        return None
+
+    def shard_for(self, user_id):
+        """Shard key of a household, placing it on first use"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._map.get(user_id)
+            if cached is not None and cached[1] > now:
+                self._map.move_to_end(user_id)
+                return cached[0]
+
+        shard = self._lookup(user_id) or self._place(user_id)
+        with self._lock:
+            self._map[user_id] = (shard, now + current_app.config['SHARD_MAP_CACHE_TTL'])
+            self._map.move_to_end(user_id)
+            while len(self._map) > MAP_CACHE_MAX_ENTRIES:
+                self._map.popitem(last=False)
+        return shard
+
+    def forget(self, user_id):
+        with self._lock:
+            self._map.pop(user_id, None)
+
+    def _lookup(self, user_id):
+        # Straight on the primary engine: this runs inside get_bind, so not through the session
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(ShardAssignment.shard).where(ShardAssignment.user_id == user_id)
+            ).scalar()
+
+    def _place(self, user_id):
+        with db.engine.connect() as connection:
+            legacy = connection.execute(
+                select(HealthData.id).where(HealthData.user_id == user_id).limit(1)
+            ).first()
+        shard = PRIMARY if legacy else self.shards[user_id % len(self.shards)]
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(ShardAssignment.__table__).values(user_id=user_id, shard=shard))
+        except IntegrityError:
+            # Placed concurrently by another worker
+            shard = self._lookup(user_id)
+            if shard is None:
+                raise
+        return shard
+
+    def create_tables(self, key):
+        """Create health_data on a shard, with ids starting at the shard's own range"""
+        first_id = (self.shards.index(key) + 1) * ID_RANGE + 1
+        engine = self.engine(key)
+        with engine.begin() as connection:
+            if engine.dialect.name == 'postgresql':
+                # Same layout as the primary (see migration 8d4b6a0e5f13), without foreign keys
+                connection.execute(text(f'CREATE SEQUENCE IF NOT EXISTS health_data_id_seq AS BIGINT START WITH {first_id}'))
+                connection.execute(text("""
+                    CREATE TABLE IF NOT EXISTS health_data (
+                        id BIGINT NOT NULL DEFAULT nextval('health_data_id_seq'::regclass),
+                        user_id INTEGER NOT NULL,
+                        family_member_id INTEGER,
+                        data_type VARCHAR(50) NOT NULL,
+                        value DOUBLE PRECISION NOT NULL,
+                        unit VARCHAR(20),
+                        timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                        source VARCHAR(100),
+                        created_at TIMESTAMP WITHOUT TIME ZONE,
+                        CONSTRAINT health_data_pkey PRIMARY KEY (id, timestamp)
+                    ) PARTITION BY RANGE (timestamp)
+                """))
+                connection.execute(text('ALTER SEQUENCE health_data_id_seq OWNED BY health_data.id'))
+                connection.execute(text('CREATE INDEX IF NOT EXISTS ix_health_data_user_member_timestamp '
+                                        'ON health_data (user_id, family_member_id, timestamp)'))
+                connection.execute(text('CREATE TABLE IF NOT EXISTS health_data_default PARTITION OF health_data DEFAULT'))
+            else:
+                source = HealthData.__table__
+                Table(
+                    source.name, MetaData(),
+                    *(Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in source.columns),
+                    *(Index(index.name, *(c.name for c in index.columns)) for index in source.indexes),
+                    sqlite_autoincrement=True
+                ).create(connection, checkfirst=True)
+                connection.execute(text(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT 'health_data', :seq "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'health_data')"
+                ), {'seq': first_id - 1})
+
+    def _source_tables(self, engine):
+        names = ['health_data']
+        if engine.dialect.name != 'postgresql':
+            # SQLite period tables; PostgreSQL partitions are reached through the parent
+            names += [name for name in inspect(engine).get_table_names()
+                      if name != 'health_data' and SHARDED_TABLE.match(name)]
+        return [_health_data_table(name) for name in names]
+
+    def _copy_rows(self, source, target, user_id, on_progress=None):
+        """Copy a household's rows in id order, in batches; returns the count"""
+        batch_size = current_app.config['SHARD_MOVE_BATCH_SIZE']
+        copied = 0
+        for rows_table in self._source_tables(source):
+            position = 0
+            while True:
+                with source.connect() as connection:
+                    rows = connection.execute(
+                        select(rows_table)
+                        .where(rows_table.c.user_id == user_id, rows_table.c.id > position)
+                        .order_by(rows_table.c.id)
+                        .limit(batch_size)
+                    ).mappings().all()
+                if not rows:
+                    break
+                # Each batch is its own short transaction on both sides
+                with target.begin() as connection:
+                    connection.execute(insert(HealthData.__table__), [dict(row) for row in rows])
+                position = rows[-1]['id']
+                copied += len(rows)
+                if on_progress is not None:
+                    on_progress('copied', copied)
+                if len(rows) < batch_size:
+                    break
+        return copied
+
+    def _delete_rows(self, engine, user_id, on_progress=None):
+        batch_size = current_app.config['SHARD_MOVE_BATCH_SIZE']
+        deleted = 0
+        for rows_table in self._source_tables(engine):
+            while True:
+                with engine.begin() as connection:
+                    ids = connection.execute(
+                        select(rows_table.c.id).where(rows_table.c.user_id == user_id).limit(batch_size)
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    connection.execute(
+                        delete(rows_table).where(rows_table.c.user_id == user_id, rows_table.c.id.in_(ids))
+                    )
+                deleted += len(ids)
+                if on_progress is not None:
+                    on_progress('deleted', deleted)
+        return deleted
+
+    def _drain_rows(self, source, target, user_id, on_progress=None):
+        """
+        Empty a household's rows out of a shard that is no longer authoritative
+
+        Ids are not committed in id order, so the copy can have stepped past rows
+        that were still uncommitted. Each batch of source rows is compared with the
+        target by id, whatever the target lacks is copied, and only then is the
+        batch deleted. Returns the number of rows copied.
+        """
+        batch_size = current_app.config['SHARD_MOVE_BATCH_SIZE']
+        copied = deleted = 0
+        for rows_table in self._source_tables(source):
+            while True:
+                with source.connect() as connection:
+                    rows = connection.execute(
+                        select(rows_table).where(rows_table.c.user_id == user_id).limit(batch_size)
+                    ).mappings().all()
+                if not rows:
+                    break
+                ids = [row['id'] for row in rows]
+                with target.begin() as connection:
+                    present = set(connection.execute(
+                        select(HealthData.__table__.c.id).where(HealthData.__table__.c.id.in_(ids))
+                    ).scalars())
+                    missing = [dict(row) for row in rows if row['id'] not in present]
+                    if missing:
+                        connection.execute(insert(HealthData.__table__), missing)
+                with source.begin() as connection:
+                    connection.execute(
+                        delete(rows_table).where(rows_table.c.user_id == user_id, rows_table.c.id.in_(ids))
+                    )
+                copied += len(missing)
+                deleted += len(ids)
+                if on_progress is not None:
+                    if missing:
+                        on_progress('copied', copied)
+                    on_progress('deleted', deleted)
+        return copied
+
+    def is_moving(self, user_id):
+        """
+        Whether `flask shards move` is working on user_id's household
+
+        Also locks the household's shard_map row until the session commits, so a
+        move cannot start underneath a caller that goes on to change its rows.
+        """
+        if not self.enabled:
+            return False
+        return db.session.execute(
+            select(ShardAssignment.moving_to).where(ShardAssignment.user_id == user_id).with_for_update()
+        ).scalar() is not None
+
+    def release(self, user_id):
+        """Clear the move marker left behind by a move that was killed; returns whether one was set"""
+        assignment = ShardAssignment.__table__
+        with db.engine.begin() as connection:
+            return connection.execute(
+                update(assignment).where(assignment.c.user_id == user_id, assignment.c.moving_to.isnot(None))
+                .values(moving_to=None)
+            ).rowcount > 0
+
+    def move(self, user_id, target, on_progress=None):
+        """
+        Move a household's health_data rows to another shard while it stays online
+
+        Rows are copied in id order in small batches, keeping their ids, until the
+        copy has caught up with new writes. The shard map is then switched, and
+        after waiting out every worker's cached lookup the old shard is drained:
+        rows the copy missed are copied and every row is deleted from it in
+        batches. Until the switch the old shard stays authoritative, so a failed
+        move can simply be run again; running it again after the switch finishes
+        draining the old shard.
+
+        shard_map.moving_to is set for the whole move. A second move of the same
+        household is refused, and `flask vitals archive` leaves the household
+        alone until the move is done (see VitalsArchiver.archive_month).
+
+        Returns:
+            Number of rows moved
+        """
+        if target not in self.keys():
+            raise ValueError(f'Unknown shard: {target}')
+        source = self._lookup(user_id) or self._place(user_id)
+
+        assignment = ShardAssignment.__table__
+        with db.engine.begin() as connection:
+            # Waits for an archive run holding the row (see is_moving)
+            claimed = connection.execute(
+                update(assignment).where(assignment.c.user_id == user_id, assignment.c.moving_to.is_(None))
+                .values(moving_to=target)
+            ).rowcount
+        if not claimed:
+            raise ValueError(f'Household {user_id} is already being moved; '
+                             f'if that move was killed, run `flask shards release {user_id}`')
+
+        try:
+            moved = 0
+            if source != target:
+                source_engine, target_engine = self.engine(source), self.engine(target)
+                # Leftovers of an earlier failed move; the target is not authoritative yet
+                self._delete_rows(target_engine, user_id)
+                moved = self._copy_rows(source_engine, target_engine, user_id, on_progress)
+                with db.engine.begin() as connection:
+                    connection.execute(update(assignment).where(assignment.c.user_id == user_id).values(shard=target))
+                self.forget(user_id)
+                # Other workers keep writing to the old shard until their cached lookup expires
+                time.sleep(current_app.config['SHARD_MAP_CACHE_TTL'] + 1)
+                drained = [source]
+            else:
+                # Finish a move that failed after the switch
+                drained = [key for key in self.keys() if key != target]
+            target_engine = self.engine(target)
+            for key in drained:
+                moved += self._drain_rows(self.engine(key), target_engine, user_id, on_progress)
+        finally:
+            with db.engine.begin() as connection:
+                connection.execute(update(assignment).where(assignment.c.user_id == user_id).values(moving_to=None))
+        return moved
+
+
+shard_router = ShardRouter()
+
+shards_cli = AppGroup('shards', help='Manage health_data shards.')
+
+
+@shards_cli.command('init')
+def init_command():
+    """Create health_data on every configured shard."""
+    for key in shard_router.shards:
+        shard_router.create_tables(key)
+        if shard_router.engine(key).dialect.name == 'postgresql':
+            with shard_router.use_shard(key):
+                HealthDataPartitions.ensure()
+        click.echo(f'Initialized {key}')
+
+
+@shards_cli.command('list')
+def list_command():
+    """Show how many households and rows each shard holds."""
+    households = dict(db.session.execute(
+        select(ShardAssignment.shard, db.func.count()).group_by(ShardAssignment.shard)
+    ).all())
+    for key in shard_router.keys():
+        with shard_router.engine(key).connect() as connection:
+            rows = connection.execute(select(db.func.count()).select_from(HealthData.__table__)).scalar()
+        click.echo(f'{key or PRIMARY}: {households.get(key or PRIMARY, 0)} household(s), {rows} row(s)')
+
+
+@shards_cli.command('move')
+@click.argument('user_id', type=int)
+@click.argument('shard')
+def move_command(user_id, shard):
+    """Move the health data of USER_ID's household to SHARD."""
+    def report(stage, count):
+        click.echo(f'{count} row(s) {stage}')
+
+    try:
+        moved = shard_router.move(user_id, shard, on_progress=report)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f'Done: {moved} row(s) on {shard}')
+
+
+@shards_cli.command('release')
+@click.argument('user_id', type=int)
+def release_command(user_id):
+    """Let USER_ID's household be moved and archived again after a move was killed."""
+    if shard_router.release(user_id):
+        click.echo(f'Released household {user_id}')
+    else:
+        click.echo(f'Household {user_id} is not being moved')
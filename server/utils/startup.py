@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# Heavy modules that must only be imported on first use; seeing one at start-up
+# means a top-level import crept back in
+LAZY_MODULES = ('boto3', 'botocore', 'numpy')
+
+# Runs in a fresh interpreter so nothing is already imported
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app('testing')
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'eager': sorted(name for name in %r if name in sys.modules),
+}))
+"""
+
+
+def measure_startup(root_path):
+    """
+    Import the app and build it once in a fresh interpreter
+
+    Returns:
+        Tuple of (timings dict, [(cumulative us, module)] from -X importtime, slowest first)
+    """
+    env = dict(os.environ, TEST_DATABASE_URL='sqlite://')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE % (LAZY_MODULES,)],
+        cwd=root_path, env=env, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package", nesting shown by indentation
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # Only modules imported directly by the probe or by app.py
+        if len(name) - len(name.lstrip()) <= 3:
+            imports.append((int(parts[1]), name.strip()))
+    imports.sort(reverse=True)
+    return timings, imports
+
+
+startup_cli = AppGroup('startup', help='Measure worker start-up cost.')
+
+
+@startup_cli.command('check')
+@click.option('--budget-ms', type=float, default=None, help='Defaults to STARTUP_BUDGET_MS.')
+@click.option('--top', type=int, default=10, help='Number of slowest imports to list.')
+def check_command(budget_ms, top):
+    """Measure import and create_app() time, failing over budget or on eager heavy imports."""
+    budget_ms = budget_ms or current_app.config['STARTUP_BUDGET_MS']
+    timings, imports = measure_startup(current_app.root_path)
+
+    for cumulative, name in imports[:top]:
+        click.echo(f'{cumulative / 1000:9.1f} ms  {name}')
+    total = timings['import_ms'] + timings['create_app_ms']
+    click.echo(f"import app: {timings['import_ms']:.1f} ms, create_app(): {timings['create_app_ms']:.1f} ms, "
+               f'total {total:.1f} ms (budget {budget_ms:.0f} ms)')
+
+    failed = False
+    if timings['eager']:
+        click.echo(f"Imported at start-up but meant to load lazily: {', '.join(timings['eager'])}", err=True)
+        failed = True
+    if total > budget_ms:
+        click.echo('Start-up is over budget', err=True)
+        failed = True
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,229 @@
+import hashlib
+import hmac
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from functools import wraps
+from flask import current_app, jsonify, url_for
+from werkzeug.utils import secure_filename
+from utils.s3_utils import S3Utils
+
+LOCAL_SCHEME = 'local://'
+
+
+def document_key(user_id, family_member_id, document_type, filename):
+    """Key for a newly uploaded document, the same for every backend"""
+    file_extension = os.path.splitext(secure_filename(filename))[1]
+    return f"documents/user_{user_id}/member_{family_member_id}/{document_type}/{uuid.uuid4()}{file_extension}"
+
+
+class S3Storage:
+    """Files in the configured S3 bucket, downloaded through presigned URLs"""
+
+    def upload_file(self, file_obj, user_id, family_member_id, document_type):
+        return S3Utils.upload_file(file_obj, user_id, family_member_id, document_type)
+
+    def upload_bytes(self, data, key, content_type='application/octet-stream'):
+        return S3Utils.upload_bytes(data, key, content_type)
+
+    def download_bytes(self, file_path):
+        return S3Utils.download_bytes(file_path)
+
+    def generate_presigned_url(self, file_path, expiration=3600):
+        return S3Utils.generate_presigned_url(file_path, expiration)
+
+    def delete_many(self, file_paths):
+        return S3Utils.delete_objects(file_paths)
+
+
+class LocalStorage:
+    """
+    Files on local disk, for on-prem and development deployments
+
+    A key is stored at ROOT/ab/cd/abcd...ef.ext, named after the SHA-1 of the
+    key, so no directory grows past a few thousand entries however many
+    documents a household uploads. Paths in the database are local://KEY and do
+    not depend on where ROOT is mounted. Downloads go through signed,
+    expiring URLs served by the files blueprint.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + os.path.splitext(key)[1])
+
+    def relative_path(self, key):
+        return os.path.relpath(self.disk_path(key), self.root).replace(os.sep, '/')
+
+    @staticmethod
+    def key_for(file_path):
+        return file_path[len(LOCAL_SCHEME):] if file_path and file_path.startswith(LOCAL_SCHEME) else None
+
+    def _write(self, key, write):
+        target = self.disk_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written next to the target and renamed, so readers never see a partial file
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                write(out)
+            os.replace(temporary, target)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return f'{LOCAL_SCHEME}{key}'
+
+    def upload_file(self, file_obj, user_id, family_member_id, document_type):
+        try:
+            key = document_key(user_id, family_member_id, document_type, file_obj.filename)
+            return True, self._write(key, lambda out: shutil.copyfileobj(file_obj, out, 1024 * 1024))
+        except OSError as e:
+            current_app.logger.error(f"Error writing document to local storage: {e}")
+            return False, str(e)
+
+    def upload_bytes(self, data, key, content_type='application/octet-stream'):
+        try:
+            return True, self._write(key, lambda out: out.write(data))
+        except OSError as e:
+            current_app.logger.error(f"Error writing to local storage: {e}")
+            return False, str(e)
+
+    def download_bytes(self, file_path):
+        key = self.key_for(file_path)
+        if key is None:
+            return None
+        try:
+            with open(self.disk_path(key), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            current_app.logger.error(f"Error reading from local storage: {e}")
+            return None
+
+    def delete_many(self, file_paths):
+        failed = []
+        for file_path in file_paths:
+            key = self.key_for(file_path)
+            try:
+                if key is None:
+                    raise OSError(f'Not a local storage path: {file_path}')
+                os.remove(self.disk_path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                current_app.logger.error(f"Error deleting from local storage: {e}")
+                failed.append(file_path)
+        return failed
+
+    def sign(self, key, expires):
+        message = f'{key}\n{expires}'.encode('utf-8')
+        return hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+    def verify(self, key, expires, signature):
+        """Whether a download URL was signed for key and has not expired"""
+        try:
+            if int(expires) < time.time():
+                return False
+        except (TypeError, ValueError):
+            return False
+        return hmac.compare_digest(self.sign(key, int(expires)), signature or '')
+
+    def generate_presigned_url(self, file_path, expiration=3600):
+        key = self.key_for(file_path)
+        if key is None:
+            return None
+        expires = int(time.time()) + expiration
+        try:
+            return url_for('file_routes.download_file', key=key, expires=expires,
+                           signature=self.sign(key, expires), _external=True)
+        except RuntimeError as e:
+            # No request to take the host from and no SERVER_NAME configured
+            current_app.logger.error(f"Error generating local download URL: {e}")
+            return None
+
+    @staticmethod
+    def content_type(key):
+        return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+class Storage:
+    """
+    Document and archive storage, with the backend chosen by STORAGE_BACKEND
+
+    New files go to the configured backend (s3 or local). Existing files are
+    read through the backend their path names, s3:// or local://, so a
+    deployment can switch backends without migrating what it already stores.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STORAGE_BACKEND', 's3')
+        app.config.setdefault('LOCAL_STORAGE_ROOT', None)
+        app.config.setdefault('LOCAL_STORAGE_ACCEL_PREFIX', None)
+        if app.config['STORAGE_BACKEND'] not in ('s3', 'local'):
+            raise ValueError(f"Unknown STORAGE_BACKEND {app.config['STORAGE_BACKEND']!r}")
+
+        root = app.config['LOCAL_STORAGE_ROOT'] or os.path.join(app.instance_path, 'storage')
+        app.extensions['storage'] = {'s3': S3Storage(), 'local': LocalStorage(root)}
+
+    @property
+    def name(self):
+        return current_app.config['STORAGE_BACKEND']
+
+    @property
+    def local(self):
+        return current_app.extensions['storage']['local']
+
+    def _for_new(self):
+        return current_app.extensions['storage'][self.name]
+
+    def _for(self, file_path):
+        backends = current_app.extensions['storage']
+        return backends['local'] if file_path and file_path.startswith(LOCAL_SCHEME) else backends['s3']
+
+    def upload_file(self, file_obj, user_id, family_member_id, document_type):
+        """Store an uploaded document; returns (success, file_path or error_message)"""
+        return self._for_new().upload_file(file_obj, user_id, family_member_id, document_type)
+
+    def upload_bytes(self, data, key, content_type='application/octet-stream'):
+        """Store an in-memory payload; returns (success, file_path or error_message)"""
+        return self._for_new().upload_bytes(data, key, content_type)
+
+    def download_bytes(self, file_path):
+        """Contents of a stored file, or None if error"""
+        return self._for(file_path).download_bytes(file_path)
+
+    def generate_presigned_url(self, file_path, expiration=3600):
+        """Temporary download URL for a stored file, or None if error"""
+        return self._for(file_path).generate_presigned_url(file_path, expiration)
+
+    def delete_many(self, file_paths):
+        """Delete stored files in bulk; returns the paths that could not be deleted"""
+        by_backend = {}
+        for file_path in file_paths:
+            by_backend.setdefault(self._for(file_path), []).append(file_path)
+        failed = []
+        for backend, paths in by_backend.items():
+            failed.extend(backend.delete_many(paths))
+        return failed
+
+
+storage = Storage()
+
+
+def requires_s3(f):
+    """Refuse direct-to-S3 upload endpoints when new documents are stored elsewhere"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if storage.name != 's3':
+            return jsonify({'error': 'Direct uploads are not available with this storage backend; '
+                                     'use /api/v1/documents/upload'}), 501
+        return f(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,131 @@
+from collections import defaultdict
+from functools import wraps
+from flask import current_app, request, jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, inspect, select, update, insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, MedicalDocument, StorageUsage
+
+# Allowance for the form fields and boundaries around a multipart document upload
+MULTIPART_OVERHEAD = 64 * 1024
+
+_UPSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+
+def usage_for(user_id):
+    """Return {family_member_id: (document_count, total_bytes)} for a household"""
+    rows = db.session.execute(
+        select(StorageUsage.family_member_id, StorageUsage.document_count, StorageUsage.total_bytes)
+        .where(StorageUsage.user_id == user_id)
+    ).all()
+    return {member_id: (count, total) for member_id, count, total in rows}
+
+
+def quota_error(user_id, family_member_id=None, size=0, documents=1):
+    """
+    Check whether `documents` more documents totalling `size` bytes fit the quotas
+
+    Without family_member_id only the household-wide quota is checked. Two
+    uploads racing each other can both pass, so the quotas are soft by at most
+    one document each.
+
+    Returns:
+        Error message, or None if the upload fits
+    """
+    config = current_app.config
+    usage = usage_for(user_id)
+    user_bytes = sum(total for _, total in usage.values())
+    if user_bytes + size > config['STORAGE_QUOTA_USER_BYTES']:
+        return 'Storage quota exceeded for this account'
+    if family_member_id is not None:
+        count, total = usage.get(int(family_member_id), (0, 0))
+        if total + size > config['STORAGE_QUOTA_MEMBER_BYTES']:
+            return 'Storage quota exceeded for this family member'
+        if count + documents > config['STORAGE_QUOTA_MEMBER_DOCUMENTS']:
+            return 'Document limit reached for this family member'
+    return None
+
+
+def admit_upload(f):
+    """
+    Reject a document upload from its Content-Length, before the body is read
+
+    The family member is only known once the form is parsed, so the route
+    checks the member's quota with the exact file size afterwards.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        length = request.content_length
+        if length is None:
+            return jsonify({'error': 'Content-Length required'}), 411
+        max_size = current_app.config['DOCUMENT_MAX_SIZE']
+        if length > max_size + MULTIPART_OVERHEAD:
+            return jsonify({'error': f'Documents may be at most {max_size} bytes'}), 413
+        error = quota_error(get_jwt_identity(), size=max(length - MULTIPART_OVERHEAD, 0))
+        if error:
+            return jsonify({'error': error}), 413
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def _apply(connection, deltas):
+    table = StorageUsage.__table__
+    upsert = _UPSERTS.get(connection.dialect.name)
+    for (user_id, member_id), (count, size) in deltas.items():
+        if not count and not size:
+            continue
+        if upsert is not None:
+            stmt = upsert(table).values(user_id=user_id, family_member_id=member_id,
+                                        document_count=count, total_bytes=size)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=['user_id', 'family_member_id'],
+                set_={
+                    'document_count': table.c.document_count + stmt.excluded.document_count,
+                    'total_bytes': table.c.total_bytes + stmt.excluded.total_bytes,
+                    'updated_at': db.func.now()
+                }
+            ))
+            continue
+        result = connection.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.family_member_id == member_id)
+            .values(document_count=table.c.document_count + count, total_bytes=table.c.total_bytes + size)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(user_id=user_id, family_member_id=member_id,
+                                                    document_count=count, total_bytes=size))
+
+
+def _previous(document, key):
+    """Value of an attribute as of the last flush"""
+    history = inspect(document).attrs[key].history
+    return history.deleted[0] if history.deleted else getattr(document, key)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_usage(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0])
+
+    def add(user_id, member_id, count, size):
+        delta = deltas[(user_id, int(member_id))]
+        delta[0] += count
+        delta[1] += size or 0
+
+    for obj in session.new:
+        if isinstance(obj, MedicalDocument):
+            add(obj.user_id, obj.family_member_id, 1, obj.file_size)
+    for obj in session.deleted:
+        if isinstance(obj, MedicalDocument):
+            add(_previous(obj, 'user_id'), _previous(obj, 'family_member_id'), -1, -(_previous(obj, 'file_size') or 0))
+    for obj in session.dirty:
+        if isinstance(obj, MedicalDocument) and obj not in session.deleted:
+            state = inspect(obj).attrs
+            if any(state[key].history.has_changes() for key in ('user_id', 'family_member_id', 'file_size')):
+                # Moved between members or resized: take it off the old totals, add it to the new
+                add(_previous(obj, 'user_id'), _previous(obj, 'family_member_id'), -1,
+                    -(_previous(obj, 'file_size') or 0))
+                add(obj.user_id, obj.family_member_id, 1, obj.file_size)
+
+    if deltas:
+        _apply(session.connection(), deltas)
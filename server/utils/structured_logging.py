@@ -0,0 +1,280 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+import click
+from flask import current_app, request
+from flask.cli import AppGroup
+from utils.replicas import _current_identity
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+# The StructuredLogging whose listener is running; the process-wide hooks act on it
+_active = None
+_hooks_registered = False
+
+# Attributes every LogRecord has; anything else was passed through extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def current_request_id():
+    """Correlation ID of the request being handled, or None"""
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """Tags records with the request ID and drops a share of debug/info events"""
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            # extra={'sample_rate': ...} overrides the default for one call site
+            rate = getattr(record, 'sample_rate', self.sample_rate if record.levelno < logging.INFO else 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the listener thread"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only the message is rendered here, so the arguments can't change before the listener sees them.
+        # This is the root's only handler, so the record is changed in place instead of copied.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Losing log lines beats stalling requests behind a slow stdout
+            self.dropped += 1
+
+
+class StructuredLogging:
+    """
+    JSON logs written off the request path
+
+    Handlers on the root logger are replaced by a QueueHandler, so logging
+    from a request costs a record copy and a queue put; a QueueListener
+    thread formats and writes the JSON lines. When the queue is full new
+    records are dropped and counted rather than blocking the caller. Every
+    record carries the request's correlation ID, taken from the X-Request-ID
+    header or generated, and echoed back on the response. DEBUG records are
+    kept at LOG_DEBUG_SAMPLE_RATE, or at a per-call extra={'sample_rate': r}.
+    """
+
+    def __init__(self, app=None):
+        self.handler = None
+        self.listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_JSON', True)
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_DEBUG_SAMPLE_RATE', 1.0)
+        app.config.setdefault('LOG_REQUESTS', True)
+
+        output = logging.StreamHandler(sys.stdout)
+        if app.config['LOG_JSON']:
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+
+        self.handler = _QueueHandler(queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE']))
+        self.handler.addFilter(_ContextFilter(app.config['LOG_DEBUG_SAMPLE_RATE']))
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(app.config['LOG_LEVEL'])
+        # Flask's own stderr handler would write synchronously; let records reach the root instead
+        app.logger.handlers.clear()
+        app.logger.setLevel(app.config['LOG_LEVEL'])
+
+        self._activate()
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._end_request)
+        app.extensions['structured_logging'] = self
+
+    def _activate(self):
+        """Start this listener in place of the previous app's, registering the process hooks once"""
+        global _active, _hooks_registered
+        if _active is not None and _active is not self:
+            # Another create_app() in this process, e.g. in tests; its handler is already off the root
+            _active.stop()
+        _active = self
+        self.listener.start()
+        if not _hooks_registered:
+            atexit.register(_stop_active)
+            # Forked workers (gunicorn --preload) do not inherit the listener thread
+            os.register_at_fork(after_in_child=_restart_active)
+            _hooks_registered = True
+
+    def stop(self):
+        """Flush queued records and stop the listener thread"""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def _restart(self):
+        self.listener._thread = None
+        self.listener.start()
+
+    # State lives in the environ rather than g, which batch sub-requests share with the batch
+    def _start_request(self):
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        request_id = incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        request.environ['health_app.request_id_token'] = _request_id.set(request_id)
+        request.environ['health_app.request_started'] = time.perf_counter()
+
+    def _finish_request(self, response):
+        request_id = _request_id.get()
+        if request_id is not None:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        started = request.environ.get('health_app.request_started')
+        if current_app.config['LOG_REQUESTS'] and started is not None:
+            current_app.logger.info('request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'user_id': _current_identity()
+            })
+        return response
+
+    def _end_request(self, exc):
+        token = request.environ.pop('health_app.request_id_token', None)
+        if token is not None:
+            _request_id.reset(token)
+
+
+def _stop_active():
+    if _active is not None:
+        _active.stop()
+
+
+def _restart_active():
+    if _active is not None:
+        _active._restart()
+
+
+logs_cli = AppGroup('logs', help='Logging tools.')
+
+
+class _SlowStream:
+    """File-like sink taking a millisecond per write, like stdout behind a full pipe"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        time.sleep(0.001)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+@logs_cli.command('bench')
+@click.option('--iterations', type=int, default=5000, show_default=True)
+def bench_command(iterations):
+    """Measure what log calls cost the request thread, with a fast and a slow log sink."""
+    logger = logging.getLogger('logs.bench')
+    logging_setup = current_app.extensions['structured_logging']
+    handler, listener = logging_setup.handler, logging_setup.listener
+    fields = {'user_id': 1, 'path': '/api/v1/documents'}
+
+    def measure(label, emit):
+        start = time.perf_counter()
+        for i in range(iterations):
+            emit(i)
+        per_call = (time.perf_counter() - start) / iterations * 1e6
+        click.echo(f'{label:<44} {per_call:9.2f} us/call')
+
+    def error(i):
+        logger.error('Error uploading document: %s', i, extra=fields)
+
+    def sampled_debug(i):
+        logger.debug('Presigning %s', i, extra={'sample_rate': 0.01})
+
+    def skipped_debug(i):
+        logger.debug('Presigning %s', i)
+
+    output = listener.handlers
+    dropped = handler.dropped
+    try:
+        for sink_label, wrap in (('fast sink', lambda f: f), ('slow sink', _SlowStream)):
+            with tempfile.TemporaryFile('w') as sink:
+                # The benchmark's records go to a scratch file, never to the real log
+                target = logging.StreamHandler(wrap(sink))
+                target.setFormatter(JsonFormatter())
+
+                # Before: format and write on the calling thread
+                logger.propagate = False
+                logger.addHandler(target)
+                measure(f'synchronous error, {sink_label}', error)
+                logger.removeHandler(target)
+                logger.propagate = True
+
+                listener.handlers = (target,)
+                measure(f'queued error, {sink_label}', error)
+                logger.setLevel(logging.DEBUG)
+                measure(f'queued debug sampled at 1%, {sink_label}', sampled_debug)
+                logger.setLevel(logging.NOTSET)
+                measure(f'debug below the log level, {sink_label}', skipped_debug)
+                # Drain before the sink closes
+                while not handler.queue.empty():
+                    time.sleep(0.01)
+    finally:
+        listener.handlers = output
+        logger.propagate = True
+    click.echo(f'Records dropped because the queue was full: {handler.dropped - dropped}')
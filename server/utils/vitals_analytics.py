@@ -0,0 +1,231 @@
+import uuid
+from flask import current_app
+from sqlalchemy import event
+from models import db, HealthData
+from utils.cache import cache as shared_cache, analytics_version_key
+from utils.vitals_series import VitalsSeries
+from utils.lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+# HealthData.data_type values, named after the Health Connect / HealthKit types the app syncs
+HEART_RATE = 'HEART_RATE'
+BLOOD_OXYGEN = 'BLOOD_OXYGEN'
+BLOOD_PRESSURE_SYSTOLIC = 'BLOOD_PRESSURE_SYSTOLIC'
+BLOOD_PRESSURE_DIASTOLIC = 'BLOOD_PRESSURE_DIASTOLIC'
+# Pseudo type combining the systolic and diastolic series
+BLOOD_PRESSURE = 'BLOOD_PRESSURE'
+
+MS_PER_DAY = 86400 * 1000
+
+SPO2_DIP_THRESHOLD = 90.0
+# Window used to smooth heart rate before taking the daily minimum
+RESTING_HR_WINDOW_MS = 5 * 60 * 1000
+# Systolic slope (mmHg per day) above which the trend is flagged as rising
+BP_RISING_SLOPE = 0.5
+
+
+def rolling_mean(timestamps, values, window_ms):
+    """
+    Trailing time-window mean at every sample
+
+    Each output point is the mean of all samples in (t - window_ms, t], computed
+    from a cumulative sum and a binary search instead of a loop per sample.
+    """
+    if len(values) == 0:
+        return np.empty(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    right = np.arange(1, len(values) + 1)
+    left = np.searchsorted(timestamps, timestamps - window_ms, side='right')
+    return (cumulative[right] - cumulative[left]) / (right - left)
+
+
+def _day_starts(timestamps):
+    """Return (day numbers, index of the first sample of each day) for a sorted series"""
+    days = timestamps // MS_PER_DAY
+    starts = np.flatnonzero(np.diff(days, prepend=days[0] - 1))
+    return days[starts], starts
+
+
+def daily_summary(timestamps, values):
+    """Per-day mean, min and max"""
+    if len(values) == 0:
+        return []
+    days, starts = _day_starts(timestamps)
+    counts = np.diff(np.append(starts, len(values)))
+    means = np.add.reduceat(values, starts) / counts
+    minimums = np.minimum.reduceat(values, starts)
+    maximums = np.maximum.reduceat(values, starts)
+    return [{
+        'date': str(np.datetime64(int(day), 'D')),
+        'count': int(count),
+        'mean': round(float(mean), 2),
+        'min': float(minimum),
+        'max': float(maximum)
+    } for day, count, mean, minimum, maximum in zip(days, counts, means, minimums, maximums)]
+
+
+def resting_heart_rate(timestamps, values):
+    """Estimate resting heart rate per day as the lowest smoothed heart rate of that day"""
+    if len(values) == 0:
+        return []
+    smoothed = rolling_mean(timestamps, values, RESTING_HR_WINDOW_MS)
+    days, starts = _day_starts(timestamps)
+    resting = np.minimum.reduceat(smoothed, starts)
+    return [{
+        'date': str(np.datetime64(int(day), 'D')),
+        'resting_heart_rate': round(float(rate), 1)
+    } for day, rate in zip(days, resting)]
+
+
+def spo2_dips(timestamps, values, threshold=SPO2_DIP_THRESHOLD):
+    """Find contiguous runs of SpO2 samples below threshold"""
+    below = np.concatenate(([0], (values < threshold).astype(np.int8), [0]))
+    edges = np.diff(below)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return []
+    # Samples outside a dip become +inf, so each reduceat segment [start_i, start_i+1)
+    # only sees the values of dip i
+    lowest = np.minimum.reduceat(np.where(values < threshold, values, np.inf), starts)
+    return [{
+        'start': int(timestamps[start]),
+        'end': int(timestamps[end - 1]),
+        'samples': int(end - start),
+        'lowest': float(low)
+    } for start, end, low in zip(starts, ends, lowest)]
+
+
+def blood_pressure_category(systolic, diastolic):
+    """Classify readings using the ACC/AHA blood pressure categories"""
+    categories = np.full(len(systolic), 'normal', dtype=object)
+    categories[(systolic >= 120) & (diastolic < 80)] = 'elevated'
+    categories[((systolic >= 130) & (systolic < 140)) | ((diastolic >= 80) & (diastolic < 90))] = 'stage_1'
+    categories[(systolic >= 140) | (diastolic >= 90)] = 'stage_2'
+    categories[(systolic > 180) | (diastolic > 120)] = 'crisis'
+    return categories
+
+
+def blood_pressure_trend(sys_timestamps, systolic, dia_timestamps, diastolic):
+    """Pair systolic/diastolic readings and flag category and trend"""
+    timestamps, sys_index, dia_index = np.intersect1d(sys_timestamps, dia_timestamps,
+                                                      assume_unique=False, return_indices=True)
+    if len(timestamps) == 0:
+        return {'readings': 0, 'flags': []}
+
+    systolic = systolic[sys_index]
+    diastolic = diastolic[dia_index]
+    categories = blood_pressure_category(systolic, diastolic)
+
+    flags = []
+    slope = 0.0
+    if len(timestamps) >= 2 and timestamps[-1] > timestamps[0]:
+        slope = float(np.polyfit((timestamps - timestamps[0]) / MS_PER_DAY, systolic, 1)[0])
+        if slope > BP_RISING_SLOPE:
+            flags.append('rising')
+    latest = categories[-1]
+    if latest != 'normal':
+        flags.append(latest)
+    if np.count_nonzero(categories == 'crisis'):
+        flags.append('crisis_reading')
+
+    return {
+        'readings': int(len(timestamps)),
+        'systolic_mean': round(float(systolic.mean()), 1),
+        'diastolic_mean': round(float(diastolic.mean()), 1),
+        'systolic_slope_per_day': round(slope, 3),
+        'latest_category': latest,
+        'flags': flags
+    }
+
+
+def _summary(timestamps, values, window_ms):
+    if len(values) == 0:
+        return {'count': 0}
+    smoothed = rolling_mean(timestamps, values, window_ms)
+    return {
+        'count': int(len(values)),
+        'mean': round(float(values.mean()), 2),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'latest': float(values[-1]),
+        'latest_rolling_mean': round(float(smoothed[-1]), 2),
+        'first_timestamp': int(timestamps[0]),
+        'last_timestamp': int(timestamps[-1])
+    }
+
+
+def compute(user_id, family_member_id, data_type, window_ms, start=None, end=None):
+    """Load a member's series and compute the analytics for its type"""
+    if data_type == BLOOD_PRESSURE:
+        sys_ts, systolic = VitalsSeries.load(user_id, family_member_id, BLOOD_PRESSURE_SYSTOLIC, start, end)
+        dia_ts, diastolic = VitalsSeries.load(user_id, family_member_id, BLOOD_PRESSURE_DIASTOLIC, start, end)
+        return {
+            'data_type': data_type,
+            'window_seconds': window_ms // 1000,
+            'systolic': _summary(sys_ts, systolic, window_ms),
+            'diastolic': _summary(dia_ts, diastolic, window_ms),
+            'trend': blood_pressure_trend(sys_ts, systolic, dia_ts, diastolic)
+        }
+
+    timestamps, values = VitalsSeries.load(user_id, family_member_id, data_type, start, end)
+    result = {
+        'data_type': data_type,
+        'window_seconds': window_ms // 1000,
+        'summary': _summary(timestamps, values, window_ms),
+        'daily': daily_summary(timestamps, values)
+    }
+    if data_type == HEART_RATE:
+        result['resting_heart_rate'] = resting_heart_rate(timestamps, values)
+    elif data_type == BLOOD_OXYGEN:
+        result['dips'] = spo2_dips(timestamps, values)
+    return result
+
+
+class AnalyticsCache:
+    """
+    Computed analytics in the shared cache, versioned per household member
+
+    Every result key embeds the member's current version token, so replacing
+    the token retires all of the member's results at once on every worker
+    without having to find them. The token is dropped when a HealthData change
+    commits through the ORM; bulk writers that bypass the session (imports,
+    archiving, member removal) call invalidate_member() themselves.
+    """
+
+    # Outlives the results it versions, so a token never expires under a live result
+    VERSION_TTL = 86400
+
+    def version(self, user_id, family_member_id):
+        return shared_cache.get_or_set(analytics_version_key(user_id, family_member_id),
+                                       lambda: uuid.uuid4().hex, ttl=self.VERSION_TTL)
+
+    def get_or_compute(self, key, user_id, family_member_id, compute_result):
+        key = f'analytics:{user_id}:{family_member_id or 0}:{self.version(user_id, family_member_id)}:{key}'
+        return shared_cache.get_or_set(key, compute_result, ttl=current_app.config.get('ANALYTICS_CACHE_TTL', 300))
+
+    def invalidate_member(self, user_id, family_member_id):
+        """Drop every cached result for one household member"""
+        shared_cache.delete_many([analytics_version_key(user_id, family_member_id)])
+
+
+cache = AnalyticsCache()
+
+
+def cached_compute(user_id, family_member_id, data_type, window_ms, start=None, end=None):
+    """compute() memoized by (member, type, window, range)"""
+    key = f"{data_type}:{window_ms}:{start.isoformat() if start else ''}:{end.isoformat() if end else ''}"
+    return cache.get_or_compute(key, user_id, family_member_id,
+                                lambda: compute(user_id, family_member_id, data_type, window_ms, start, end))
+
+
+# Versions join utils.cache's stale set, which is deleted from the shared cache on commit
+@event.listens_for(db.session, 'after_flush')
+def _collect_vitals_changes(session, flush_context):
+    members = {(obj.user_id, obj.family_member_id)
+               for obj in set(session.new) | set(session.dirty) | set(session.deleted)
+               if isinstance(obj, HealthData)}
+    if members:
+        session.info.setdefault('stale_cache_keys', set()).update(
+            analytics_version_key(user_id, family_member_id) for user_id, family_member_id in members)
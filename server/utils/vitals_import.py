@@ -0,0 +1,391 @@
+import csv
+import io
+import os
+import threading
+import xml.sax
+import zipfile
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from sqlalchemy import insert, text
+from models import db, HealthData, ImportJob
+from utils import vitals_analytics
+from utils.change_log import record_changes, UPSERT
+from utils.retention import vitals_cli
+from utils.sharding import shard_router
+
+APPLE_HEALTH = 'apple_health'
+CSV = 'csv'
+
+# Apple Health record type -> data_type
+APPLE_HEALTH_TYPES = {
+    'HKQuantityTypeIdentifierHeartRate': 'HEART_RATE',
+    'HKQuantityTypeIdentifierStepCount': 'STEPS',
+    'HKQuantityTypeIdentifierOxygenSaturation': 'BLOOD_OXYGEN',
+    'HKQuantityTypeIdentifierBloodPressureSystolic': 'BLOOD_PRESSURE_SYSTOLIC',
+    'HKQuantityTypeIdentifierBloodPressureDiastolic': 'BLOOD_PRESSURE_DIASTOLIC',
+    'HKQuantityTypeIdentifierBloodGlucose': 'BLOOD_GLUCOSE',
+    'HKQuantityTypeIdentifierBodyMass': 'WEIGHT',
+    'HKQuantityTypeIdentifierHeight': 'HEIGHT',
+    'HKQuantityTypeIdentifierBodyMassIndex': 'BODY_MASS_INDEX',
+    'HKQuantityTypeIdentifierBodyTemperature': 'BODY_TEMPERATURE',
+    'HKQuantityTypeIdentifierActiveEnergyBurned': 'ACTIVE_ENERGY_BURNED',
+    'HKQuantityTypeIdentifierDistanceWalkingRunning': 'DISTANCE_WALKING_RUNNING',
+    'HKQuantityTypeIdentifierDietaryWater': 'WATER',
+}
+
+
+def _same(value):
+    return value
+
+
+def _percent(value):
+    # SpO2 arrives as a 0-1 fraction from HealthKit and some Health Connect exports
+    return value * 100 if value <= 1 else value
+
+
+# data_type -> (stored unit, {source unit: converter to the stored unit}); Apple Health
+# and Health Connect unit names both appear. Samples in any other unit are skipped.
+UNITS = {
+    'HEART_RATE': ('bpm', {'bpm': _same, 'count/min': _same, 'beats/min': _same}),
+    'STEPS': ('count', {'count': _same, 'steps': _same}),
+    'BLOOD_OXYGEN': ('%', {'%': _percent, 'percent': _percent}),
+    'BLOOD_PRESSURE_SYSTOLIC': ('mmHg', {'mmHg': _same, 'mmhg': _same}),
+    'BLOOD_PRESSURE_DIASTOLIC': ('mmHg', {'mmHg': _same, 'mmhg': _same}),
+    'BLOOD_GLUCOSE': ('mg/dL', {'mg/dL': _same, 'mmol<180.1558800000541>/L': lambda v: v * 18.0156,
+                                'mmol/L': lambda v: v * 18.0156}),
+    'WEIGHT': ('kg', {'kg': _same, 'lb': lambda v: v * 0.45359237, 'lbs': lambda v: v * 0.45359237,
+                      'g': lambda v: v / 1000}),
+    'HEIGHT': ('m', {'m': _same, 'cm': lambda v: v / 100, 'ft': lambda v: v * 0.3048, 'in': lambda v: v * 0.0254}),
+    'BODY_MASS_INDEX': ('count', {'count': _same, 'kg/m2': _same, 'kg/m^2': _same}),
+    'BODY_TEMPERATURE': ('degC', {'degC': _same, 'C': _same, 'celsius': _same,
+                                  'degF': lambda v: (v - 32) * 5 / 9, 'F': lambda v: (v - 32) * 5 / 9,
+                                  'fahrenheit': lambda v: (v - 32) * 5 / 9}),
+    'ACTIVE_ENERGY_BURNED': ('kcal', {'kcal': _same, 'Cal': _same, 'kJ': lambda v: v / 4.184}),
+    'DISTANCE_WALKING_RUNNING': ('m', {'m': _same, 'km': lambda v: v * 1000, 'mi': lambda v: v * 1609.344}),
+    'WATER': ('L', {'L': _same, 'mL': lambda v: v / 1000, 'fl_oz_us': lambda v: v * 0.0295735}),
+}
+
+
+def normalize(data_type, value, unit):
+    """
+    Convert a sample to its type's stored unit
+
+    A missing unit is taken to be the stored one. Returns (value, stored unit),
+    or None when the unit is not one the type can be converted from.
+    """
+    stored_unit, converters = UNITS[data_type]
+    converter = converters.get(unit or stored_unit)
+    if converter is None:
+        return None
+    return converter(value), stored_unit
+
+
+# Health Connect record names accepted in CSV files, besides our own data_type names
+HEALTH_CONNECT_TYPES = {
+    'HeartRate': 'HEART_RATE',
+    'Steps': 'STEPS',
+    'OxygenSaturation': 'BLOOD_OXYGEN',
+    'BloodPressureSystolic': 'BLOOD_PRESSURE_SYSTOLIC',
+    'BloodPressureDiastolic': 'BLOOD_PRESSURE_DIASTOLIC',
+    'BloodGlucose': 'BLOOD_GLUCOSE',
+    'Weight': 'WEIGHT',
+    'Height': 'HEIGHT',
+    'BodyTemperature': 'BODY_TEMPERATURE',
+    'ActiveCaloriesBurned': 'ACTIVE_ENERGY_BURNED',
+    'Distance': 'DISTANCE_WALKING_RUNNING',
+    'Hydration': 'WATER',
+}
+KNOWN_DATA_TYPES = set(UNITS)
+
+# COPY cannot return the ids it assigns, so they are drawn from the sequence first
+ID_SEQUENCE = 'health_data_id_seq'
+COPY_COLUMNS = ('id', 'user_id', 'family_member_id', 'data_type', 'value', 'unit', 'timestamp', 'source', 'created_at')
+
+
+def detect_format(filename):
+    """Guess the export format from the uploaded file name"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.xml', '.zip'):
+        return APPLE_HEALTH
+    if extension == '.csv':
+        return CSV
+    return None
+
+
+def _parse_timestamp(value):
+    """Parse an export timestamp into a naive UTC datetime"""
+    value = value.strip()
+    try:
+        # Apple Health: "2023-04-01 08:30:00 +0200"
+        parsed = datetime.strptime(value, '%Y-%m-%d %H:%M:%S %z')
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class _CountingReader(io.RawIOBase):
+    """Readable wrapper that counts consumed bytes for progress reporting"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.bytes_read += size
+        return size
+
+
+class _AppleHealthHandler(xml.sax.ContentHandler):
+    """SAX handler emitting one record per <Record> element, nothing is kept in memory"""
+
+    def __init__(self, emit):
+        super().__init__()
+        self.emit = emit
+
+    def startElement(self, name, attrs):
+        if name != 'Record':
+            return
+        data_type = APPLE_HEALTH_TYPES.get(attrs.get('type'))
+        if data_type is None:
+            self.emit(None)
+            return
+        try:
+            sample = normalize(data_type, float(attrs.get('value')), attrs.get('unit'))
+            timestamp = _parse_timestamp(attrs.get('startDate'))
+        except (TypeError, ValueError):
+            self.emit(None)
+            return
+        if sample is None:
+            self.emit(None)
+            return
+        self.emit((data_type, sample[0], sample[1], timestamp, attrs.get('sourceName')))
+
+
+class VitalsImporter:
+    """
+    Incremental importer for historical health exports
+
+    Files are parsed as a stream (SAX for Apple Health XML, row by row for CSV)
+    and written in batches of IMPORT_BATCH_SIZE rows with COPY on PostgreSQL or
+    executemany elsewhere, so memory use does not depend on the file size.
+    Bulk inserts skip the session events that feed /sync and live streams, so
+    each batch writes its change log entries itself, committed with the batch
+    by the same session.commit(). With sharding the batch is on the household's
+    shard and the log on the primary, which commit one after the other, so a
+    crash between the two can leave imported rows without log entries.
+    Each committed batch also bumps the job's updated_at, which is how
+    fail_stale_jobs() tells a running import from one whose worker died.
+    """
+
+    def __init__(self, user_id, family_member_id=None, job=None, on_progress=None):
+        self.user_id = user_id
+        self.family_member_id = family_member_id or None
+        self.job = job
+        self.on_progress = on_progress
+        self.batch_size = current_app.config['IMPORT_BATCH_SIZE']
+        self.batch = []
+        self.imported = 0
+        self.skipped = 0
+        self.reader = None
+        self.imported_at = datetime.utcnow()
+
+    def run(self, fileobj, source_format, bytes_total=None):
+        """Import everything in fileobj, returning (imported, skipped)"""
+        # Runs outside requests too, so pick the household's shard explicitly
+        with shard_router.use(self.user_id):
+            return self._run(fileobj, source_format, bytes_total)
+
+    def _run(self, fileobj, source_format, bytes_total):
+        self.reader = _CountingReader(fileobj)
+        if self.job is not None:
+            self.job.status = 'running'
+            self.job.bytes_total = bytes_total
+            db.session.commit()
+
+        if source_format == APPLE_HEALTH:
+            xml.sax.parse(io.BufferedReader(self.reader), _AppleHealthHandler(self._add))
+        elif source_format == CSV:
+            self._parse_csv(io.TextIOWrapper(io.BufferedReader(self.reader), encoding='utf-8-sig', newline=''))
+        else:
+            raise ValueError(f'Unsupported import format: {source_format}')
+        self._flush()
+
+        vitals_analytics.cache.invalidate_member(self.user_id, self.family_member_id)
+        if self.job is not None:
+            self.job.status = 'completed'
+            db.session.commit()
+        return self.imported, self.skipped
+
+    def _parse_csv(self, text):
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Extra unnamed columns land under a None key and are ignored
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key is not None}
+            raw_type = row.get('data_type') or row.get('type') or ''
+            data_type = HEALTH_CONNECT_TYPES.get(raw_type, raw_type.upper())
+            if data_type not in KNOWN_DATA_TYPES:
+                self._add(None)
+                continue
+            try:
+                sample = normalize(data_type, float(row['value']), row.get('unit') or None)
+                timestamp = _parse_timestamp(row.get('timestamp') or row.get('start_time') or '')
+            except (KeyError, ValueError):
+                self._add(None)
+                continue
+            if sample is None:
+                self._add(None)
+                continue
+            self._add((data_type, sample[0], sample[1], timestamp, row.get('source') or None))
+
+    def _add(self, record):
+        if record is None:
+            self.skipped += 1
+            return
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self.batch:
+            if db.session.get_bind(HealthData).dialect.name == 'postgresql':
+                ids = self._copy_batch()
+            else:
+                ids = db.session.execute(insert(HealthData).returning(HealthData.id), [{
+                    'user_id': self.user_id,
+                    'family_member_id': self.family_member_id,
+                    'data_type': data_type,
+                    'value': value,
+                    'unit': unit,
+                    'timestamp': timestamp,
+                    'source': source,
+                    'created_at': self.imported_at
+                } for data_type, value, unit, timestamp, source in self.batch]).scalars().all()
+            record_changes(db.session.connection(),
+                           [(self.user_id, 'health_data', row_id, UPSERT) for row_id in ids])
+            self.imported += len(self.batch)
+            self.batch = []
+
+        if self.job is not None:
+            self.job.bytes_read = self.reader.bytes_read
+            self.job.records_imported = self.imported
+            self.job.records_skipped = self.skipped
+        db.session.commit()
+        if self.on_progress is not None:
+            self.on_progress(self.reader.bytes_read, self.imported, self.skipped)
+
+    def _copy_batch(self):
+        """Stream the batch through COPY ... FROM STDIN, returning the new row ids"""
+        connection = db.session.connection(bind_arguments={'mapper': HealthData})
+        ids = connection.execute(
+            text(f"SELECT nextval('{ID_SEQUENCE}') FROM generate_series(1, :count)"), {'count': len(self.batch)}
+        ).scalars().all()
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row_id, (data_type, value, unit, timestamp, source) in zip(ids, self.batch):
+            writer.writerow((row_id, self.user_id, self.family_member_id, data_type, value, unit,
+                             timestamp.isoformat(sep=' '), source, self.imported_at.isoformat(sep=' ')))
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY health_data ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        return ids
+
+
+def open_export(path, source_format):
+    """Open an export file for streaming, reaching into Apple Health's export.zip if needed"""
+    if source_format == APPLE_HEALTH and zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        member = next((name for name in archive.namelist() if name.endswith('/export.xml') or name == 'export.xml'), None)
+        if member is None:
+            archive.close()
+            raise ValueError('export.xml not found in archive')
+        return archive.open(member), archive.getinfo(member).file_size
+    return open(path, 'rb'), os.path.getsize(path)
+
+
+def run_import_job(app, job_id, path):
+    """Run an ImportJob to completion on a background thread, then remove its upload"""
+    with app.app_context():
+        job = ImportJob.query.get(job_id)
+        try:
+            fileobj, size = open_export(path, job.source_format)
+            with fileobj:
+                VitalsImporter(job.user_id, job.family_member_id, job=job).run(fileobj, job.source_format, size)
+        except Exception as e:
+            current_app.logger.error(f"Import job {job_id} failed: {e}")
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+            db.session.commit()
+        finally:
+            os.remove(path)
+
+
+def fail_stale_jobs(**filters):
+    """
+    Fail unfinished jobs whose worker stopped updating them, e.g. after a restart
+
+    A job is stale once its updated_at is IMPORT_STALE_AFTER seconds old. Returns
+    the number of jobs failed.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['IMPORT_STALE_AFTER'])
+    jobs = ImportJob.query.filter_by(**filters).filter(
+        ImportJob.status.in_(('pending', 'running')),
+        ImportJob.updated_at < cutoff
+    ).all()
+    for job in jobs:
+        job.status = 'failed'
+        job.error = 'Import stopped without finishing'
+    if jobs:
+        db.session.commit()
+    return len(jobs)
+
+
+def start_import_job(job, path):
+    app = current_app._get_current_object()
+    thread = threading.Thread(target=run_import_job, args=(app, job.id, path), daemon=True)
+    thread.start()
+    return thread
+
+
+@vitals_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True)
+@click.option('--family-member-id', type=int, default=None, help='Omit to import into the user\'s own profile.')
+@click.option('--format', 'source_format', type=click.Choice([APPLE_HEALTH, CSV]), default=None)
+def import_command(path, user_id, family_member_id, source_format):
+    """Import an Apple Health export or vitals CSV from PATH."""
+    source_format = source_format or detect_format(path)
+    if source_format is None:
+        raise click.UsageError('Cannot detect the file format, pass --format')
+
+    fileobj, size = open_export(path, source_format)
+
+    def report(bytes_read, imported, skipped):
+        percent = f'{bytes_read * 100 // size}%' if size else f'{bytes_read} bytes'
+        click.echo(f'{percent}: {imported} imported, {skipped} skipped')
+
+    with fileobj:
+        imported, skipped = VitalsImporter(user_id, family_member_id, on_progress=report).run(
+            fileobj, source_format, size
+        )
+    click.echo(f'Done: {imported} imported, {skipped} skipped')
+
+
+@vitals_cli.command('reap-imports')
+def reap_imports_command():
+    """Fail imports left pending or running by a worker that died."""
+    click.echo(f'Failed {fail_stale_jobs()} stale import(s)')
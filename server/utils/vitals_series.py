@@ -0,0 +1,151 @@
+import struct
+from sqlalchemy import select
+from models import db, HealthData
+from utils.retention import VitalsArchiver
+from utils.sharding import shard_router
+from utils.lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+try:
+    import msgpack
+except ImportError:  # MessagePack output is optional
+    msgpack = None
+
+# Binary series layout (little-endian):
+#   header  magic 'HVS1', uint8 version, uint8 value width (4|8), uint8 delta width (2|4|8),
+#           1 pad byte, uint32 count, int64 first timestamp (ms since epoch, UTC)
+#   deltas  (count - 1) unsigned ints of `delta width` bytes, ms between consecutive samples
+#   values  count floats of `value width` bytes
+BINARY_MAGIC = b'HVS1'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sBBBxIq')
+
+BINARY_MIMETYPE = 'application/octet-stream'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+_DELTA_DTYPES = ((2, '<u2'), (4, '<u4'), (8, '<u8'))
+
+
+class VitalsSeries:
+    """Columnar loading and compact encoding of HealthData series"""
+
+    @staticmethod
+    def member_filter(user_id, family_member_id, columns=None):
+        """
+        Build the WHERE clause selecting one household member's vitals
+
+        Args:
+            user_id: ID of the account owner
+            family_member_id: FamilyMember ID, or 0 for the owner's own profile
+            columns: Column collection to filter on (defaults to the health_data table)
+        """
+        columns = columns if columns is not None else HealthData.__table__.c
+        member_id = family_member_id or None
+        if member_id is None:
+            return (columns.user_id == user_id) & columns.family_member_id.is_(None)
+        return (columns.user_id == user_id) & (columns.family_member_id == member_id)
+
+    @staticmethod
+    def load(user_id, family_member_id, data_type, start=None, end=None):
+        """
+        Load a vitals series as NumPy arrays, oldest first
+
+        Only the two needed columns are selected and rows stay plain tuples,
+        so no ORM objects or per-row dicts are created. On PostgreSQL the timestamp
+        bounds let the planner skip partitions outside the range, and months
+        already moved to cold storage are read back from their archive files when
+        the range reaches past the retention horizon.
+
+        Returns:
+            Tuple of (timestamps as int64 ms since epoch, values as float64)
+        """
+        with shard_router.use(user_id):
+            return VitalsSeries._load(user_id, family_member_id, data_type, start, end)
+
+    @staticmethod
+    def _load(user_id, family_member_id, data_type, start, end):
+        columns = HealthData.__table__.c
+        stmt = select(columns.timestamp, columns.value).where(
+            VitalsSeries.member_filter(user_id, family_member_id, columns),
+            columns.data_type == data_type
+        )
+        if start is not None:
+            stmt = stmt.where(columns.timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(columns.timestamp < end)
+        stmt = stmt.order_by(columns.timestamp, columns.id)
+
+        rows = db.session.execute(stmt).all()
+        count = len(rows)
+        timestamps = np.array([row[0] for row in rows], dtype='datetime64[ms]').astype(np.int64)
+        values = np.fromiter((row[1] for row in rows), dtype=np.float64, count=count)
+
+        if start is None or start < VitalsArchiver.cutoff():
+            archived_timestamps, archived_values = VitalsArchiver.load_archived(
+                user_id, family_member_id, data_type, start, end
+            )
+            if len(archived_values):
+                timestamps = np.concatenate((archived_timestamps, timestamps))
+                values = np.concatenate((archived_values, values))
+                order = np.argsort(timestamps, kind='stable')
+                timestamps, values = timestamps[order], values[order]
+
+        return timestamps, values
+
+    @staticmethod
+    def unit_for(user_id, family_member_id, data_type):
+        """Return the unit recorded for a series, or None"""
+        with shard_router.use(user_id):
+            return db.session.execute(
+                select(HealthData.unit).where(
+                    VitalsSeries.member_filter(user_id, family_member_id),
+                    HealthData.data_type == data_type,
+                    HealthData.unit.is_not(None)
+                ).limit(1)
+            ).scalar()
+
+    @staticmethod
+    def _delta_encode(timestamps):
+        """Return (first timestamp, delta width, packed deltas bytes)"""
+        if len(timestamps) == 0:
+            return 0, 2, b''
+        deltas = np.diff(timestamps)
+        largest = int(deltas.max()) if len(deltas) else 0
+        for width, dtype in _DELTA_DTYPES:
+            if largest < 1 << (8 * width):
+                return int(timestamps[0]), width, deltas.astype(dtype).tobytes()
+        raise ValueError('Timestamp delta out of range')
+
+    @staticmethod
+    def pack_binary(timestamps, values, value_width=4):
+        """
+        Encode a series in the compact binary layout described above
+
+        Args:
+            timestamps: int64 array of ms since epoch, sorted ascending
+            values: float array of the same length
+            value_width: 4 for float32 values, 8 for float64
+        """
+        first, delta_width, deltas = VitalsSeries._delta_encode(timestamps)
+        value_dtype = np.dtype('<f4') if value_width == 4 else np.dtype('<f8')
+        header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, value_dtype.itemsize,
+                                    delta_width, len(values), first)
+        return b''.join((header, deltas, values.astype(value_dtype).tobytes()))
+
+    @staticmethod
+    def pack_msgpack(timestamps, values, value_width=4, **metadata):
+        """Encode a series as a MessagePack map carrying the packed columns as raw bytes"""
+        if msgpack is None:
+            raise RuntimeError('msgpack is not installed')
+        first, delta_width, deltas = VitalsSeries._delta_encode(timestamps)
+        value_dtype = np.dtype('<f4') if value_width == 4 else np.dtype('<f8')
+        return msgpack.packb({
+            **metadata,
+            'count': len(values),
+            'start': first,
+            'delta_width': delta_width,
+            'deltas': deltas,
+            'value_width': value_dtype.itemsize,
+            'values': values.astype(value_dtype).tobytes()
+        }, use_bin_type=True)
@@ -0,0 +1,213 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import event, select, or_
+from models import db, HealthData, ChangeLogEntry
+from utils.change_log import UPSERT
+from utils.sharding import shard_router
+
+# Unseen change_log ids below the highest one seen may belong to transactions
+# that have not committed yet; they are looked for again for this long
+GAP_TIMEOUT = 10
+
+
+def _event_payload(data):
+    return {
+        'id': data.id,
+        'family_member_id': data.family_member_id,
+        'data_type': data.data_type,
+        'value': data.value,
+        'unit': data.unit,
+        'timestamp': data.timestamp.isoformat(),
+        'source': data.source
+    }
+
+
+def format_event(seq, payload):
+    """Serialize one vitals sample as a server-sent event"""
+    return f'id: {seq}\nevent: vital\ndata: {json.dumps(payload)}\n\n'
+
+
+def format_resync(seq):
+    """Tell the client its replay was cut short; it reconnects at once with Last-Event-ID seq for the rest"""
+    return f'id: {seq}\nevent: resync\nretry: 0\ndata: {json.dumps({"last_event_id": seq})}\n\n'
+
+
+class _Subscriber:
+    __slots__ = ('key', 'queue', 'dropped')
+
+    def __init__(self, key, size):
+        self.key = key
+        self.queue = queue.Queue(maxsize=size)
+        self.dropped = False
+
+
+class VitalsHub:
+    """
+    Per-process fan-out of newly stored vitals to open event streams
+
+    One background poller per process reads new health_data entries from the
+    change log and hands each one to the queues of the streams watching that
+    member, so the database sees one query per poll interval however many
+    clients are connected, and samples written by other workers arrive too.
+    A local commit wakes the poller early. The poller only runs while someone
+    is subscribed. Uses threads, so under gunicorn's gevent worker every
+    stream is a greenlet and thousands of idle ones cost little.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._gaps = {}
+
+    def subscribe(self, user_id, family_member_id):
+        app = current_app._get_current_object()
+        subscriber = _Subscriber((user_id, family_member_id or None), app.config['VITALS_STREAM_QUEUE_SIZE'])
+        with self._lock:
+            self._subscribers[subscriber.key].add(subscriber)
+            if self._thread is None:
+                # Start from the head as of now so nothing committed before the first poll is missed
+                self._last_id = db.session.execute(select(db.func.max(ChangeLogEntry.id))).scalar() or 0
+                self._gaps = {}
+                self._thread = threading.Thread(target=self._run, args=(app,), daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.key]
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self, app):
+        with app.app_context():
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        # Start from the head again next time instead of replaying the idle period
+                        self._last_id = None
+                        return
+                try:
+                    self._poll()
+                except Exception as e:
+                    current_app.logger.error(f"Vitals stream poll failed: {e}")
+                finally:
+                    db.session.remove()
+                self._wake.wait(current_app.config['VITALS_STREAM_POLL_INTERVAL'])
+                self._wake.clear()
+
+    def _poll(self):
+        if self._last_id is None:
+            self._last_id = db.session.execute(select(db.func.max(ChangeLogEntry.id))).scalar() or 0
+            return
+
+        now = time.monotonic()
+        self._gaps = {entry_id: seen for entry_id, seen in self._gaps.items() if now - seen < GAP_TIMEOUT}
+        condition = ChangeLogEntry.id > self._last_id
+        if self._gaps:
+            condition = or_(condition, ChangeLogEntry.id.in_(list(self._gaps)))
+        entries = db.session.execute(
+            select(ChangeLogEntry.id, ChangeLogEntry.user_id, ChangeLogEntry.seq,
+                   ChangeLogEntry.entity, ChangeLogEntry.entity_id, ChangeLogEntry.operation)
+            .where(condition)
+            .order_by(ChangeLogEntry.id)
+        ).all()
+        if not entries:
+            return
+
+        highest = max(entry.id for entry in entries)
+        found = {entry.id for entry in entries}
+        for entry_id in range(self._last_id + 1, highest):
+            if entry_id not in found:
+                self._gaps.setdefault(entry_id, now)
+        for entry_id in found:
+            self._gaps.pop(entry_id, None)
+        self._last_id = max(self._last_id, highest)
+
+        vitals = [entry for entry in entries if entry.entity == 'health_data' and entry.operation == UPSERT]
+        with self._lock:
+            watched = set(self._subscribers)
+        vitals = [entry for entry in vitals if any(key[0] == entry.user_id for key in watched)]
+        if not vitals:
+            return
+
+        # One query per household, as households may live on different shards
+        rows = {}
+        by_user = defaultdict(list)
+        for entry in vitals:
+            by_user[entry.user_id].append(entry.entity_id)
+        for user_id, ids in by_user.items():
+            with shard_router.use(user_id):
+                rows.update((data.id, data) for data in HealthData.query.filter(HealthData.id.in_(ids)).all())
+        for entry in vitals:
+            data = rows.get(entry.entity_id)
+            if data is not None:
+                self._publish((entry.user_id, data.family_member_id), entry.seq, _event_payload(data))
+
+    def _publish(self, key, seq, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait((seq, payload))
+            except queue.Full:
+                # A stream this far behind is closed; the client resumes from Last-Event-ID
+                subscriber.dropped = True
+                self.unsubscribe(subscriber)
+
+
+hub = VitalsHub()
+
+
+def missed_events(user_id, family_member_id, last_seq, limit):
+    """
+    Vitals stored for a member after change log position last_seq, oldest first
+
+    Returns (events, more): at most limit events, and whether further ones were
+    left out and must be fetched from the last returned seq.
+    """
+    member = HealthData.family_member_id.is_(None) if not family_member_id \
+        else HealthData.family_member_id == family_member_id
+    # The change log is on the primary and health_data may be on a shard, so no join
+    events = []
+    while len(events) <= limit:
+        entries = db.session.execute(
+            select(ChangeLogEntry.seq, ChangeLogEntry.entity_id)
+            .where(ChangeLogEntry.user_id == user_id, ChangeLogEntry.seq > last_seq,
+                   ChangeLogEntry.entity == 'health_data', ChangeLogEntry.operation == UPSERT)
+            .order_by(ChangeLogEntry.seq)
+            .limit(limit + 1)
+        ).all()
+        if not entries:
+            break
+        with shard_router.use(user_id):
+            rows = {data.id: data for data in HealthData.query.filter(
+                HealthData.id.in_([entity_id for _, entity_id in entries]), member
+            ).all()}
+        events.extend((seq, _event_payload(rows[entity_id])) for seq, entity_id in entries if entity_id in rows)
+        last_seq = entries[-1][0]
+    return events[:limit], len(events) > limit
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_new_vitals(session, flush_context):
+    if any(isinstance(obj, HealthData) for obj in session.new):
+        session.info['vitals_stream_wake'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_hub(session):
+    if session.info.pop('vitals_stream_wake', False):
+        hub.wake()